@@ -13,6 +13,7 @@ class Blog(models.Model):
     image = models.ImageField(upload_to='blog/images', default='')
     date = models.DateField(default=timezone.now)
     category = models.CharField(max_length=20, default='Technology')
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.title
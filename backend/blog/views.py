@@ -7,6 +7,7 @@ from .serializers import BlogSerializer
 from rest_framework.views import APIView
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
+from shop.conditional import RowConditionalGetMixin
 
 # Create your views here.
 
@@ -29,7 +30,8 @@ class blogPost(APIView):
         
         return Response({"message": "No valid token provided."}, status=401)
 
-class blogView(generics.ListAPIView):
+class blogView(RowConditionalGetMixin, generics.ListAPIView):
+    conditional_queryset = Blog.objects.all()
     serializer_class = BlogSerializer
 
     def get_queryset(self):
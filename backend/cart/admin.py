@@ -1,6 +1,6 @@
 # admin.py (Django example)
 from django.contrib import admin
-from .models import OrderItem, Order, Delivery,Cart,Coupon
+from .models import OrderItem, Order, Delivery,Cart,Coupon,CouponRedemption
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -13,7 +13,17 @@ class DeliveryItemInline(admin.TabularInline):
 class OrderAdmin(admin.ModelAdmin):
     inlines = [OrderItemInline,DeliveryItemInline]
 
+class CouponRedemptionInline(admin.TabularInline):
+    model = CouponRedemption
+    extra = 0
+    raw_id_fields = ['user']
+
+class CouponAdmin(admin.ModelAdmin):
+    list_display = ['code', 'amount', 'percentage', 'active', 'expiry_date', 'used_count', 'usage_limit']
+    search_fields = ['code']
+    inlines = [CouponRedemptionInline]
+
 admin.site.register(Order, OrderAdmin)
 admin.site.register(Cart)
-admin.site.register(Coupon)
+admin.site.register(Coupon, CouponAdmin)
 admin.site.register(Delivery)
\ No newline at end of file
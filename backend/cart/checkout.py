@@ -0,0 +1,102 @@
+"""
+Checkout: turning the posted cart lines into an order.
+
+Products, colors and sizes of all the lines are resolved with one query
+each and the order items are written with a single bulk_create, so placing
+an order costs the same number of queries whatever the size of the cart.
+place_order runs in one transaction: a bad line or bad delivery details
+leave nothing behind. The stock of the lines is reserved in the same
+transaction (shop.inventory), so an order is only placed if every line is
+in stock.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from shop.inventory import check, requirements, reserve
+from shop.models import Color, Product, Size
+from .models import Cart, Order, OrderItem
+from .serializers import DeliverySerializer
+
+
+class CheckoutError(Exception):
+    pass
+
+
+def first_by_name(queryset):
+    """{(product_id, name): row} of queryset, the lowest pk winning among duplicates."""
+    rows = {}
+    for row in queryset.order_by('pk'):
+        rows.setdefault((row.product_id, row.name), row)
+    return rows
+
+
+def order_lines(order, items):
+    """Unsaved OrderItems of order for the cart lines items, raising CheckoutError for an unknown product."""
+    products = Product.objects.in_bulk({item.get('product_id') for item in items if item.get('product_id')})
+    if any(item.get('product_id') not in products for item in items):
+        raise CheckoutError('Product not found')
+    colors = first_by_name(Color.objects.filter(
+        product__in=products, name__in={item['color'] for item in items if item.get('color')},
+    ))
+    sizes = first_by_name(Size.objects.filter(
+        product__in=products, name__in={item['size'] for item in items if item.get('size')},
+    ))
+    return [
+        OrderItem(
+            order=order,
+            product=products[item['product_id']],
+            color=colors.get((item['product_id'], item.get('color'))),
+            size=sizes.get((item['product_id'], item.get('size'))),
+            quantity=item.get('quantity', 1),
+            price=item.get('price', 0),
+        )
+        for item in items
+    ]
+
+
+def reservation_expiry(payment_method):
+    """
+    How long the stock of an order paid with payment_method is held: cash
+    on delivery is paid on dispatch, other payments must arrive in time.
+    """
+    if payment_method == 'COD':
+        return None
+    return timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+
+
+def place_order(user, items, delivery_data):
+    """
+    Create the order with its items and delivery details, reserve their
+    stock and empty the user's cart. Raises CheckoutError, OutOfStock or a
+    serializer ValidationError, in which case nothing is written.
+    """
+    order = Order(user=user, status='Placed')
+    lines = order_lines(order, items)
+    wanted = requirements(lines)
+    # Sold out lines fail here, before the transaction: it takes the write lock from the start on SQLite
+    check(wanted)
+    with transaction.atomic():
+        order.save()
+        OrderItem.objects.bulk_create(lines)
+        delivery_serializer = DeliverySerializer(data=dict(delivery_data, order=order.id))
+        delivery_serializer.is_valid(raise_exception=True)
+        delivery_serializer.save(order=order)
+        if user:
+            Cart.objects.filter(user=user).delete()
+        # Last, so the stock rows stay locked only until the commit
+        reserve(order, wanted, reservation_expiry(delivery_data.get('payment_method')))
+    return order
+
+
+def submit_order(order, payment_method):
+    """
+    Reserve the stock of the items of an unplaced order and mark it Placed.
+    Raises OutOfStock, in which case nothing is written.
+    """
+    wanted = requirements(order.order_items.select_related('product'))
+    check(wanted)
+    with transaction.atomic():
+        order.status = 'Placed'
+        order.save()
+        reserve(order, wanted, reservation_expiry(payment_method))
+    return order
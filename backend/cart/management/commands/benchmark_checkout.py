@@ -0,0 +1,74 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from cart.views import CheckoutAPIView
+from shop.models import Brand, Category, Color, Product, Size, SizeColorStock
+
+
+class Rollback(Exception):
+    pass
+
+
+def cart_lines(products, count):
+    return [
+        {'product_id': product.pk, 'color': 'Red', 'size': 'M', 'quantity': 1 + i % 3, 'price': product.price}
+        for i, product in enumerate(products[:count])
+    ]
+
+
+class Command(BaseCommand):
+    help = "Measure the queries and time of a guest checkout for carts of several sizes (nothing is kept)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 100], help="Cart sizes to measure")
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['lines'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write(self.style.SUCCESS("Done"))
+
+    def run(self, sizes, repeat):
+        brand = Brand.objects.create(name='Benchmark')
+        category = Category.objects.create(name='Benchmark')
+        products = [
+            Product.objects.create(name=f"Benchmark product {i}", brand=brand, category=category, price=1000 + i, description='-')
+            for i in range(max(sizes))
+        ]
+        Color.objects.bulk_create(Color(product=product, name=name) for product in products for name in ('Red', 'Blue'))
+        Size.objects.bulk_create(Size(product=product, name=name) for product in products for name in ('S', 'M', 'L'))
+        SizeColorStock.objects.bulk_create(
+            SizeColorStock(product=product, size=size, color=color, stock=10 ** 6)
+            for product in products
+            for size in product.sizes.all()
+            for color in product.colors.all()
+        )
+
+        view = CheckoutAPIView.as_view()
+        factory = APIRequestFactory()
+        for size in sizes:
+            payload = {
+                'cartItems': cart_lines(products, size),
+                'firstName': 'Bench', 'lastName': 'Mark', 'phoneNumber': '9800000000',
+                'shippingAddress': 'Somewhere', 'subtotal': 1000, 'shippingCost': 100,
+            }
+            timings = []
+            for _ in range(repeat):
+                request = factory.post('/cart/api/checkout/', payload, format='json')
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = view(request)
+                    timings.append(time.perf_counter() - started)
+                if response.status_code != 201:
+                    raise RuntimeError(f"Checkout failed: {response.status_code} {response.data}")
+            self.stdout.write(
+                f"{size:>4} lines: {len(queries.captured_queries):>3} queries, "
+                f"median {statistics.median(timings) * 1000:.1f}ms, max {max(timings) * 1000:.1f}ms"
+            )
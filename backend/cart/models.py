@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
 import uuid
 from django.utils import timezone
@@ -14,8 +14,33 @@ class Order(models.Model):
     status = models.CharField(max_length=10,choices=STATUS_CHOICES,default="Unplaced")
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(default=timezone.now)
+    # Set by save() when the status becomes Cancelled; the sales jobs count the order until then
+    cancelled_at = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
     carts = models.ManyToManyField('Cart', related_name='order', blank=True)
 
+    @staticmethod
+    def counted_at(moment, prefix=''):
+        """
+        Q of the orders that count as sales as of moment: placed by then and
+        not cancelled by then. prefix reaches the order from another model
+        (e.g. 'order__' from OrderItem).
+        """
+        field = lambda name: f"{prefix}{name}"
+        not_cancelled = (
+            models.Q(**{field('cancelled_at__gt'): moment})
+            | models.Q(**{field('cancelled_at__isnull'): True}) & ~models.Q(**{field('status'): 'Cancelled'})
+        )
+        return models.Q(**{field('created_at__lte'): moment}) & not_cancelled
+
+    def save(self, *args, **kwargs):
+        if self.status == 'Cancelled':
+            self.cancelled_at = self.cancelled_at or timezone.now()
+        else:
+            self.cancelled_at = None
+        if kwargs.get('update_fields') is not None and 'status' in kwargs['update_fields']:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'cancelled_at'}
+        super().save(*args, **kwargs)
+
     def order_items_str(self):
         items_list= '\n'.join([str(order_item) for order_item in self.order_items.all()])
         return f"\n{items_list}"
@@ -62,6 +87,8 @@ class Cart(models.Model):
     size = models.ForeignKey('shop.Size', related_name='cart', on_delete=models.CASCADE, null=True, blank=True)
     quantity = models.PositiveIntegerField(default=1)  # Default to 1, but can be adjusted
     price = models.PositiveIntegerField(default=0)
+    # When the item was first added, read by the trending ranking
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
 
     def __str__(self):
         return f"{self.quantity} x {self.product}"
@@ -71,7 +98,7 @@ class Cart(models.Model):
 
 
 class Coupon(models.Model):
-    code = models.CharField(max_length=10)
+    code = models.CharField(max_length=10, unique=True)
     amount = models.FloatField(default=0,null=True,blank=True)
     percentage = models.IntegerField(default=0,null=True,blank=True)
     active = models.BooleanField(default=True)
@@ -80,30 +107,63 @@ class Coupon(models.Model):
     used_count = models.PositiveIntegerField(default=0)
     def __str__(self):
         return f"{self.code}"
-    
+
+    @classmethod
+    def redeemable(cls):
+        """Coupons that can still be redeemed: active, not expired, uses left."""
+        return cls.objects.filter(active=True, used_count__lt=models.F('usage_limit')).filter(
+            models.Q(expiry_date__isnull=True) | models.Q(expiry_date__gte=timezone.now().date())
+        )
+
     def is_valid(self):
-        # Ensure the coupon is not expired
-        if self.expiry_date < timezone.now().date():
+        # Ensure the coupon is active and not expired
+        if not self.active or (self.expiry_date and self.expiry_date < timezone.now().date()):
             return False
         
         # Ensure the coupon hasn't been used up
         if self.used_count >= self.usage_limit:
             return False
 
-        # If user-specific, ensure it belongs to the user
-        # if self.user_specific and user:
-        #     if not self.applies_to_user(user):
-        #         return False
-        
         return True
 
-    def applies_to_user(self, user):
-        # Logic to check if the coupon applies to a user (e.g., check user ID)
-        return True  # You can customize this as needed
+    def unavailable_reason(self, user):
+        """Why user can't redeem the coupon, None if they can (a read, it may have changed by the time they do)."""
+        if self.redemptions.filter(user=user).exists():
+            return 'Coupon has already been used.'
+        if self.used_count >= self.usage_limit:
+            return 'Coupon has been used up.'
+        if not self.is_valid():
+            return 'Coupon is not valid.'
+        return None
 
-    def apply_coupon(self, user):
-        if self.is_valid():
-            self.used_count += 1
-            self.save()
-            return True
-        return False
\ No newline at end of file
+    def redeem(self, user):
+        """
+        Use the coupon once for user. Returns False, having changed nothing,
+        if user already redeemed it or it is no longer redeemable. Safe
+        against concurrent redemptions: the one-per-user rule is a unique
+        constraint and the use is counted by a conditional UPDATE of the
+        current row, never from a value read earlier.
+        """
+        try:
+            with transaction.atomic():
+                CouponRedemption.objects.create(coupon=self, user=user)
+                if not Coupon.redeemable().filter(pk=self.pk).update(used_count=models.F('used_count') + 1):
+                    transaction.set_rollback(True)
+                    return False
+        except IntegrityError:
+            # Already redeemed by user
+            return False
+        self.used_count += 1
+        return True
+
+
+class CouponRedemption(models.Model):
+    coupon = models.ForeignKey(Coupon, related_name='redemptions', on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='coupon_redemptions', on_delete=models.CASCADE)
+    redeemed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('coupon', 'user')
+
+    def __str__(self):
+        return f"{self.coupon} - {self.user}"
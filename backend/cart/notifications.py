@@ -0,0 +1,95 @@
+"""
+New order notifications to ORDER_NOTIFICATION_EMAIL.
+
+Placing an order publishes a 'cart.order_notification' outbox message; the
+worker renders the email from the cart/email templates (compiled once per
+process by the cached template loader), the plain text part from its own
+template and the same context, and queues it as an 'email.send' message.
+
+With ORDER_NOTIFICATION_DIGEST_MINUTES set, the messages are held until the
+end of the current window of that many minutes, so a whole window becomes
+due at once and goes out as one digest email (up to DIGEST_MAX_ORDERS
+orders each) instead of one email per order.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from django.utils import timezone
+from outbox.dispatch import publish
+from outbox.handlers import Handler
+from outbox.mail import queue_email
+from .models import Order, OrderItem
+
+KIND = 'cart.order_notification'
+DIGEST_MAX_ORDERS = 500
+
+
+def digest_delay(now, minutes):
+    """Time from now until the end of the current digest window."""
+    window = minutes * 60
+    return timedelta(seconds=window - now.timestamp() % window)
+
+
+def notify_new_order(order):
+    """Queue the notification of a placed order, in the transaction placing it."""
+    if not settings.ORDER_NOTIFICATION_EMAIL:
+        return
+    minutes = settings.ORDER_NOTIFICATION_DIGEST_MINUTES
+    delay = digest_delay(timezone.now(), minutes) if minutes else None
+    publish(KIND, {'order_id': str(order.pk)}, delay=delay)
+
+
+def load_orders(order_ids):
+    """The orders of order_ids with everything the templates show, oldest first."""
+    items = OrderItem.objects.select_related('product', 'color', 'size')
+    return list(
+        Order.objects.filter(pk__in=order_ids)
+        .select_related('delivery')
+        .prefetch_related(Prefetch('order_items', queryset=items))
+        .order_by('created_at')
+    )
+
+
+def render(template, context):
+    """(text, html) of the template pair cart/email/<template>.txt and .html."""
+    text = render_to_string(f"cart/email/{template}.txt", context)
+    html = render_to_string(f"cart/email/{template}.html", context)
+    return text, html
+
+
+def send_order(order):
+    text, html = render('new_order', {'order': order})
+    queue_email("New Order Placed", text, [settings.ORDER_NOTIFICATION_EMAIL], html=html)
+
+
+def send_digest(orders):
+    text, html = render('order_digest', {'orders': orders})
+    queue_email(f"{len(orders)} New Orders", text, [settings.ORDER_NOTIFICATION_EMAIL], html=html)
+
+
+class OrderNotificationHandler(Handler):
+    kind = KIND
+    batch_size = DIGEST_MAX_ORDERS
+    # One batch at a time, so a digest window is claimed by a single worker
+    concurrency = DIGEST_MAX_ORDERS
+
+    def handle_batch(self, messages):
+        if not settings.ORDER_NOTIFICATION_EMAIL:
+            return {message.pk: None for message in messages}
+        # Orders deleted since have nothing left to announce
+        orders = {str(order.pk): order for order in load_orders([message.payload['order_id'] for message in messages])}
+        if settings.ORDER_NOTIFICATION_DIGEST_MINUTES and len(orders) > 1:
+            send_digest(list(orders.values()))
+            return {message.pk: None for message in messages}
+        results = {}
+        for message in messages:
+            order = orders.get(message.payload['order_id'])
+            try:
+                if order is not None:
+                    send_order(order)
+            except Exception as e:
+                results[message.pk] = e
+            else:
+                results[message.pk] = None
+        return results
@@ -0,0 +1,4 @@
+from outbox.handlers import register
+from .notifications import OrderNotificationHandler
+
+register(OrderNotificationHandler())
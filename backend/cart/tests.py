@@ -1,3 +1,66 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
+from shop.models import Brand, Category, Product, Size, SizeColorStock, StockReservation
+from userauth.models import User
+from .models import Order, OrderItem
 
-# Create your tests here.
+
+class DeliveryViewTests(TestCase):
+    """Placing an order through the delivery endpoint reserves its stock like checkout does."""
+    DELIVERY = {
+        'phone_number': '9800000000', 'first_name': 'Test', 'last_name': 'User', 'email': '',
+        'shipping_address': 'Somewhere', 'payment_method': 'COD', 'shipping_cost': 0, 'subtotal': 0,
+        'discount': 0, 'payment_amount': 0, 'payment_status': 'Pending',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='buyer@example.com', name='buyer', password='x')
+        cls.product = Product.objects.create(
+            name='Shirt', description='', brand=Brand.objects.create(name='Brand'),
+            category=Category.objects.create(name='Tops'),
+        )
+        cls.size = Size.objects.create(product=cls.product, name='M')
+        cls.row = SizeColorStock.objects.create(product=cls.product, size=cls.size, stock=1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def unplaced_order(self):
+        order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=order, product=self.product, size=self.size, quantity=1, price=0)
+        return order
+
+    def deliver(self, order, **delivery):
+        return self.client.post('/cart/api/delivery/', dict(self.DELIVERY, order=order.pk, **delivery), format='json')
+
+    def test_stock_is_reserved(self):
+        order = self.unplaced_order()
+        self.assertEqual(self.deliver(order).status_code, 200)
+        order.refresh_from_db()
+        self.row.refresh_from_db()
+        self.assertEqual((order.status, self.row.stock), ('Placed', 0))
+        self.assertIsNone(StockReservation.objects.get(order=order).expires_at)
+
+    def test_pending_payment_expires(self):
+        order = self.unplaced_order()
+        self.assertEqual(self.deliver(order, payment_method='Card').status_code, 200)
+        self.assertIsNotNone(StockReservation.objects.get(order=order).expires_at)
+
+    def test_sold_out_order_is_not_placed(self):
+        self.deliver(self.unplaced_order())
+        order = self.unplaced_order()
+        self.assertEqual(self.deliver(order).status_code, 400)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'Unplaced')
+        self.assertFalse(hasattr(order, 'delivery'))
+
+    def test_order_is_placed_once(self):
+        self.row.stock = 2
+        self.row.save()
+        order = self.unplaced_order()
+        self.deliver(order)
+        self.assertEqual(self.deliver(order).status_code, 400)
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.stock, 1)
@@ -7,12 +7,16 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 import random
 from rest_framework import generics
 from .utils import Util
-from shop.models import Product, Color, Size
-import datetime
-from django.core.mail import EmailMultiAlternatives
-from django.utils.html import strip_tags
+from shop.inventory import OutOfStock
+from shop.models import Product
 from rest_framework.pagination import PageNumberPagination
+from django.db import transaction
 from django.db.models import Q
+from django.conf import settings
+from .notifications import load_orders, notify_new_order
+from .checkout import place_order, submit_order
+from rest_framework.exceptions import ValidationError
+from shop.pagination import KeysetPagination, cursor_requested
 
 
 class OrderPagination(PageNumberPagination):
@@ -33,6 +37,11 @@ class OrderPagination(PageNumberPagination):
         })
 
 
+class OrderCursorPagination(KeysetPagination):
+    default_ordering = ('-created_at',)
+    ordering_columns = {'created_at': 'created_at'}
+
+
 class CheckoutAPIView(APIView):
     """Handle checkout with delivery info and order creation"""
     permission_classes = [AllowAny]
@@ -47,47 +56,13 @@ class CheckoutAPIView(APIView):
         if not cart_items_data:
             return Response({'detail': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create order
         user = request.user if request.user.is_authenticated else None
-        order = Order.objects.create(user=user, status='Placed')
-        
-        # Create order items from cart items
-        try:
-            for item in cart_items_data:
-                product = Product.objects.get(product_id=item.get('product_id'))
-                
-                # Get color and size if available
-                color = None
-                size = None
-                
-                if item.get('color'):
-                    color = Color.objects.filter(name=item.get('color'), product=product).first()
-                
-                if item.get('size'):
-                    size = Size.objects.filter(name=item.get('size')).first()
-                
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    color=color,
-                    size=size,
-                    quantity=item.get('quantity', 1),
-                    price=item.get('price', 0)
-                )
-        except Product.DoesNotExist:
-            order.delete()
-            return Response({'detail': 'Product not found'}, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            order.delete()
-            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Create delivery info
+
+        # Order, items and delivery are written in one transaction, nothing is left behind on failure
         try:
             subtotal = data.get('subtotal', 0)
             shipping_cost = data.get('shippingCost', 0)
-            
             delivery_data = {
-                'order': order.id,
                 'phone_number': data.get('phoneNumber'),
                 'first_name': data.get('firstName'),
                 'last_name': data.get('lastName'),
@@ -100,23 +75,14 @@ class CheckoutAPIView(APIView):
                 'payment_amount': subtotal + shipping_cost,
                 'payment_status': 'Pending'
             }
-            
-            delivery_serializer = DeliverySerializer(data=delivery_data)
-            if delivery_serializer.is_valid():
-                delivery = delivery_serializer.save(order=order)
-            else:
-                order.delete()
-                return Response(delivery_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            order = place_order(user, cart_items_data, delivery_data)
+        except ValidationError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            order.delete()
             return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Clear user's cart if authenticated
-        if user:
-            Cart.objects.filter(user=user).delete()
-        
+
         # Return order info
-        order_serializer = OrderSerializer(order)
+        order_serializer = OrderSerializer(load_orders([order.pk])[0])
         return Response(order_serializer.data, status=status.HTTP_201_CREATED)
 
 
@@ -177,7 +143,7 @@ class OrderAPIView(APIView):
             orders = orders.filter(status=status_filter)
         
         # Paginate the queryset
-        paginator = OrderPagination()
+        paginator = OrderCursorPagination() if cursor_requested(request) else OrderPagination()
         paginated_orders = paginator.paginate_queryset(orders, request, view=self)
         serializer = OrderSerializer(paginated_orders, many=True)
         
@@ -199,162 +165,27 @@ class OrderAPIView(APIView):
 class DeliveryView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @transaction.atomic
     def post(self, request):
         user = request.user
         data = request.data
-        order = Order.objects.filter(user=user, id=data["order"]).first()
+        # Locked, so the same order cannot be placed (and its stock reserved) twice at once
+        order = Order.objects.select_for_update().filter(user=user, id=data.get("order")).first()
+        if order is None:
+            return Response({'detail': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        if order.status != 'Unplaced':
+            return Response({'detail': 'Order has already been placed'}, status=status.HTTP_400_BAD_REQUEST)
 
         serializer = DeliverySerializer(data=data)
         
         if serializer.is_valid(raise_exception=True):
+            try:
+                submit_order(order, serializer.validated_data.get('payment_method', 'COD'))
+            except OutOfStock as e:
+                return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             delivery_instance = serializer.save(order=order)
-            order.status = "Placed"
-            order.save()
 
-            order_item_data = OrderItemSerializer(order.order_items.all(), many=True).data
-
-            # Build HTML rows for each item
-            item_rows = ""
-            for item in order_item_data:
-                product_name = item.get("product_name", "N/A")
-                product_id = item.get("product_id", "N/A")
-                quantity = item.get("quantity", 0)
-                item_rows += f"""
-                <tr>
-                    <td>{product_name}</td>
-                    <td>{product_id}</td>
-                    <td>{quantity}</td>
-                </tr>
-                """
-            
-            # Extract relevant fields from serializer.data
-            first_name = serializer.data.get('first_name', 'N/A')
-            last_name = serializer.data.get('last_name', 'N/A')
-            phone_number = serializer.data.get('phone_number', 'N/A')
-            shipping_address = serializer.data.get('shipping_address', 'N/A')
-            city = serializer.data.get('city', 'N/A')
-            payment_amount = serializer.data.get('payment_amount', 0)
-            shipping_cost = serializer.data.get('shipping_cost', 0)
-            subtotal = serializer.data.get('subtotal', 0)
-            discount = serializer.data.get('discount', 0)
-            
-            # Build a more readable HTML output
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-              <meta charset="utf-8">
-              <title>New Order Notification</title>
-              <style>
-                body {{
-                  font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif;
-                  background-color: #f7f7f7;
-                  padding: 20px;
-                  color: #333;
-                }}
-                .container {{
-                  max-width: 600px;
-                  margin: 0 auto;
-                  background-color: #ffffff;
-                  border-radius: 8px;
-                  overflow: hidden;
-                  box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                }}
-                .header {{
-                  background-color: #4CAF50;
-                  color: #ffffff;
-                  padding: 20px;
-                  text-align: center;
-                }}
-                .content {{
-                  padding: 20px;
-                  line-height: 1.6;
-                }}
-                .footer {{
-                  background-color: #f0f0f0;
-                  color: #777;
-                  text-align: center;
-                  padding: 10px;
-                  font-size: 12px;
-                }}
-                table {{
-                  width: 100%;
-                  border-collapse: collapse;
-                  margin-top: 10px;
-                }}
-                table td {{
-                  padding: 8px;
-                  border: 1px solid #ddd;
-                }}
-                table th {{
-                  background-color: #f9f9f9;
-                  text-align: left;
-                  padding: 8px;
-                  border: 1px solid #ddd;
-                }}
-              </style>
-            </head>
-            <body>
-              <div class="container">
-                <div class="header">
-                  <h1>New Order Placed</h1>
-                </div>
-                <div class="content">
-                  <p>Hello,</p>
-                  <p>A new order has been placed: <strong>{order}</strong>.</p>
-                  <table>
-                  {item_rows}
-                  </table>
-                  <p>Please deliver the order to the following address:</p>
-                   <table>
-                    <tr>
-                      <th>Name</th>
-                      <td>{first_name} {last_name}</td>
-                    </tr>
-                    <tr>
-                      <th>Phone Number</th>
-                      <td>{phone_number}</td>
-                    </tr>
-                    <tr>
-                      <th>Address</th>
-                      <td>{shipping_address},{city}</td>
-                    </tr>
-                    <tr>
-                      <th>Subtotal</th>
-                      <td>{subtotal}</td>
-                    </tr>
-                    <tr>
-                      <th>Discount</th>
-                      <td>{discount}</td>
-                    </tr>
-                    <tr>
-                      <th>Shipping Cost</th>
-                      <td>{shipping_cost}</td>
-                    </tr>
-                    <tr>
-                      <th>Total Amount</th>
-                      <td>{payment_amount}</td>
-                    </tr>
-                  </table>
-                  <p>After delivery, please update the order status accordingly.</p>
-                  <p>Thank you!</p>
-                </div>
-                <div class="footer">
-                  &copy; {datetime.datetime.now().year} Your Company Name. All rights reserved.
-                </div>
-              </div>
-            </body>
-            </html>
-            """
-
-            # Generate a plain text version by stripping HTML tags
-            text_content = strip_tags(html_content)
-            
-            subject = "New Order Placed"
-            from_email = "your_email@example.com"
-            to_email = "bbobbasnet@gmail.com"
-            # Send the email asynchronously using Celery
-            # send_order_email.delay(subject, text_content, html_content, from_email, [to_email])
+            notify_new_order(order)
 
             return Response('OKAY ',status=status.HTTP_200_OK)
         else:
@@ -523,16 +354,25 @@ class MergeCartView(APIView):
 
 
 class CouponView(APIView):
+    """GET checks a coupon without using it, POST redeems it for the user"""
     permission_classes = [IsAuthenticated]
 
     def get(self,request):
         code = request.GET.get('code')
-        if code:
-            coupon = Coupon.objects.filter(code=code).first()
-            if coupon:
-                if coupon.apply_coupon(request.user):
-                  return Response({'status':'Success','amount':coupon.amount,'percentage':coupon.percentage})
-                else:
-                    return Response({'status':'Failed','message':'Coupon has already been used.'})
-            else:
-                return Response({'status':'Failed','message':'Coupon is not valid.'},status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        coupon = Coupon.objects.filter(code=code).first() if code else None
+        if not coupon:
+            return Response({'status':'Failed','message':'Coupon is not valid.'},status=status.HTTP_400_BAD_REQUEST)
+        reason = coupon.unavailable_reason(request.user)
+        if reason:
+            return Response({'status':'Failed','message':reason})
+        return Response({'status':'Success','amount':coupon.amount,'percentage':coupon.percentage})
+
+    def post(self, request):
+        code = request.data.get('code')
+        coupon = Coupon.objects.filter(code=code).first() if code else None
+        if not coupon:
+            return Response({'status':'Failed','message':'Coupon is not valid.'},status=status.HTTP_400_BAD_REQUEST)
+        if not coupon.redeem(request.user):
+            reason = coupon.unavailable_reason(request.user) or 'Coupon has been used up.'
+            return Response({'status':'Failed','message':reason})
+        return Response({'status':'Success','amount':coupon.amount,'percentage':coupon.percentage})
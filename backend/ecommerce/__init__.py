@@ -0,0 +1,7 @@
+try:
+    from .celery import app as celery_app
+except ImportError:
+    # Celery is optional: without it the outbox is served by manage.py run_outbox
+    celery_app = None
+
+__all__ = ('celery_app',)
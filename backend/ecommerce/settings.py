@@ -49,6 +49,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'blog',
     'userauth',
+    'outbox',
     'import_export',
     'ckeditor',
     
@@ -101,6 +102,11 @@ if not PRODUCTION:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Writers queue for the lock from the start of their transaction instead of failing with
+            # "database is locked" when two checkouts read stock and then both try to write it
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+            # A file, not the shared in-memory database, so concurrent tests wait for the lock as above
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
         }
     }
 else:
@@ -209,12 +215,26 @@ SIMPLE_JWT = {
 PASSWORD_RESET_TIMEOUT = 900 
 
 # Email Configuration
-EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend"
+# Sent by the outbox worker (outbox.mail). Set EMAIL_BACKEND to
+# django.core.mail.backends.console.EmailBackend or
+# django.core.mail.backends.filebased.EmailBackend (writing to EMAIL_FILE_PATH)
+# to keep mail local in development and tests.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', "django.core.mail.backends.smtp.EmailBackend")
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', str(BASE_DIR / 'sent_emails'))
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_HOST_USER = os.environ.get('EMAIL_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_PASS')
 EMAIL_USE_TLS = True
+# Seconds before a stalled SMTP connection fails (and the batch is retried)
+EMAIL_TIMEOUT = 10
+DEFAULT_FROM_EMAIL = os.environ.get('EMAIL_FROM') or EMAIL_HOST_USER or 'webmaster@localhost'
+# Where new order notifications go, none are sent when unset
+ORDER_NOTIFICATION_EMAIL = os.environ.get('ORDER_NOTIFICATION_EMAIL')
+# Send one digest of the new orders every this many minutes instead of an email per order (0: off)
+ORDER_NOTIFICATION_DIGEST_MINUTES = int(os.environ.get('ORDER_NOTIFICATION_DIGEST_MINUTES', 0))
+# Minutes the stock of an order awaiting online payment stays reserved (cash on delivery: until dispatch)
+STOCK_RESERVATION_MINUTES = int(os.environ.get('STOCK_RESERVATION_MINUTES', 30))
 
 
 
@@ -293,6 +313,31 @@ AWS_S3_OBJECT_PARAMETERS = {
 
 
 
+# Cache
+# Shared by all workers when REDIS_CACHE_URL is set (the version counters behind cache
+# invalidation only work across processes with a shared cache), per process otherwise,
+# in which case the response cache, listing ETags and cached counts and facets are off and
+# the autocomplete index watches the products table instead of the catalog version.
+if os.environ.get('REDIS_CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_CACHE_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+# Upper bound only: cached responses go stale through version counters, not expiry
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+# Pre-rendered product JSON, replaced by the signals whenever the product changes
+PRODUCT_DOCUMENT_TIMEOUT = 60 * 60 * 24
+
+
 # Celery settings
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
@@ -300,8 +345,32 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+# Retries and anything a kick missed (broker down) are picked up by this sweep
+CELERY_BEAT_SCHEDULE = {
+    'outbox-sweep': {'task': 'outbox.tasks.dispatch_outbox', 'schedule': 30.0},
+}
+# 'celery' queues a task after every commit that published outbox messages;
+# 'poll' leaves them to manage.py run_outbox
+OUTBOX_BACKEND = os.environ.get('OUTBOX_BACKEND', 'poll')
+
+
 
+# How paginated catalog listings count their results: exact, cached, estimate or none
+# (clients can pick one per request with ?count=). 'cached' needs the shared cache of
+# REDIS_CACHE_URL and counts exactly without it.
+CATALOG_COUNT_STRATEGY = os.environ.get('CATALOG_COUNT_STRATEGY', 'cached')
+CATALOG_COUNT_CACHE_TIMEOUT = 60 * 60
+# Below this many estimated rows the 'estimate' strategy still runs an exact COUNT(*)
+CATALOG_COUNT_ESTIMATE_THRESHOLD = 10000
+# Upper edges of the price histogram returned by the facets endpoint (the last bucket is open ended)
+CATALOG_PRICE_BUCKETS = [500, 1000, 2000, 5000, 10000]
+CATALOG_FACETS_CACHE_TIMEOUT = 60 * 60
+# How often each process checks the catalog for changes to refresh its in-memory autocomplete index
+AUTOCOMPLETE_REFRESH_SECONDS = 5
 
 
 FACEBOOK_PAGE_ACCESS_TOKEN = os.environ.get('FACEBOOK_PAGE_ACCESS_TOKEN')
 FACEBOOK_PAGE_ID = os.environ.get('FACEBOOK_PAGE_ID')
+# Point at a local fake (manage.py fake_graph_api) in development and tests
+FACEBOOK_GRAPH_URL = os.environ.get('FACEBOOK_GRAPH_URL', 'https://graph.facebook.com')
+FACEBOOK_PRODUCT_URL = os.environ.get('FACEBOOK_PRODUCT_URL', 'https://www.dgtech.com.np/product/{product_id}/')
@@ -1,7 +1,7 @@
 #!/bin/bash
 
 # Apply database migrations
-python manage.py makemigrations cart shop userauth blog
+python manage.py makemigrations cart shop userauth blog outbox
 python manage.py migrate
 
 # Check what service we're running
@@ -11,6 +11,9 @@ if [ "$1" = "celery" ]; then
 elif [ "$1" = "celery-beat" ]; then
     # Run Celery beat
     celery -A ecommerce beat -l info
+elif [ "$1" = "outbox" ]; then
+    # Run the polling outbox worker (when there is no Celery broker)
+    python manage.py run_outbox
 else
     # Start Gunicorn by default
     gunicorn ecommerce.wsgi:application --bind 0.0.0.0:8000 --workers 3 --timeout 120
@@ -0,0 +1,7 @@
+# Read by gunicorn from the working directory, on top of the flags in entrypoint.sh
+
+
+def post_worker_init(worker):
+    # The in-memory autocomplete index is built here rather than inside the first request of each worker
+    from shop.autocomplete import warm_up
+    warm_up()
@@ -0,0 +1,25 @@
+from django.contrib import admin
+from django.utils import timezone
+from .models import OutboxMessage, OutboxKind
+
+
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'attempts', 'available_at', 'created_at', 'processed_at', 'last_error']
+    list_filter = ['status', 'kind']
+    actions = ['requeue']
+
+    @admin.action(description="Requeue the selected messages")
+    def requeue(self, request, queryset):
+        queryset.exclude(status=OutboxMessage.DONE).update(
+            status=OutboxMessage.PENDING, attempts=0, available_at=timezone.now(),
+        )
+
+
+admin.site.register(OutboxMessage, OutboxMessageAdmin)
+
+
+class OutboxKindAdmin(admin.ModelAdmin):
+    list_display = ['name', 'paused_until']
+
+
+admin.site.register(OutboxKind, OutboxKindAdmin)
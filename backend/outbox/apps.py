@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class OutboxConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'outbox'
+    def ready(self):
+        # Every app declares the side effects it hands to the worker in an outbox_handlers module
+        from django.utils.module_loading import autodiscover_modules
+        autodiscover_modules('outbox_handlers')
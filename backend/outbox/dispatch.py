@@ -0,0 +1,181 @@
+"""
+Writing and dispatching outbox messages.
+
+publish() only inserts a row, inside the caller's transaction: the side
+effect exists if and only if the change that caused it commits, and the
+request never waits on outbound I/O. Workers then claim due messages per
+kind, in batches no larger than the kind's free concurrency, hand them to
+the kind's handler and record the outcome:
+
+  done  - handled
+  retry - failed, back to pending after the handler's backoff
+  dead  - rejected, or still failing after max_attempts (the dead letters,
+          requeued from the admin)
+
+Claimed messages are leased; a worker that dies mid-batch leaves them to be
+taken over once the lease runs out, so delivery is at least once.
+
+With OUTBOX_BACKEND = 'celery' each commit also queues a Celery task that
+drains the outbox right away (outbox.tasks); otherwise, or when the broker
+is down, the run_outbox polling worker picks the messages up.
+"""
+import logging
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from .handlers import Defer, Reject, Retry, get_handler, registered
+from .models import OutboxKind, OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def publish(kind, payload, delay=None):
+    """
+    Record a side effect of kind with a JSON payload in the current
+    transaction, to be carried out after it commits (not before delay, a
+    timedelta, when given).
+    """
+    get_handler(kind)
+    available_at = timezone.now() + (delay or timedelta(0))
+    message = OutboxMessage.objects.create(kind=kind, payload=payload, available_at=available_at)
+    if settings.OUTBOX_BACKEND == 'celery':
+        transaction.on_commit(kick)
+    return message
+
+
+def kick():
+    from .tasks import dispatch_outbox
+    try:
+        dispatch_outbox.delay()
+    except Exception:
+        # The row is committed, a polling worker or the periodic sweep still gets to it
+        logger.exception("Could not queue the outbox task")
+
+
+def pause(kind, seconds):
+    """Stop dispatching kind for seconds (a remote rate limit)."""
+    until = timezone.now() + timedelta(seconds=seconds)
+    OutboxKind.objects.get_or_create(name=kind)
+    OutboxKind.objects.filter(name=kind).filter(Q(paused_until__isnull=True) | Q(paused_until__lt=until)).update(paused_until=until)
+
+
+def claim(handler):
+    """
+    Due messages of handler's kind, at most batch_size and the kind's free
+    concurrency, marked processing under a lease. The kind's row is locked
+    meanwhile so concurrent claims can't both take the same free slots.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        lane, created = OutboxKind.objects.select_for_update().get_or_create(name=handler.kind)
+        if lane.paused_until and lane.paused_until > now:
+            return []
+        in_flight = OutboxMessage.objects.filter(
+            kind=handler.kind, status=OutboxMessage.PROCESSING, available_at__gt=now,
+        ).count()
+        free = min(handler.batch_size, handler.concurrency - in_flight)
+        if free <= 0:
+            return []
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(kind=handler.kind, status__in=[OutboxMessage.PENDING, OutboxMessage.PROCESSING], available_at__lte=now)
+            .order_by('available_at')[:free]
+        )
+        OutboxMessage.objects.filter(pk__in=[message.pk for message in messages]).update(
+            status=OutboxMessage.PROCESSING, available_at=now + handler.lease, attempts=F('attempts') + 1,
+        )
+    for message in messages:
+        message.attempts += 1
+    return messages
+
+
+def process(handler, messages):
+    """Run handler over claimed messages and store each outcome. Returns {outcome: count}."""
+    try:
+        results = handler.handle_batch(messages)
+    except Exception as e:
+        logger.exception("Outbox handler for %s failed", handler.kind)
+        results = {message.pk: e for message in messages}
+
+    now = timezone.now()
+    outcomes = Counter()
+    done = []
+    pause_seconds = 0
+    for message in messages:
+        error = results.get(message.pk, Retry("The handler returned no result"))
+        if error is None:
+            done.append(message.pk)
+            outcomes['done'] += 1
+            continue
+        message.last_error = f"{type(error).__name__}: {error}"[:2000]
+        if isinstance(error, Defer):
+            pause_seconds = max(pause_seconds, error.delay)
+            message.status = OutboxMessage.PENDING
+            message.attempts -= 1
+            message.available_at = now + timedelta(seconds=error.delay)
+            outcomes['deferred'] += 1
+        elif isinstance(error, Reject) or message.attempts >= handler.max_attempts:
+            message.status = OutboxMessage.DEAD
+            message.processed_at = now
+            outcomes['dead'] += 1
+            logger.warning("Outbox message %s dead after %s attempts: %s", message, message.attempts, message.last_error)
+        else:
+            delay = getattr(error, 'delay', None)
+            message.status = OutboxMessage.PENDING
+            message.available_at = now + (timedelta(seconds=delay) if delay is not None else handler.backoff(message.attempts))
+            outcomes['retry'] += 1
+        message.save(update_fields=['status', 'attempts', 'available_at', 'last_error', 'processed_at'])
+    if done:
+        OutboxMessage.objects.filter(pk__in=done).update(status=OutboxMessage.DONE, processed_at=now, last_error='')
+    if pause_seconds:
+        pause(handler.kind, pause_seconds)
+    return outcomes
+
+
+def dispatch_once(kinds=None):
+    """Claim and process one batch of every registered kind (or of kinds). Returns {outcome: count}."""
+    outcomes = Counter()
+    for handler in registered():
+        if kinds and handler.kind not in kinds:
+            continue
+        messages = claim(handler)
+        if messages:
+            outcomes.update(process(handler, messages))
+    return outcomes
+
+
+def drain(kinds=None, limit=None):
+    """dispatch_once until nothing is due (or limit messages were processed). Returns {outcome: count}."""
+    outcomes = Counter()
+    while True:
+        batch = dispatch_once(kinds)
+        outcomes.update(batch)
+        if not batch or (limit and sum(outcomes.values()) >= limit):
+            return outcomes
+
+
+def queue_stats():
+    """{kind: {status: count, 'oldest_pending': seconds}} of the messages not yet done."""
+    now = timezone.now()
+    stats = {}
+    rows = (
+        OutboxMessage.objects.exclude(status=OutboxMessage.DONE)
+        .values('kind', 'status').annotate(count=Count('pk'), oldest=Min('created_at'))
+    )
+    for row in rows:
+        kind = stats.setdefault(row['kind'], {})
+        kind[row['status']] = row['count']
+        if row['status'] == OutboxMessage.PENDING:
+            kind['oldest_pending'] = round((now - row['oldest']).total_seconds(), 1)
+    return stats
+
+
+def purge(older_than):
+    """Delete done messages processed more than older_than (a timedelta) ago."""
+    deleted, by_model = OutboxMessage.objects.filter(
+        status=OutboxMessage.DONE, processed_at__lt=timezone.now() - older_than,
+    ).delete()
+    return deleted
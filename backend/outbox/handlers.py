@@ -0,0 +1,111 @@
+"""
+Handler registry. Each kind of outbox message has one handler, declared in
+an app's outbox_handlers module:
+
+    @handler('email.send', batch_size=50, concurrency=4)
+    def send_email(payload):
+        ...
+
+or, to process a whole batch at once (one connection for many messages),
+as a Handler subclass overriding handle_batch and passed to register().
+
+Raising from a handler retries the message with exponential backoff until
+max_attempts, then dead-letters it. Retry, Defer and Reject give the
+worker more precise instructions.
+"""
+import random
+from datetime import timedelta
+
+_handlers = {}
+
+
+class Retry(Exception):
+    """Try again after delay seconds (default: the handler's backoff); counts as an attempt."""
+
+    def __init__(self, message='', delay=None):
+        super().__init__(message)
+        self.delay = delay
+
+
+class Defer(Exception):
+    """
+    The remote side asked us to slow down: the whole kind is paused for
+    delay seconds and the message goes back to the queue without using up
+    an attempt.
+    """
+
+    def __init__(self, message='', delay=60):
+        super().__init__(message)
+        self.delay = delay
+
+
+class Reject(Exception):
+    """The message can never succeed: dead-letter it now."""
+
+
+class Handler:
+    kind = None
+    # Messages claimed and handed to handle_batch at once
+    batch_size = 20
+    # Messages of this kind being processed at the same time, across all workers
+    concurrency = 4
+    max_attempts = 8
+    # Seconds before the first retry, doubled after each failure
+    backoff_base = 30
+    backoff_max = 60 * 60
+    # How long a claimed message stays with a worker before another may take it over
+    lease = timedelta(minutes=5)
+
+    def handle(self, payload):
+        raise NotImplementedError
+
+    def handle_batch(self, messages):
+        """
+        {message.pk: None or the exception it failed with} for messages.
+        The default handles them one by one and stops at the first Defer,
+        which then applies to the rest of the batch too.
+        """
+        results = {}
+        for i, message in enumerate(messages):
+            try:
+                self.handle(message.payload)
+            except Defer as e:
+                results.update((other.pk, e) for other in messages[i:])
+                break
+            except Exception as e:
+                results[message.pk] = e
+            else:
+                results[message.pk] = None
+        return results
+
+    def backoff(self, attempts):
+        delay = min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+        # Jitter, so messages that failed together don't all come back together
+        return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def register(instance):
+    if instance.kind in _handlers:
+        raise ValueError(f"An outbox handler is already registered for {instance.kind!r}")
+    _handlers[instance.kind] = instance
+    return instance
+
+
+def handler(kind, **options):
+    """Register the decorated function as the handler of kind, options overriding the Handler defaults."""
+    def decorator(function):
+        attributes = dict(options, kind=kind, handle=staticmethod(function))
+        register(type(f"{function.__name__}_handler", (Handler,), attributes)())
+        return function
+    return decorator
+
+
+def get_handler(kind):
+    try:
+        return _handlers[kind]
+    except KeyError:
+        raise LookupError(f"No outbox handler registered for {kind!r}")
+
+
+def registered():
+    return list(_handlers.values())
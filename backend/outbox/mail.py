@@ -0,0 +1,158 @@
+"""
+Email delivery through the outbox.
+
+queue_email() records an 'email.send' message in the current transaction;
+the outbox worker sends a whole batch over one SMTP connection (Django's
+get_connection), opened once and reopened only if the server drops it.
+Each message keeps its own outcome: a recipient or content the server
+refuses for good (5xx) is dead-lettered at once, anything else is retried
+with the outbox backoff, and rejected credentials pause all email until
+they are fixed.
+
+Which backend sends is the EMAIL_BACKEND setting, so development and
+tests can use the console or file backends instead of SMTP.
+"""
+import smtplib
+import time
+from datetime import timedelta
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from .dispatch import publish, queue_stats
+from .handlers import Defer, Handler, Reject
+from .models import OutboxMessage
+
+KIND = 'email.send'
+# SMTP timings, which the message rows don't hold; counted in the cache
+STATS_KEY = 'email:stats:{name}'
+STATS = ('attempts', 'connections', 'send_ms')
+# Seconds all email waits after the server rejected our credentials
+AUTH_FAILURE_PAUSE = 5 * 60
+
+
+def queue_email(subject, body, to, html=None, from_email=None):
+    """Queue an email (plain text body, optional HTML alternative) to the addresses in to."""
+    return publish(KIND, {
+        'subject': subject,
+        'body': body,
+        'html': html,
+        'to': list(to),
+        'from_email': from_email,
+    })
+
+
+def build_message(payload, connection):
+    message = EmailMultiAlternatives(
+        subject=payload['subject'],
+        body=payload['body'],
+        from_email=payload.get('from_email') or None,
+        to=payload['to'],
+        connection=connection,
+    )
+    if payload.get('html'):
+        message.attach_alternative(payload['html'], 'text/html')
+    return message
+
+
+def record(name, amount=1):
+    key = STATS_KEY.format(name=name)
+    if not cache.add(key, amount, None):
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            cache.set(key, amount, None)
+
+
+def classify(error):
+    """The outbox instruction for an SMTP failure."""
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return Defer(f"SMTP authentication failed: {error}", delay=AUTH_FAILURE_PAUSE)
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return Reject(f"Recipients refused: {error.recipients}")
+    if isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600:
+        return Reject(f"{error.smtp_code} {error.smtp_error!r}")
+    return error
+
+
+class EmailHandler(Handler):
+    kind = KIND
+    batch_size = 50
+    # Messages in flight across all workers, i.e. at most four open SMTP connections
+    concurrency = 200
+    max_attempts = 6
+    backoff_base = 60
+
+    def handle_batch(self, messages):
+        results = {}
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+            record('connections')
+            for i, message in enumerate(messages):
+                error = self.send(connection, message.payload)
+                if isinstance(error, smtplib.SMTPServerDisconnected):
+                    # Dropped mid-batch (idle timeout, message limit): reconnect once and resend
+                    connection.close()
+                    connection.open()
+                    record('connections')
+                    error = self.send(connection, message.payload)
+                results[message.pk] = classify(error) if error else None
+                if isinstance(results[message.pk], Defer):
+                    results.update((other.pk, results[message.pk]) for other in messages[i + 1:])
+                    break
+        except (OSError, smtplib.SMTPException) as e:
+            # Could not connect at all: the batch is retried as a whole
+            error = classify(e)
+            results.update((message.pk, error) for message in messages if message.pk not in results)
+        finally:
+            connection.close()
+        return results
+
+    def send(self, connection, payload):
+        started = time.perf_counter()
+        try:
+            build_message(payload, connection).send()
+        except ValueError as e:
+            # Malformed address or header, it won't get better
+            return Reject(str(e))
+        except (OSError, smtplib.SMTPException) as e:
+            return e
+        finally:
+            record('attempts')
+            record('send_ms', int((time.perf_counter() - started) * 1000))
+        return None
+
+
+def email_stats(window=timedelta(hours=1)):
+    """
+    Queue depth, outcomes and end-to-end latency (queued to sent) of the
+    emails processed within window, from the outbox rows. The SMTP timings
+    come from cache counters, only reported when the cache is shared by all
+    the workers: a per-process cache would only know its own sends.
+    """
+    processed = OutboxMessage.objects.filter(kind=KIND, processed_at__gte=timezone.now() - window)
+    outcomes = processed.aggregate(
+        sent=Count('pk', filter=Q(status=OutboxMessage.DONE)),
+        retried=Count('pk', filter=Q(status=OutboxMessage.DONE, attempts__gt=1)),
+        dead=Count('pk', filter=Q(status=OutboxMessage.DEAD)),
+    )
+    latencies = sorted(
+        (processed_at - created_at).total_seconds()
+        for created_at, processed_at in processed.filter(status=OutboxMessage.DONE)
+        .order_by('-processed_at').values_list('created_at', 'processed_at')[:10000]
+    )
+    percentile = lambda p: round(latencies[min(int(len(latencies) * p), len(latencies) - 1)], 2) if latencies else None
+
+    counters = {name: 0 for name in STATS}
+    if not isinstance(caches['default'], LocMemCache):
+        keys = {STATS_KEY.format(name=name): name for name in STATS}
+        counters.update({keys[key]: value for key, value in cache.get_many(keys).items()})
+    return {
+        'queue': queue_stats().get(KIND, {}),
+        **outcomes,
+        'smtp_ms_mean': round(counters['send_ms'] / counters['attempts'], 1) if counters['attempts'] else None,
+        'messages_per_connection': round(counters['attempts'] / counters['connections'], 1) if counters['connections'] else None,
+        'latency_seconds': {'count': len(latencies), 'p50': percentile(0.5), 'p95': percentile(0.95), 'max': round(latencies[-1], 2) if latencies else None},
+    }
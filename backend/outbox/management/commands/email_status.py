@@ -0,0 +1,31 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from outbox.mail import email_stats
+
+
+class Command(BaseCommand):
+    help = "Show the email queue depth, outcomes, SMTP send times and queued-to-sent latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=60, help="Outcome and latency window (default: the last hour)")
+
+    def handle(self, *args, **options):
+        stats = email_stats(timedelta(minutes=options['minutes']))
+        queue = stats['queue']
+        latency = stats['latency_seconds']
+        self.stdout.write(
+            f"Queue: {queue.get('pending', 0)} pending, {queue.get('processing', 0)} processing, "
+            f"{queue.get('dead', 0)} dead, oldest pending {queue.get('oldest_pending', 0)}s"
+        )
+        self.stdout.write(
+            f"Last {options['minutes']} minutes: {stats['sent']} sent ({stats['retried']} after a retry), "
+            f"{stats['dead']} dead"
+        )
+        self.stdout.write(
+            f"SMTP: {stats['smtp_ms_mean']} ms per message, {stats['messages_per_connection']} messages per connection"
+        )
+        self.stdout.write(
+            f"Latency over the last {options['minutes']} minutes ({latency['count']} emails): "
+            f"p50 {latency['p50']}s, p95 {latency['p95']}s, max {latency['max']}s"
+        )
+        self.stdout.write(self.style.SUCCESS("Done"))
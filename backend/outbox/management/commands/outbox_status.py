@@ -0,0 +1,19 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from outbox.dispatch import purge, queue_stats
+
+
+class Command(BaseCommand):
+    help = "Show the outbox queue depth per kind, optionally deleting old processed messages"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--purge-days', type=int, help="Delete done messages processed more than this many days ago")
+
+    def handle(self, *args, **options):
+        if options['purge_days'] is not None:
+            deleted = purge(timedelta(days=options['purge_days']))
+            self.stdout.write(f"Deleted {deleted} processed messages")
+        stats = queue_stats()
+        for kind, counts in sorted(stats.items()):
+            self.stdout.write(f"{kind}: " + ', '.join(f"{name} {value}" for name, value in sorted(counts.items())))
+        self.stdout.write(self.style.SUCCESS(f"{sum(c.get('pending', 0) for c in stats.values())} messages pending"))
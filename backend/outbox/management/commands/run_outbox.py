@@ -0,0 +1,58 @@
+import logging
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from outbox.dispatch import dispatch_once
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Polling outbox worker: carry out pending side effects (email, Facebook posts, downloads...)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help="Batches processed in parallel")
+        parser.add_argument('--interval', type=float, default=1, help="Seconds between polls when idle")
+        parser.add_argument('--kind', action='append', dest='kinds', help="Only dispatch this kind (repeatable)")
+        parser.add_argument('--once', action='store_true', help="Process one batch of each kind and exit")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            self.report(dispatch_once(options['kinds']))
+            return
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=self.loop, args=(stop, options), name=f"outbox-{i}", daemon=True)
+            for i in range(options['threads'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(self.style.SUCCESS(f"Outbox worker running with {len(threads)} threads"))
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def loop(self, stop, options):
+        try:
+            while not stop.is_set():
+                try:
+                    outcomes = dispatch_once(options['kinds'])
+                except Exception:
+                    # A database hiccup must not kill the thread, claimed messages come back when their lease runs out
+                    logger.exception("Outbox dispatch failed")
+                    connection.close()
+                    outcomes = None
+                self.report(outcomes)
+                if not outcomes:
+                    stop.wait(options['interval'])
+        finally:
+            connection.close()
+
+    def report(self, outcomes):
+        if outcomes:
+            self.stdout.write(', '.join(f"{outcome}: {count}" for outcome, count in sorted(outcomes.items())))
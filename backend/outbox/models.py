@@ -0,0 +1,40 @@
+from django.db import models
+from django.utils import timezone
+
+
+class OutboxMessage(models.Model):
+    """
+    A side effect (email, API call, download...) recorded in the same
+    transaction as the change that causes it, and carried out afterwards by
+    the outbox worker with the handler registered for its kind.
+    """
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    DEAD = 'dead'
+    STATUSES = [(PENDING, 'Pending'), (PROCESSING, 'Processing'), (DONE, 'Done'), (DEAD, 'Dead')]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Pending: when it may be tried (again). Processing: when the worker's lease on it runs out
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['kind', 'status', 'available_at'])]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class OutboxKind(models.Model):
+    """Dispatch state of one kind: locked while claiming (concurrency limit) and paused when throttled."""
+    name = models.CharField(max_length=50, unique=True)
+    paused_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,4 @@
+from .handlers import register
+from .mail import EmailHandler
+
+register(EmailHandler())
@@ -0,0 +1,12 @@
+"""Celery entry points, used when OUTBOX_BACKEND is 'celery' (Celery itself is optional)."""
+try:
+    from celery import shared_task
+except ImportError:
+    shared_task = None
+
+if shared_task is not None:
+    @shared_task(ignore_result=True)
+    def dispatch_outbox():
+        # Queued after each commit that published something, and run periodically by beat for retries
+        from .dispatch import drain
+        drain()
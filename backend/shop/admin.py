@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Product, Comment, Repliess, ProductImage, Rating, Brand,Series, Category, SubCategory, ProductAttribute,  Color, Variant, Size, SizeColorStock
+from .models import Product, Comment, Repliess, ProductImage, Rating, Brand,Series, Category, SubCategory, ProductAttribute,  Color, Variant, Size, SizeColorStock, ProductRatingSummary, ProductRecommendation, JobWatermark, ProductRanking, StockReservation
 from import_export.admin import ImportExportModelAdmin
 from .resources import ProductResource, ProductAttributeResource, ProductImageResource, BrandResource, SeriesResource, CategoryResource, SubCategoryResource
 # Register your models here.
@@ -96,4 +96,46 @@ admin.site.register(ProductImage, ProductImageAdmin)
 admin.site.register(Series,SeriesAdmin)
 admin.site.register(Category,CategoryAdmin)
 admin.site.register(SubCategory,SubCategoryAdmin)
-admin.site.register(ProductAttribute, ProductAttributeAdmin)
\ No newline at end of file
+admin.site.register(ProductAttribute, ProductAttributeAdmin)
+
+
+class ProductRatingSummaryAdmin(admin.ModelAdmin):
+    list_display = ['product', 'count', 'average']
+    readonly_fields = ['count', 'total', 'star_1', 'star_2', 'star_3', 'star_4', 'star_5', 'average']
+
+
+admin.site.register(ProductRatingSummary, ProductRatingSummaryAdmin)
+
+
+class ProductRecommendationAdmin(admin.ModelAdmin):
+    list_display = ['product', 'section', 'rank', 'recommended', 'score']
+    list_filter = ['section']
+    raw_id_fields = ['product', 'recommended']
+
+
+admin.site.register(ProductRecommendation, ProductRecommendationAdmin)
+
+
+class JobWatermarkAdmin(admin.ModelAdmin):
+    list_display = ['name', 'position', 'updated_at']
+
+
+admin.site.register(JobWatermark, JobWatermarkAdmin)
+
+
+class ProductRankingAdmin(admin.ModelAdmin):
+    list_display = ['product', 'trending_score', 'best_seller_score', 'updated_at']
+    ordering = ['-trending_score']
+    raw_id_fields = ['product']
+
+
+admin.site.register(ProductRanking, ProductRankingAdmin)
+
+
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['order', 'stock', 'quantity', 'status', 'expires_at', 'created_at']
+    list_filter = ['status']
+    raw_id_fields = ['order', 'stock']
+
+
+admin.site.register(StockReservation, StockReservationAdmin)
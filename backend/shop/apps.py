@@ -6,4 +6,8 @@ class ShopConfig(AppConfig):
     name = 'shop'
     def ready(self):
         import shop.signals
+        import shop.checks
+        from django.db.models.signals import post_migrate
+        from .search import create_search_index
+        post_migrate.connect(create_search_index, sender=self)
 
@@ -0,0 +1,204 @@
+import heapq
+import logging
+import threading
+import time
+from collections import defaultdict
+from array import array
+from bisect import bisect_left, bisect_right
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import Count, Max
+from .caching import catalog_version, shared_cache
+
+logger = logging.getLogger(__name__)
+
+SUGGESTION_LIMIT = 10
+# Short queries are answered from precomputed lists of this many products per 1-2 letter prefix
+PREFIX_DEPTH = 50
+# Low bits of a word start entry holding the offset of the word in the name
+OFFSET_BITS = 10
+
+
+def normalize(text):
+    return ' '.join((text or '').casefold().split())
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class AutocompleteIndex:
+    """
+    Read-only suggestion index over product names. Products are stored in
+    (name length, name) order in parallel lists, so a lower position is a
+    better match whenever two names match equally well, and every posting
+    list is already sorted best first.
+
+    Queries of one or two characters look up the products with a word
+    starting with that prefix. Longer ones are ranked by tier(): names
+    starting with the query come from a range of the names sorted by text,
+    names with a later word starting with it from a range of the word starts
+    sorted the same way, and only if those are not enough the rarest trigram
+    posting list of the query is walked for names containing it elsewhere.
+    """
+
+    def __init__(self, rows, image_url=None):
+        """rows: (product_id, name, image, price) tuples; image_url turns a stored image name into a URL."""
+        image_url = image_url or (lambda name: default_storage.url(name) if name else None)
+        rows = sorted(((normalize(row[1]),) + tuple(row) for row in rows), key=lambda row: (len(row[2]), row[0]))
+        self.keys = [row[0] for row in rows]
+        self.ids = [row[1] for row in rows]
+        self.names = [row[2] for row in rows]
+        self.images = [image_url(row[3]) for row in rows]
+        self.prices = [row[4] for row in rows]
+
+        prefixes = defaultdict(list)
+        postings = defaultdict(list)
+        word_starts = []
+        for position, key in enumerate(self.keys):
+            words = key.split()
+            # '^' lists hold names starting with the prefix, so they rank first even past PREFIX_DEPTH
+            leading = {'^' + words[0][:1], '^' + words[0][:2]} if words else set()
+            for word in words:
+                for prefix in {word[:1], word[:2]} | leading:
+                    matches = prefixes[prefix]
+                    if len(matches) < PREFIX_DEPTH and (not matches or matches[-1] != position):
+                        matches.append(position)
+            for gram in trigrams(key):
+                postings[gram].append(position)
+            offset = key.find(' ')
+            while offset != -1:
+                word_starts.append((key[offset + 1:], position << OFFSET_BITS | offset + 1))
+                offset = key.find(' ', offset + 1)
+        self.prefixes = {prefix: array('I', matches) for prefix, matches in prefixes.items()}
+        self.postings = {gram: array('I', matches) for gram, matches in postings.items()}
+        # Positions ordered by name, and word starts after the first (position, offset) ordered by the text from there
+        self.by_name = array('I', sorted(range(len(self.keys)), key=self.keys.__getitem__))
+        word_starts.sort()
+        self.word_starts = array('Q', (entry for text, entry in word_starts))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def text_range(self, entries, text_at, query):
+        """Slice of entries (sorted by text_at(entry)) whose text starts with query."""
+        prefix = lambda i: text_at(entries[i])[:len(query)]
+        indexes = range(len(entries))
+        return entries[bisect_left(indexes, query, key=prefix):bisect_right(indexes, query, key=prefix)]
+
+    def tier(self, position, query):
+        key = self.keys[position]
+        if key.startswith(query):
+            return 0
+        if f' {query}' in key:
+            return 1
+        return 2
+
+    def ranked(self, query, limit):
+        """Positions of the best limit matches of query, ranked by (tier, position)."""
+        if len(query) < 3:
+            positions = set(self.prefixes.get('^' + query, ())) | set(self.prefixes.get(query, ()))
+            matches = [position for position in positions if query in self.keys[position]]
+            return heapq.nsmallest(limit, matches, key=lambda position: (self.tier(position, query), position))
+        ranked = heapq.nsmallest(limit, self.text_range(self.by_name, self.keys.__getitem__, query))
+        if len(ranked) < limit:
+            mask = (1 << OFFSET_BITS) - 1
+            word_starts = self.text_range(self.word_starts, lambda entry: self.keys[entry >> OFFSET_BITS][entry & mask:], query)
+            seen = set(ranked)
+            ranked += heapq.nsmallest(limit - len(ranked), {entry >> OFFSET_BITS for entry in word_starts} - seen)
+        if len(ranked) < limit:
+            lists = [self.postings.get(gram) for gram in trigrams(query)]
+            if all(lists):
+                seen = set(ranked)
+                # In position order, so the first matches found are the best of the last tier
+                for position in min(lists, key=len):
+                    if position not in seen and query in self.keys[position]:
+                        ranked.append(position)
+                        if len(ranked) >= limit:
+                            break
+        return ranked
+
+    def suggest(self, query, limit=SUGGESTION_LIMIT):
+        query = normalize(query)
+        if not query:
+            return []
+        return [
+            {
+                "name": self.names[position],
+                "id": self.ids[position],
+                "image": self.images[position],
+                "price": self.prices[position],
+            }
+            for position in self.ranked(query, limit)
+        ]
+
+
+def load_rows():
+    from .models import Product
+    return list(Product.objects.values_list('product_id', 'name', 'card_image', 'price').iterator(chunk_size=2000))
+
+
+def catalog_state():
+    """
+    What the index is rebuilt on a change of: the catalog version, or with
+    a per-process cache (which never sees the version bumps of the other
+    workers) the product count and latest updated_at, which every write
+    shown in the index moves.
+    """
+    if shared_cache():
+        return catalog_version()
+    from .models import Product
+    state = Product.objects.aggregate(count=Count('pk'), updated_at=Max('updated_at'))
+    return state['count'], state['updated_at']
+
+
+_lock = threading.Lock()
+_state = {'index': None, 'version': None, 'checked': 0.0, 'building': False}
+
+
+def rebuild_in_background(version):
+    def run():
+        try:
+            index = AutocompleteIndex(load_rows())
+            with _lock:
+                _state.update(index=index, version=version)
+        finally:
+            _state['building'] = False
+            connection.close()
+    threading.Thread(target=run, name='autocomplete-rebuild', daemon=True).start()
+
+
+def get_index():
+    """
+    The process-wide index. It is built by warm_up() when a worker starts
+    (or else on first use), then rebuilt in a background thread (while the
+    old one keeps answering) once the catalog_state moves. The state is
+    looked up at most every AUTOCOMPLETE_REFRESH_SECONDS, so most lookups
+    touch neither the cache nor the database.
+    """
+    now = time.monotonic()
+    if _state['index'] is not None and now - _state['checked'] < settings.AUTOCOMPLETE_REFRESH_SECONDS:
+        return _state['index']
+    _state['checked'] = now
+    version = catalog_state()
+    if _state['index'] is None:
+        with _lock:
+            if _state['index'] is None:
+                _state.update(index=AutocompleteIndex(load_rows()), version=version)
+    elif version != _state['version'] and not _state['building']:
+        _state['building'] = True
+        rebuild_in_background(version)
+    return _state['index']
+
+
+def suggest(query, limit=SUGGESTION_LIMIT):
+    return get_index().suggest(query, limit)
+
+
+def warm_up():
+    """Build the index before the process takes requests (see gunicorn.conf.py); on failure the first request does."""
+    try:
+        get_index()
+    except Exception:
+        logger.exception("Could not build the autocomplete index")
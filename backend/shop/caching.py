@@ -0,0 +1,87 @@
+import hashlib
+import time
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+CATALOG = 'catalog'
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_MODIFIED_KEY = 'catalog:modified'
+
+# Query parameters that only select a page or a representation, not the result set
+PAGE_PARAMS = {'page', 'page_size', 'cursor', 'pagination', 'ordering', 'fields', 'expand', 'view', 'count'}
+
+
+def shared_cache():
+    """
+    Whether every process sees the same cache. A per-process LocMemCache
+    only sees the version bumps of writes made by its own process, so
+    anything cached under a version would be served stale by the others.
+    """
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def version_key(namespace):
+    return f"{namespace}:version"
+
+
+def fresh_version():
+    # A version key that was never set or got evicted restarts from the clock, so it can't
+    # come back to a value an older cache entry was stored under
+    return time.time_ns() // 1000
+
+
+def namespace_versions(namespaces):
+    """
+    Current version of each namespace ('catalog', 'product:<pk>', 'brand:<pk>'...),
+    in one cache round trip. Cache entries store the versions they were built
+    from and are stale as soon as any of them moved.
+    """
+    keys = {version_key(namespace): namespace for namespace in namespaces}
+    found = cache.get_many(keys)
+    versions = {keys[key]: value for key, value in found.items()}
+    for key, namespace in keys.items():
+        if namespace not in versions:
+            cache.add(key, fresh_version(), None)
+            versions[namespace] = cache.get(key)
+    return versions
+
+
+def bump_namespaces(namespaces):
+    for namespace in namespaces:
+        try:
+            cache.incr(version_key(namespace))
+        except ValueError:
+            cache.set(version_key(namespace), fresh_version(), None)
+    if CATALOG in namespaces:
+        cache.set(CATALOG_MODIFIED_KEY, time.time(), None)
+
+
+def catalog_version():
+    """Version bumped on every catalog write. Cache keys embed it, so old entries just stop being read."""
+    return namespace_versions([CATALOG])[CATALOG]
+
+
+def catalog_modified():
+    """Unix time of the last catalog write seen by this cache, or None if it doesn't know."""
+    return cache.get(CATALOG_MODIFIED_KEY)
+
+
+def filter_key(request, exclude=PAGE_PARAMS):
+    """Stable hash of the path and the filtering query parameters, whatever their order."""
+    params = sorted(
+        (name, ','.join(sorted(request.query_params.getlist(name))))
+        for name in request.query_params
+        if name not in exclude
+    )
+    raw = request.path + '?' + '&'.join(f"{name}={value}" for name, value in params)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def representation_key(request):
+    """What besides the data changes a response body: origin and path (absolute links), Accept and the query string."""
+    params = sorted((name, ','.join(sorted(request.GET.getlist(name)))) for name in request.GET)
+    return '|'.join([
+        request.build_absolute_uri(request.path),
+        request.META.get('HTTP_ACCEPT', ''),
+        '&'.join(f"{name}={value}" for name, value in params),
+    ])
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+from .caching import shared_cache
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    if settings.DEBUG or shared_cache():
+        return []
+    return [Warning(
+        "The default cache is per process, so response caching, listing ETags and cached counts and facets are off, "
+        "and the autocomplete index polls the products table for changes.",
+        hint="Set REDIS_CACHE_URL so that every worker shares the cache.",
+        id='shop.W001',
+    )]
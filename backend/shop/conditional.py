@@ -0,0 +1,62 @@
+import hashlib
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from .caching import catalog_modified, catalog_version, representation_key, shared_cache
+
+
+def make_etag(request, *parts):
+    raw = '|'.join([representation_key(request)] + [str(part) for part in parts])
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+class ConditionalGetMixin:
+    """
+    ETag/Last-Modified for GET responses. get_validators returns them before
+    the handler runs, so an If-None-Match or If-Modified-Since that still
+    matches is answered with 304 without querying or serializing anything
+    else. Listing views use the catalog version and the time of the last
+    catalog write, which only the shared cache (REDIS_CACHE_URL) knows, so
+    they send no validators without one; detail views override
+    get_validators with their row's updated_at. Put it before
+    CachedResponseMixin so 304s skip the response cache too.
+    """
+
+    def get_validators(self, request, *args, **kwargs):
+        """(etag, last_modified) of the response, last_modified a Unix timestamp; None for unknown."""
+        if not shared_cache():
+            return None, None
+        return make_etag(request, catalog_version()), catalog_modified()
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        etag, last_modified = self.get_validators(request, *args, **kwargs)
+        if last_modified is not None:
+            last_modified = int(last_modified)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            if etag and not response.has_header('ETag'):
+                response['ETag'] = etag
+            if last_modified is not None and not response.has_header('Last-Modified'):
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class RowConditionalGetMixin(ConditionalGetMixin):
+    """Validators from the updated_at of the single row a detail view shows (one indexed lookup)."""
+    conditional_queryset = None
+    conditional_lookup_kwarg = 'id'
+
+    def get_validators(self, request, *args, **kwargs):
+        updated_at = (
+            self.conditional_queryset.filter(pk=kwargs.get(self.conditional_lookup_kwarg))
+            .values_list('updated_at', flat=True)
+            .first()
+        )
+        # Kept for the handler, e.g. to pick the cached document of that version
+        self.row_updated_at = updated_at
+        if updated_at is None:
+            return None, None
+        return make_etag(request, updated_at.isoformat()), updated_at.timestamp()
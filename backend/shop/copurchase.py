@@ -0,0 +1,191 @@
+"""
+Offline "frequently bought together" job.
+
+Orders become rows of a binary order x product matrix X; X.T @ X is then
+the item-item co-occurrence matrix, with each product's order count on the
+diagonal. Runs add the orders placed since the last run to the stored
+ProductPairCount totals and take out the orders cancelled since that an
+earlier run counted (see Order.counted_at), then re-rank the neighbours of
+every product those orders touched by cosine similarity:
+
+    cosine(i, j) = C[i, j] / sqrt(C[i, i] * C[j, j])
+
+and keep the top K as the bought_together recommendation section.
+"""
+from datetime import timedelta
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from cart.models import Order, OrderItem
+from .models import JobWatermark, ProductPairCount, ProductRecommendation
+
+JOB_NAME = 'copurchase'
+# Orders newer than this may still be committing, they are left for the next run
+SETTLE_TIME = timedelta(minutes=5)
+
+
+class ProductIndex:
+    """Product primary key <-> matrix column."""
+
+    def __init__(self):
+        self.positions = {}
+        self.keys = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def position(self, pk):
+        position = self.positions.get(pk)
+        if position is None:
+            position = self.positions[pk] = len(self.keys)
+            self.keys.append(pk)
+        return position
+
+
+def order_matrix(items, index):
+    """Binary order x product CSR matrix from (order_id, product_id) pairs."""
+    orders = {}
+    rows, cols = [], []
+    for order_id, product_id in items:
+        rows.append(orders.setdefault(order_id, len(orders)))
+        cols.append(index.position(product_id))
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int64), (rows, cols)),
+        shape=(len(orders), len(index)),
+    )
+    # An order lists a product once per colour/size, it still counts as one purchase
+    matrix.data[:] = 1
+    return matrix, len(orders)
+
+
+def co_occurrence(matrix):
+    return (matrix.T @ matrix).tocsr()
+
+
+def resize(matrix, size):
+    matrix = matrix.tocoo()
+    return sparse.csr_matrix((matrix.data, (matrix.row, matrix.col)), shape=(size, size))
+
+
+def stored_counts(index):
+    """The stored pair totals as a symmetric sparse matrix over index."""
+    rows, cols, data = [], [], []
+    for a, b, count in ProductPairCount.objects.values_list('product_a_id', 'product_b_id', 'count').iterator(chunk_size=10000):
+        i, j = index.position(a), index.position(b)
+        rows.append(i)
+        cols.append(j)
+        data.append(count)
+        if i != j:
+            rows.append(j)
+            cols.append(i)
+            data.append(count)
+    return sparse.csr_matrix((np.array(data, dtype=np.int64), (rows, cols)), shape=(len(index), len(index)))
+
+
+def write_counts(totals, changed, index, batch_size):
+    """
+    Upsert the totals of the pairs in changed (upper triangle, product_a_id
+    <= product_b_id), deleting the pairs no order has in common any more.
+    """
+    changed = sparse.triu(changed).tocoo()
+    counts = np.asarray(totals[changed.row, changed.col]).ravel()
+    pairs, emptied = [], []
+    for i, j, count in zip(changed.row, changed.col, counts):
+        a, b = sorted((index.keys[i], index.keys[j]))
+        if count > 0:
+            pairs.append(ProductPairCount(product_a_id=a, product_b_id=b, count=int(count)))
+        else:
+            emptied.append((a, b))
+    ProductPairCount.objects.bulk_create(
+        pairs, batch_size=batch_size, update_conflicts=True,
+        unique_fields=['product_a', 'product_b'], update_fields=['count'],
+    )
+    for start in range(0, len(emptied), batch_size):
+        condition = Q(pk__in=[])
+        for a, b in emptied[start:start + batch_size]:
+            condition |= Q(product_a_id=a, product_b_id=b)
+        ProductPairCount.objects.filter(condition).delete()
+    return len(pairs) + len(emptied)
+
+
+def top_neighbours(totals, rows, k, min_count):
+    """{row: [(column, cosine), ...]} best first, for the given rows of the co-occurrence matrix."""
+    diagonal = totals.diagonal()
+    neighbours = {}
+    for i in rows:
+        start, end = totals.indptr[i], totals.indptr[i + 1]
+        columns = totals.indices[start:end]
+        counts = totals.data[start:end]
+        keep = (columns != i) & (counts >= min_count)
+        columns, counts = columns[keep], counts[keep]
+        if not len(columns):
+            neighbours[i] = []
+            continue
+        scores = counts / np.sqrt(diagonal[i] * diagonal[columns])
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            columns, scores = columns[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        neighbours[i] = [(int(columns[o]), float(scores[o])) for o in order]
+    return neighbours
+
+
+def write_recommendations(neighbours, index, batch_size):
+    section = ProductRecommendation.BOUGHT_TOGETHER
+    products = [index.keys[i] for i in neighbours]
+    rows = [
+        ProductRecommendation(
+            product_id=index.keys[i], recommended_id=index.keys[j], section=section, rank=rank, score=score,
+        )
+        for i, ranked in neighbours.items()
+        for rank, (j, score) in enumerate(ranked)
+    ]
+    for start in range(0, len(products), batch_size):
+        ProductRecommendation.objects.filter(product_id__in=products[start:start + batch_size], section=section).delete()
+    ProductRecommendation.objects.bulk_create(rows, batch_size=batch_size)
+
+
+def run(rebuild=False, k=ProductRecommendation.LIMIT, min_count=2, batch_size=5000):
+    """
+    Add the orders placed since the last run (every order with rebuild),
+    take out the counted ones cancelled since, and refresh the
+    bought_together lists they affect. Returns (orders added and taken out,
+    products re-ranked).
+    """
+    until = timezone.now() - SETTLE_TIME
+    with transaction.atomic():
+        watermark, created = JobWatermark.objects.select_for_update().get_or_create(name=JOB_NAME)
+        if rebuild:
+            ProductPairCount.objects.all().delete()
+            ProductRecommendation.objects.filter(section=ProductRecommendation.BOUGHT_TOGETHER).delete()
+            watermark.position = None
+
+        added = OrderItem.objects.filter(Order.counted_at(until, prefix='order__'))
+        cancelled = OrderItem.objects.none()
+        if watermark.position is not None:
+            added = added.filter(order__created_at__gt=watermark.position)
+            cancelled = OrderItem.objects.filter(
+                Order.counted_at(watermark.position, prefix='order__'), order__cancelled_at__lte=until,
+            )
+        index = ProductIndex()
+        totals = stored_counts(index)
+        pairs = lambda items: items.values_list('order_id', 'product_id').iterator(chunk_size=10000)
+        matrix, orders = order_matrix(pairs(added), index)
+        removed, cancelled_orders = order_matrix(pairs(cancelled), index)
+        orders += cancelled_orders
+
+        if orders:
+            delta = resize(co_occurrence(matrix), len(index)) - resize(co_occurrence(removed), len(index))
+            totals = resize(totals, len(index)) + delta
+            write_counts(totals, delta, index, batch_size)
+            # delta is symmetric, its non-empty rows are every product the new and cancelled orders touched
+            touched = np.unique(delta.nonzero()[0])
+            write_recommendations(top_neighbours(totals, touched, k, min_count), index, batch_size)
+        else:
+            touched = []
+
+        watermark.position = until
+        watermark.save()
+    return orders, len(touched)
@@ -0,0 +1,126 @@
+import json
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import QueryDict
+from rest_framework.utils.encoders import JSONEncoder
+from outbox.dispatch import publish
+from outbox.handlers import Handler
+from .caching import shared_cache
+from .models import Product
+from .serializers import ProductSerializer, load_rating_stats
+
+# Relative URLs are rendered against this origin and swapped for the real one when served
+ORIGIN = 'http://product-document.invalid'
+
+DETAIL = 'detail'
+ITEM = 'item'
+KIND = 'shop.render_documents'
+
+
+class DocumentRequest:
+    """Stands in for the request while rendering a document: no query parameters, links under ORIGIN."""
+    method = 'GET'
+    user = AnonymousUser()
+
+    def __init__(self):
+        self.query_params = self.GET = QueryDict()
+
+    def build_absolute_uri(self, location='/'):
+        if location.startswith(('http://', 'https://')):
+            return location
+        return ORIGIN + location
+
+
+def document_key(pk, form, updated_at):
+    # updated_at moves with every row shown in the document, so a changed product is never served from an older one
+    return f"product-document:{form}:{pk}:{updated_at.isoformat()}"
+
+
+def documents_enabled(request):
+    """
+    Documents hold the full default representation as JSON, so they only
+    answer plain JSON GETs: no ?fields/?expand/?view and the JSON renderer.
+    """
+    renderer = getattr(request, 'accepted_renderer', None)
+    if renderer is None or renderer.format != 'json':
+        return False
+    return not any(name in request.query_params for name in ('fields', 'expand', 'view'))
+
+
+def build_documents(queryset):
+    """
+    Render the documents of the products of queryset in one batch, store
+    them under their updated_at and return {pk: {DETAIL: json, ITEM: json}}.
+    """
+    request = DocumentRequest()
+    products = list(ProductSerializer.setup_query(queryset, None))
+    # Loaded once with the reviews, so the item form (without them) and the detail form share it
+    load_rating_stats(products, include_reviews=True)
+    items = ProductSerializer(products, many=True, context={'request': request}).data
+    documents = {}
+    for product, item in zip(products, items):
+        detail = ProductSerializer(product, context={'request': request}).data
+        documents[product.pk] = {
+            DETAIL: json.dumps(detail, cls=JSONEncoder),
+            ITEM: json.dumps(item, cls=JSONEncoder),
+        }
+    cache.set_many({
+        document_key(product.pk, form, product.updated_at): documents[product.pk][form]
+        for product in products
+        for form in (DETAIL, ITEM)
+    }, settings.PRODUCT_DOCUMENT_TIMEOUT)
+    return documents
+
+
+def refresh_documents(**filters):
+    """
+    Queue the rendering of the documents of the matching products, in the
+    transaction of the write that changed them. Readers never see the old
+    documents once updated_at moved, this only spares the next one the
+    rendering. Pointless with a per-process cache, the outbox worker's
+    documents would never reach the web workers.
+    """
+    if shared_cache():
+        publish(KIND, {'filters': filters})
+
+
+def get_documents(pks, form, request, versions=None):
+    """
+    Parsed documents for pks in order, fetched with a single multi-get.
+    versions ({pk: updated_at}) is looked up when not given. Misses are
+    rendered in one batch and stored; products that don't exist are left
+    out.
+    """
+    if versions is None:
+        versions = dict(Product.objects.filter(pk__in=pks).values_list('pk', 'updated_at'))
+    keys = {document_key(pk, form, versions[pk]): pk for pk in pks if pk in versions}
+    found = {keys[key]: body for key, body in cache.get_many(keys).items()}
+    missing = [pk for pk in keys.values() if pk not in found]
+    if missing:
+        found.update({pk: forms[form] for pk, forms in build_documents(Product.objects.filter(pk__in=missing)).items()})
+    origin = request.build_absolute_uri('/')[:-1]
+    return [json.loads(found[pk].replace(ORIGIN, origin)) for pk in pks if pk in found]
+
+
+def get_document(pk, request, updated_at=None):
+    documents = get_documents([pk], DETAIL, request, {pk: updated_at} if updated_at else None)
+    return documents[0] if documents else None
+
+
+class DocumentHandler(Handler):
+    """Renders the documents queued by refresh_documents, a whole batch of writes in one go."""
+    kind = KIND
+    batch_size = 100
+    concurrency = 200
+
+    def handle_batch(self, messages):
+        condition = Q(pk__in=[])
+        for message in messages:
+            condition |= Q(**message.payload['filters'])
+        try:
+            build_documents(Product.objects.filter(condition))
+        except Exception as e:
+            return {message.pk: e for message in messages}
+        return {message.pk: None for message in messages}
@@ -0,0 +1,147 @@
+"""
+Facebook page announcements of new products.
+
+Creating a product publishes a 'facebook.product_post' outbox message in
+the same transaction; the outbox worker delivers it through one pooled HTTP
+session (see shop.outbox_handlers). Failures are classified from the Graph
+API response:
+
+  throttled (HTTP 429 or a rate limit error code) - the kind is paused
+      until the limit resets, the post keeps its attempt
+  transient (timeouts, connection errors, 5xx)    - retried with backoff
+  anything else (bad token, missing permission)   - dead-lettered at once
+
+The usage headers Graph sends back on every response also pause the kind
+before the hard limit is reached. Bulk imports run inside suppress_posts()
+and queue nothing.
+"""
+import contextvars
+import json
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from outbox.dispatch import publish as publish_message
+
+KIND = 'facebook.product_post'
+
+# (connect, read) seconds
+TIMEOUT = (3.05, 10)
+# Graph API throttling error codes (application, user, page and custom level limits)
+RATE_LIMIT_CODES = {4, 17, 32, 613, 80001}
+# Percentage of a usage header above which workers slow down, and for how long
+USAGE_THRESHOLD = 90
+USAGE_PAUSE = 60
+# Pause after a throttling error that says nothing about when to come back
+RATE_LIMIT_PAUSE = 15 * 60
+
+_suppressed = contextvars.ContextVar('facebook_posts_suppressed', default=False)
+_session = None
+
+
+class GraphError(Exception):
+    pass
+
+
+class TransientError(GraphError):
+    pass
+
+
+class RateLimited(GraphError):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@contextmanager
+def suppress_posts():
+    """Products created inside this block are not announced (bulk imports)."""
+    token = _suppressed.set(True)
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
+
+
+def configured():
+    return bool(settings.FACEBOOK_PAGE_ID and settings.FACEBOOK_PAGE_ACCESS_TOKEN)
+
+
+def enqueue_product_post(product):
+    """Queue the announcement of a new product, in the transaction creating it."""
+    if _suppressed.get() or not configured():
+        return
+    message = (
+        f"The wait is now over for {product.name}. The product is now available on our website. "
+        f"Click below to check it out now!"
+    )
+    link = settings.FACEBOOK_PRODUCT_URL.format(product_id=product.product_id)
+    publish_message(KIND, {'product_id': product.pk, 'message': message, 'link': link})
+
+
+def get_session():
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _session = session
+    return _session
+
+
+def read_usage(response, header):
+    try:
+        return json.loads(response.headers.get(header) or '{}')
+    except ValueError:
+        return {}
+
+
+def usage_pause(response):
+    """Seconds to hold off according to the usage headers of response, 0 while well under the limits."""
+    pause = 0
+    for header in ('X-App-Usage', 'X-Page-Usage'):
+        usage = read_usage(response, header)
+        if any(isinstance(value, (int, float)) and value >= USAGE_THRESHOLD for value in usage.values()):
+            pause = USAGE_PAUSE
+    for entries in read_usage(response, 'X-Business-Use-Case-Usage').values():
+        for entry in entries if isinstance(entries, list) else []:
+            minutes = entry.get('estimated_time_to_regain_access') or 0
+            pause = max(pause, minutes * 60)
+    return pause
+
+
+def retry_after(response):
+    try:
+        return int(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return None
+
+
+def publish(message, link):
+    """
+    Post to the page feed. Returns (post id, seconds to pause the kind for
+    according to the usage headers), raising GraphError on failure.
+    """
+    url = f"{settings.FACEBOOK_GRAPH_URL.rstrip('/')}/{settings.FACEBOOK_PAGE_ID}/feed"
+    data = {'message': message, 'link': link, 'access_token': settings.FACEBOOK_PAGE_ACCESS_TOKEN}
+    try:
+        response = get_session().post(url, data=data, timeout=TIMEOUT)
+    except requests.RequestException as e:
+        raise TransientError(f"{type(e).__name__}: {e}")
+
+    pause = usage_pause(response)
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+    if response.ok and body.get('id'):
+        return body['id'], pause
+
+    error = body.get('error') or {}
+    description = f"HTTP {response.status_code}: {error.get('message') or response.text[:200]}"
+    if response.status_code == 429 or error.get('code') in RATE_LIMIT_CODES:
+        raise RateLimited(description, retry_after(response) or pause or RATE_LIMIT_PAUSE)
+    if response.status_code >= 500 or error.get('is_transient'):
+        raise TransientError(description)
+    raise GraphError(description)
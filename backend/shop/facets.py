@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.db.models import Count, Q
+
+RATING_BUCKETS = (4, 3, 2, 1)
+
+
+def price_buckets():
+    """[(low, high), ...] ranges from CATALOG_PRICE_BUCKETS edges, high is None for the last one."""
+    edges = [0] + list(settings.CATALOG_PRICE_BUCKETS)
+    return list(zip(edges, edges[1:] + [None]))
+
+
+def product_facets(queryset):
+    """
+    Facet counts of queryset in three grouped queries: one conditional
+    aggregate for the total, price, rating and stock buckets, and one
+    GROUP BY each for brands and sub-categories.
+    """
+    queryset = queryset.order_by()
+    buckets = price_buckets()
+    aggregates = {'total': Count('pk'), 'in_stock': Count('pk', filter=Q(in_stock=True))}
+    for i, (low, high) in enumerate(buckets):
+        condition = Q(price__gte=low) if high is None else Q(price__gte=low, price__lt=high)
+        aggregates[f'price_{i}'] = Count('pk', filter=condition)
+    for stars in RATING_BUCKETS:
+        aggregates[f'rating_{stars}'] = Count('pk', filter=Q(card_rating__gte=stars))
+    totals = queryset.aggregate(**aggregates)
+
+    brands = (
+        queryset.exclude(card_brand='')
+        .values('card_brand')
+        .annotate(count=Count('pk'))
+        .order_by('-count', 'card_brand')
+    )
+    sub_categories = (
+        queryset.filter(sub_category__isnull=False)
+        .values('sub_category_id', 'sub_category__name')
+        .annotate(count=Count('pk'))
+        .order_by('-count', 'sub_category__name')
+    )
+    return {
+        'count': totals['total'],
+        'brands': [{'name': row['card_brand'], 'count': row['count']} for row in brands],
+        'sub_categories': [
+            {'id': row['sub_category_id'], 'name': row['sub_category__name'], 'count': row['count']}
+            for row in sub_categories
+        ],
+        'price': [
+            {'min': low, 'max': high, 'count': totals[f'price_{i}']}
+            for i, (low, high) in enumerate(buckets)
+        ],
+        'rating': [{'min': stars, 'count': totals[f'rating_{stars}']} for stars in RATING_BUCKETS],
+        'in_stock': totals['in_stock'],
+    }
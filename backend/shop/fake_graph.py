@@ -0,0 +1,94 @@
+"""
+Local stand-in for the Graph API page feed, for tests and development.
+Point FACEBOOK_GRAPH_URL at it (the fake_graph_api command runs one).
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class FakeGraphServer:
+    """
+    POST /<page_id>/feed answers {"id": "<page_id>_<n>"} and keeps the
+    posted form in posts. Every fail_every-th request answers a 500 and
+    every rate_limit_every-th a Graph throttling error (code 4, with
+    Retry-After); usage is reported as the X-App-Usage percentage and
+    delay slows every answer down.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, fail_every=0, rate_limit_every=0, usage=0, delay=0):
+        self.fail_every = fail_every
+        self.rate_limit_every = rate_limit_every
+        self.usage = usage
+        self.delay = delay
+        self.posts = []
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self.handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                form = {name: values[-1] for name, values in parse_qs(self.rfile.read(length).decode()).items()}
+                status, body, headers = fake.answer(self.path, form)
+                if fake.delay:
+                    time.sleep(fake.delay)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.send_header('X-App-Usage', json.dumps({'call_count': fake.usage, 'total_time': 0, 'total_cputime': 0}))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def answer(self, path, form):
+        parts = path.strip('/').split('/')
+        with self._lock:
+            self.requests += 1
+            number = self.requests
+            if len(parts) != 2 or parts[1] != 'feed':
+                return 404, {'error': {'message': 'Unknown path', 'code': 803}}, {}
+            if not form.get('access_token'):
+                return 400, {'error': {'message': 'An access token is required', 'code': 104}}, {}
+            if self.rate_limit_every and number % self.rate_limit_every == 0:
+                return 400, {'error': {'message': 'Application request limit reached', 'code': 4}}, {'Retry-After': '1'}
+            if self.fail_every and number % self.fail_every == 0:
+                return 500, {'error': {'message': 'An unexpected error has occurred', 'code': 2, 'is_transient': True}}, {}
+            self.posts.append(form)
+            return 200, {'id': f"{parts[0]}_{len(self.posts)}"}, {}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,175 @@
+"""
+Stock reservations: taking SizeColorStock units for an order without
+overselling.
+
+reserve() decrements every stock row an order needs with one conditional
+UPDATE (stock = stock - n WHERE stock >= n, n per row), inside a savepoint:
+unless every row matched, nothing is taken. The database serialises
+concurrent updates of a row and re-checks the condition against the
+committed value, so two checkouts can never both take the last unit, and a
+checkout never waits on anything but the rows it needs.
+
+Each row taken is recorded as a held StockReservation. Cancelling the order
+releases it (the units go back); dispatching the order commits it. A
+reservation made for a payment still pending expires: release_expired()
+(run by the outbox when the reservation is due, and by the
+release_expired_reservations command) gives the units back and cancels
+the order.
+
+Products without any stock rows are not stock-managed and are not
+reserved.
+"""
+from collections import Counter
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from cart.models import Order
+from outbox.dispatch import publish
+from .caching import CATALOG, bump_namespaces
+from .documents import refresh_documents
+from .models import Product, SizeColorStock, StockReservation
+
+EXPIRE_KIND = 'shop.expire_reservations'
+# Order statuses that make the reservations of an order final
+FULFILLED = ('Dispatched', 'Cleared')
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def per_row(quantities):
+    """SQL expression of quantities ({stock pk: n}) for the row being updated."""
+    return Case(*[When(pk=pk, then=Value(n)) for pk, n in quantities.items()], output_field=IntegerField())
+
+
+def describe(rows):
+    return ', '.join(
+        f"{row.product.name} ({row.size.name}{', ' + row.color.name if row.color else ''})" for row in rows
+    )
+
+
+def stock_changed(stock_ids):
+    """
+    What the SizeColorStock signals do after a save, for rows written with
+    update(): the product rollup, its ETag and its cached documents.
+    """
+    product_ids = list(SizeColorStock.objects.filter(pk__in=stock_ids).values_list('product_id', flat=True).distinct())
+    in_stock = lambda: set(Product.objects.filter(pk__in=product_ids, in_stock=True).values_list('pk', flat=True))
+    before = in_stock()
+    Product.refresh_stock(product_ids)
+    Product.objects.filter(pk__in=product_ids).update(updated_at=timezone.now())
+    namespaces = [f'product:{pk}' for pk in product_ids]
+    # Listings only show whether a product is in stock, they change when one sells out or comes back
+    if in_stock() != before:
+        namespaces.append(CATALOG)
+    transaction.on_commit(lambda: bump_namespaces(namespaces))
+    refresh_documents(pk__in=product_ids)
+
+
+def requirements(items):
+    """
+    {stock row pk: units} needed by items (order items, saved or not).
+    Raises OutOfStock for a line of a stock-managed product whose size and
+    color have no stock row.
+    """
+    rows = {
+        (product_id, size_id, color_id): pk
+        for pk, product_id, size_id, color_id in SizeColorStock.objects.filter(
+            product__in={item.product_id for item in items},
+        ).values_list('pk', 'product_id', 'size_id', 'color_id')
+    }
+    managed = {product_id for product_id, size_id, color_id in rows}
+    wanted = Counter()
+    for item in items:
+        if item.product_id not in managed:
+            continue
+        pk = rows.get((item.product_id, item.size_id, item.color_id))
+        if pk is None:
+            raise OutOfStock(f"{item.product.name} is not available in this size and color")
+        wanted[pk] += int(item.quantity)
+    return wanted
+
+
+def check(wanted):
+    """
+    Raise OutOfStock naming the rows that have fewer units than wanted.
+    Only a hint, the stock can go in the meantime: reserve() is what
+    guarantees it.
+    """
+    short = [
+        row for row in SizeColorStock.objects.filter(pk__in=wanted).select_related('product', 'size', 'color')
+        if row.stock < wanted[row.pk]
+    ]
+    if short:
+        raise OutOfStock(f"Not enough stock for {describe(short)}")
+
+
+def reserve(order, wanted, expires_in=None):
+    """
+    Take wanted (see requirements) for order and record it as held
+    reservations, expiring after expires_in (a timedelta) if given. Raises
+    OutOfStock, having taken nothing, unless every row has enough units.
+    """
+    if not wanted:
+        return []
+    with transaction.atomic():
+        taken = SizeColorStock.objects.filter(pk__in=wanted, stock__gte=per_row(wanted)).update(
+            stock=F('stock') - per_row(wanted),
+        )
+        if taken == len(wanted):
+            expires_at = timezone.now() + expires_in if expires_in else None
+            reservations = StockReservation.objects.bulk_create(
+                StockReservation(order=order, stock_id=pk, quantity=quantity, expires_at=expires_at)
+                for pk, quantity in wanted.items()
+            )
+            stock_changed(wanted)
+            if expires_in:
+                publish(EXPIRE_KIND, {'order_id': str(order.pk)}, delay=expires_in)
+            return reservations
+        transaction.set_rollback(True)
+    check(wanted)
+    raise OutOfStock("Not enough stock for this order")
+
+
+def release(order_ids):
+    """Give back the units of the held reservations of order_ids. Returns the ids of the orders released."""
+    with transaction.atomic():
+        held = list(
+            StockReservation.objects.select_for_update()
+            .filter(order_id__in=order_ids, status=StockReservation.HELD)
+            .values_list('pk', 'order_id', 'stock_id', 'quantity')
+        )
+        if not held:
+            return set()
+        returned = Counter()
+        for pk, order_id, stock_id, quantity in held:
+            returned[stock_id] += quantity
+        SizeColorStock.objects.filter(pk__in=returned).update(stock=F('stock') + per_row(returned))
+        StockReservation.objects.filter(pk__in=[row[0] for row in held]).update(status=StockReservation.RELEASED)
+        stock_changed(returned)
+    return {row[1] for row in held}
+
+
+def commit(order_ids):
+    """Make the held reservations of order_ids final."""
+    return StockReservation.objects.filter(order_id__in=order_ids, status=StockReservation.HELD).update(
+        status=StockReservation.COMMITTED, expires_at=None,
+    )
+
+
+def release_expired(order_ids=None):
+    """
+    Release the held reservations past their expiry (of order_ids only, if
+    given) and cancel their orders. Returns the number of orders cancelled.
+    """
+    expired = StockReservation.objects.filter(status=StockReservation.HELD, expires_at__lte=timezone.now())
+    if order_ids is not None:
+        expired = expired.filter(order_id__in=order_ids)
+    with transaction.atomic():
+        released = release(set(expired.values_list('order_id', flat=True)))
+        now = timezone.now()
+        return Order.objects.filter(pk__in=released).exclude(status__in=FULFILLED).update(
+            status='Cancelled', updated_at=now, cancelled_at=Coalesce('cancelled_at', Value(now)),
+        )
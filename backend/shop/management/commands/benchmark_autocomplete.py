@@ -0,0 +1,68 @@
+import random
+import string
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from shop.autocomplete import AutocompleteIndex, load_rows
+
+WORDS = [
+    'soft', 'cotton', 'baby', 'kids', 'mom', 'organic', 'winter', 'summer', 'romper', 'shirt', 'dress', 'jacket',
+    'blanket', 'bottle', 'feeding', 'maternity', 'pillow', 'stroller', 'carrier', 'socks', 'bib', 'towel', 'printed',
+]
+
+
+def synthetic_rows(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        words = rng.sample(WORDS, rng.randint(2, 5))
+        words.append(''.join(rng.choices(string.ascii_lowercase, k=5)))
+        name = ' '.join(words).title()
+        yield (f"product-{i}", name, f"shop/images/{i}.jpg", rng.randint(100, 10000))
+
+
+class Command(BaseCommand):
+    help = "Measure build time, memory and query latency of the autocomplete index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000, help="Number of synthetic products")
+        parser.add_argument('--from-db', action='store_true', help="Index the real catalog instead")
+        parser.add_argument('--queries', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if options['from_db']:
+            rows = load_rows()
+        else:
+            rows = list(synthetic_rows(options['products']))
+
+        image_url = lambda name: f"/media/{name}" if name else None
+        started = time.perf_counter()
+        index = AutocompleteIndex(rows, image_url=image_url)
+        build_seconds = time.perf_counter() - started
+        # Built a second time for the memory figures, tracemalloc slows the build down several times
+        del index
+        tracemalloc.start()
+        index = AutocompleteIndex(rows, image_url=image_url)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rng = random.Random(1)
+        queries = []
+        for _ in range(options['queries']):
+            name = rng.choice(index.keys) if len(index) else 'a'
+            start = rng.randrange(max(len(name) - 1, 1))
+            queries.append(name[start:start + rng.randint(1, 8)])
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.suggest(query)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+
+        self.stdout.write(f"products:    {len(index)}")
+        self.stdout.write(f"build:       {build_seconds:.2f}s")
+        self.stdout.write(f"memory:      {current / 2**20:.1f} MiB retained, {peak / 2**20:.1f} MiB peak")
+        self.stdout.write(
+            f"query:       mean {sum(timings) / len(timings) * 1e6:.0f}us, "
+            f"p50 {timings[len(timings) // 2] * 1e6:.0f}us, p99 {timings[int(len(timings) * 0.99)] * 1e6:.0f}us"
+        )
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,59 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from shop.similarity import feature_matrix, load_rows, top_similar
+
+ATTRIBUTES = {
+    'material': ['cotton', 'organic cotton', 'wool', 'polyester', 'bamboo', 'silicone', 'plastic'],
+    'age': ['0-3m', '3-6m', '6-12m', '1-2y', '2-4y', '4-6y', 'adult'],
+    'gender': ['boy', 'girl', 'unisex'],
+    'season': ['summer', 'winter', 'all season'],
+    'color': ['white', 'pink', 'blue', 'grey', 'green', 'yellow', 'black', 'red'],
+    'pattern': ['plain', 'striped', 'printed', 'dotted'],
+}
+
+
+def synthetic_rows(count, categories, seed=0):
+    rng = random.Random(seed)
+    products, attributes = [], []
+    for i in range(count):
+        pk = f"product-{i}"
+        category = rng.randrange(categories)
+        products.append((pk, rng.randrange(200), category, category * 10 + rng.randrange(10), int(rng.lognormvariate(7, 1))))
+        for key in rng.sample(list(ATTRIBUTES), rng.randint(2, len(ATTRIBUTES))):
+            attributes.append((pk, key, rng.choice(ATTRIBUTES[key])))
+    return products, attributes
+
+
+class Command(BaseCommand):
+    help = "Measure encoding and top-K time of the similar products job"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000, help="Number of synthetic products")
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--from-db', action='store_true', help="Use the real catalog instead")
+        parser.add_argument('--top', type=int, default=12)
+
+    def handle(self, *args, **options):
+        if options['from_db']:
+            products, attributes = load_rows()
+            attributes = list(attributes)
+        else:
+            products, attributes = synthetic_rows(options['products'], options['categories'])
+
+        started = time.perf_counter()
+        keys, groups, matrix = feature_matrix(products, attributes)
+        encode_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        pairs = 0
+        for row, ranked in top_similar(matrix, groups, options['top']):
+            pairs += len(ranked)
+        search_seconds = time.perf_counter() - started
+
+        self.stdout.write(f"products:    {len(keys)}")
+        self.stdout.write(f"features:    {matrix.shape[1]} ({matrix.nnz} non-zero)")
+        self.stdout.write(f"encode:      {encode_seconds:.2f}s")
+        self.stdout.write(f"top-{options['top']}:      {search_seconds:.2f}s ({len(keys) / search_seconds:.0f} products/s)")
+        self.stdout.write(f"neighbours:  {pairs}")
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from shop.fake_graph import FakeGraphServer
+
+
+class Command(BaseCommand):
+    help = "Serve a fake Graph API page feed for local testing (set FACEBOOK_GRAPH_URL to its URL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--fail-every', type=int, default=0, help="Answer every nth request with a 500")
+        parser.add_argument('--rate-limit-every', type=int, default=0, help="Throttle every nth request")
+        parser.add_argument('--usage', type=int, default=0, help="X-App-Usage call_count percentage to report")
+        parser.add_argument('--delay', type=float, default=0, help="Seconds to wait before answering")
+
+    def handle(self, *args, **options):
+        server = FakeGraphServer(
+            port=options['port'], fail_every=options['fail_every'], rate_limit_every=options['rate_limit_every'],
+            usage=options['usage'], delay=options['delay'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Fake Graph API on {server.url}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Received {len(server.posts)} posts")
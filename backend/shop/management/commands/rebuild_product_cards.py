@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized card_* columns of every product"
+
+    def handle(self, *args, **options):
+        total = Product.refresh_cards()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the card columns of {total} products"))
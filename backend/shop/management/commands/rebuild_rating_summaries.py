@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from shop.models import ProductRatingSummary
+
+
+class Command(BaseCommand):
+    help = "Recompute the ProductRatingSummary row of every product from its ratings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = ProductRatingSummary.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating summaries for {total} products"))
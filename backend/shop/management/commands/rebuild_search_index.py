@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from shop.search import create_search_index, index_products, search_backend
+
+
+class Command(BaseCommand):
+    help = "Create the product full-text search table if needed and reindex every product"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if search_backend() is None:
+            self.stdout.write(self.style.WARNING("This database has no supported full-text engine, search uses icontains"))
+            return
+        create_search_index()
+        total = index_products(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} products"))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum, Q, Count
+from shop.models import Product, SizeColorStock
+
+
+class Command(BaseCommand):
+    help = "Compare Product.total_stock/in_stock with the SizeColorStock rows and optionally fix drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Rewrite the rollup of drifted products")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        actual = {
+            row['product_id']: (row['total'] or 0, row['available'] > 0)
+            for row in SizeColorStock.objects.values('product_id').annotate(
+                total=Sum('stock'), available=Count('id', filter=Q(stock__gt=0))
+            ).order_by()
+        }
+        drifted = []
+        for product_id, total_stock, in_stock in Product.objects.values_list('product_id', 'total_stock', 'in_stock').iterator():
+            expected = actual.get(product_id, (0, False))
+            if (total_stock, in_stock) != expected:
+                drifted.append(product_id)
+                self.stdout.write(f"{product_id}: stored {total_stock}/{in_stock}, actual {expected[0]}/{expected[1]}")
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Stock rollup is in sync"))
+            return
+        if not options['fix']:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} products drifted, run with --fix to repair"))
+            return
+        batch_size = options['batch_size']
+        fixed = 0
+        for start in range(0, len(drifted), batch_size):
+            fixed += Product.refresh_stock(drifted[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(f"Fixed the stock rollup of {fixed} products"))
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from shop import copurchase
+from shop.caching import CATALOG, bump_namespaces
+
+
+class Command(BaseCommand):
+    help = "Add new orders to the co-purchase counts and refresh the 'frequently bought together' lists"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Recount every order from scratch")
+        parser.add_argument('--top', type=int, default=12, help="Neighbours kept per product")
+        parser.add_argument('--min-count', type=int, default=2, help="Orders a pair needs in common to be recommended")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        orders, products = copurchase.run(
+            rebuild=options['rebuild'], k=options['top'], min_count=options['min_count'], batch_size=options['batch_size'],
+        )
+        if products:
+            bump_namespaces([CATALOG])
+        self.stdout.write(self.style.SUCCESS(
+            f"Counted {orders} orders and re-ranked {products} products in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from shop import ranking
+from shop.caching import CATALOG, bump_namespaces
+
+
+class Command(BaseCommand):
+    help = "Add new orders and cart additions to the trending and best seller scores"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Recompute the scores from all the history")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        events, products = ranking.run(rebuild=options['rebuild'], batch_size=options['batch_size'])
+        # Tagged lists and trending recommendations are cached under the catalog version
+        bump_namespaces([CATALOG])
+        self.stdout.write(self.style.SUCCESS(
+            f"Ranked {events} orders and cart additions over {products} products in {time.perf_counter() - started:.1f}s"
+        ))
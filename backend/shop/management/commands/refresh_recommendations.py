@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from shop.caching import CATALOG, bump_namespaces
+from shop.models import Product, ProductRecommendation
+
+
+class Command(BaseCommand):
+    help = "Recompute the precomputed recommendation lists (same category, complementary, trending) in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--product', action='append', dest='products', help="Only refresh this product id (repeatable)")
+
+    def handle(self, *args, **options):
+        products = Product.objects.filter(pk__in=options['products']) if options['products'] else None
+        total = ProductRecommendation.refresh(products, batch_size=options['batch_size'])
+        # Cached recommendation responses follow the catalog version
+        bump_namespaces([CATALOG])
+        self.stdout.write(self.style.SUCCESS(f"Refreshed the recommendations of {total} products"))
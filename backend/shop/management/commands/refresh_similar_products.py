@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from shop import similarity
+from shop.caching import CATALOG, bump_namespaces
+
+
+class Command(BaseCommand):
+    help = "Recompute the content-based 'similar products' lists from brand, category, attributes and price"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=12, help="Neighbours kept per product")
+        parser.add_argument('--min-score', type=float, default=0.1, help="Lowest cosine similarity recommended")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = similarity.run(k=options['top'], min_score=options['min_score'], batch_size=options['batch_size'])
+        bump_namespaces([CATALOG])
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed the similar products of {total} products in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from shop.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = "Give back the stock held for orders whose payment did not arrive in time, cancelling them"
+
+    def handle(self, *args, **options):
+        cancelled = release_expired()
+        self.stdout.write(self.style.SUCCESS(f"Cancelled {cancelled} orders with expired reservations"))
@@ -1,11 +1,12 @@
 import sys
-from django.db import models
+from django.db import models, transaction
 from userauth.models import User
 import uuid
 from datetime import date
 from django.conf import settings
 from django.utils import timezone
-from django.db.models import Avg
+from django.db.models import Count, Sum, Q, OuterRef, Subquery, Exists, Value, Case, When
+from django.db.models.functions import Coalesce
 from django.utils.text import slugify
 from ckeditor.fields import RichTextField
 
@@ -26,13 +27,57 @@ class Product(models.Model):
     description= RichTextField()
     meta_description = models.TextField(blank=True)
     meta_keywords = models.TextField(blank=True)
-    published_date = models.DateField(default=date.today)
+    published_date = models.DateField(default=date.today, db_index=True)
+    # Manual overrides: flagged products head the computed rankings (see shop.ranking)
     trending = models.BooleanField(default=False)
     best_seller = models.BooleanField(default=False)
     featured = models.BooleanField(default=False)
+    # Rollup of SizeColorStock, maintained by the stock signals (see refresh_stock)
+    total_stock = models.PositiveIntegerField(default=0, editable=False)
+    in_stock = models.BooleanField(default=False, db_index=True, editable=False)
+    # Copies of related data for the card payload, so grids need no joins (see refresh_cards)
+    card_image = models.CharField(max_length=255, blank=True, default='', editable=False)
+    card_brand = models.CharField(max_length=50, blank=True, default='', editable=False)
+    card_category = models.CharField(max_length=50, blank=True, default='', editable=False)
+    card_rating = models.FloatField(default=0, editable=False)
+    # Bumped on save and by the signals whenever a row shown with the product changes (ETag/Last-Modified)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
+
+    @classmethod
+    def refresh_stock(cls, product_ids):
+        """Recompute total_stock/in_stock of the given products with a single UPDATE."""
+        stocks = SizeColorStock.objects.filter(product=OuterRef('pk'))
+        total = stocks.order_by().values('product').annotate(total=Sum('stock')).values('total')
+        return cls.objects.filter(pk__in=product_ids).update(
+            total_stock=Coalesce(Subquery(total), Value(0)),
+            in_stock=Exists(stocks.filter(stock__gt=0)),
+        )
+
+    @classmethod
+    def refresh_cards(cls, **filters):
+        """Recompute the card_* columns of the matching products with a single UPDATE."""
+        first_image = ProductImage.objects.filter(product=OuterRef('pk')).order_by('id').values('image')[:1]
+        brand = Brand.objects.filter(pk=OuterRef('brand_id')).values('name')[:1]
+        category = Category.objects.filter(pk=OuterRef('category_id')).values('name')[:1]
+        rating = ProductRatingSummary.objects.filter(product=OuterRef('pk')).values('average')[:1]
+        return cls.objects.filter(**filters).update(
+            card_image=Coalesce(Subquery(first_image), Value('')),
+            card_brand=Coalesce(Subquery(brand), Value('')),
+            card_category=Coalesce(Subquery(category), Value('')),
+            card_rating=Coalesce(Subquery(rating), Value(0.0)),
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'brand_id' in instance.__dict__ and 'category_id' in instance.__dict__:
+            # What card_brand/card_category were copied from, so save() only looks the names up again on a change
+            instance._card_source = (instance.brand_id, instance.category_id)
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.product_id:
             # Use seo_friendly_name if it exists, otherwise use name
@@ -43,7 +88,11 @@ class Product(models.Model):
             while Product.objects.filter(product_id=self.product_id).exists():
                 self.product_id = f"{original_id}-{num}"
                 num += 1
+        if getattr(self, '_card_source', None) != (self.brand_id, self.category_id):
+            self.card_brand = self.brand.name if self.brand else ''
+            self.card_category = self.category.name if self.category else ''
         super().save(*args, **kwargs)
+        self._card_source = (self.brand_id, self.category_id)
 
 class Color(models.Model):
     name = models.CharField(max_length=50)
@@ -85,6 +134,33 @@ class SizeColorStock(models.Model):
         color_name = self.color.name if self.color else 'No Color'
         return f"{self.product.name} - {self.size.name} - {color_name} ({self.stock})"
 
+
+class StockReservation(models.Model):
+    """
+    Units of a stock row taken by an order (see shop.inventory). The stock
+    is decremented when the reservation is made; a held reservation gives it
+    back when released (order cancelled, or unpaid by expires_at) and
+    becomes permanent once committed (order dispatched).
+    """
+    HELD = 'held'
+    COMMITTED = 'committed'
+    RELEASED = 'released'
+    STATUS_CHOICES = [(HELD, 'Held'), (COMMITTED, 'Committed'), (RELEASED, 'Released')]
+
+    order = models.ForeignKey('cart.Order', on_delete=models.CASCADE, related_name='stock_reservations')
+    stock = models.ForeignKey(SizeColorStock, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    # None: held until the order is dispatched or cancelled (cash on delivery)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'expires_at'])]
+
+    def __str__(self):
+        return f"{self.order_id}: {self.quantity} x {self.stock_id} ({self.status})"
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name="images", on_delete=models.CASCADE)
     image = models.ImageField(upload_to='shop/images', default='')
@@ -112,6 +188,238 @@ class Rating(models.Model):
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
 
+class ProductRatingSummary(models.Model):
+    """Denormalized rating stats per product, kept in sync by the Rating signals."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='rating_summary')
+    count = models.PositiveIntegerField(default=0, db_index=True)
+    total = models.PositiveIntegerField(default=0)
+    star_1 = models.PositiveIntegerField(default=0)
+    star_2 = models.PositiveIntegerField(default=0)
+    star_3 = models.PositiveIntegerField(default=0)
+    star_4 = models.PositiveIntegerField(default=0)
+    star_5 = models.PositiveIntegerField(default=0)
+    # total / count, unrounded so ordering and min_rating see the exact mean (the serializers round it)
+    average = models.FloatField(default=0, db_index=True)
+
+    def __str__(self):
+        return f"{self.product_id} - {self.average} ({self.count})"
+
+    @property
+    def rating_dict(self):
+        return {1: self.star_1, 2: self.star_2, 3: self.star_3, 4: self.star_4, 5: self.star_5}
+
+    @staticmethod
+    def aggregates():
+        stars = {f'star_{i}': Count('id', filter=Q(rating=i)) for i in range(1, 6)}
+        return dict(count=Count('id'), total=Sum('rating'), **stars)
+
+    @staticmethod
+    def values_from(row):
+        values = {key: row.get(key) or 0 for key in ['count', 'total', 'star_1', 'star_2', 'star_3', 'star_4', 'star_5']}
+        values['average'] = values['total'] / values['count'] if values['count'] else 0
+        return values
+
+    @classmethod
+    def refresh(cls, product_id, create=True):
+        """Recompute the summary of one product. Only touches that product's ratings."""
+        values = cls.values_from(Rating.objects.filter(product_id=product_id).aggregate(**cls.aggregates()))
+        updated = cls.objects.filter(product_id=product_id).update(**values)
+        Product.objects.filter(pk=product_id).update(card_rating=values['average'])
+        # post_delete runs while a product is being deleted too, so only create the row on saves
+        if not updated and create:
+            cls.objects.update_or_create(product_id=product_id, defaults=values)
+
+    @classmethod
+    def rebuild(cls, batch_size=1000):
+        """Recompute every summary with one grouped query. Returns the number of products."""
+        rows = Rating.objects.values('product_id').annotate(**cls.aggregates()).order_by()
+        rated = {row['product_id']: cls.values_from(row) for row in rows}
+        empty = cls.values_from({})
+        summaries = [
+            cls(product_id=product_id, **rated.get(product_id, empty))
+            for product_id in Product.objects.values_list('product_id', flat=True)
+        ]
+        fields = list(empty.keys())
+        cls.objects.bulk_create(summaries, batch_size=batch_size, update_conflicts=True,
+                                unique_fields=['product'], update_fields=fields)
+        average = cls.objects.filter(product=OuterRef('pk')).values('average')[:1]
+        Product.objects.update(card_rating=Coalesce(Subquery(average), Value(0.0)))
+        return len(summaries)
+
+
+
+class ProductRecommendation(models.Model):
+    """
+    Precomputed recommendation lists, one row per (product, section, rank).
+    The heuristic sections are rebuilt in batches by the
+    refresh_recommendations command (products without rows yet get theirs
+    computed on the fly), bought_together by the co-purchase job and similar
+    by the content similarity job.
+    """
+    SAME_CATEGORY = 'same_category'
+    COMPLEMENTARY = 'complementary'
+    TRENDING = 'trending'
+    BOUGHT_TOGETHER = 'bought_together'
+    SIMILAR = 'similar'
+    SECTIONS = [
+        (SAME_CATEGORY, 'Same category'),
+        (COMPLEMENTARY, 'Complementary'),
+        (TRENDING, 'Trending'),
+        (BOUGHT_TOGETHER, 'Frequently bought together'),
+        (SIMILAR, 'Similar products'),
+    ]
+    # Computed by refresh(); the others come from their own offline jobs
+    HEURISTIC_SECTIONS = [SAME_CATEGORY, COMPLEMENTARY, TRENDING]
+    LIMIT = 12
+
+    # Complementary category mappings for cross-sells
+    COMPLEMENTARY_CATEGORIES = {
+        'moms': ['babies', 'kids', 'nursing'],
+        'babies': ['moms', 'clothing', 'toys'],
+    }
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    section = models.CharField(max_length=20, choices=SECTIONS)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'section', 'rank')
+        ordering = ['product', 'section', 'rank']
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id} ({self.section} #{self.rank})"
+
+    @staticmethod
+    def priority_score():
+        """Merchandising priority as SQL: trending=4, featured=3, best_seller=2, deal=1."""
+        weights = {'trending': 4, 'featured': 3, 'best_seller': 2, 'deal': 1}
+        terms = [Case(When(**{flag: True}, then=Value(weight)), default=Value(0)) for flag, weight in weights.items()]
+        return sum(terms[1:], terms[0])
+
+    @classmethod
+    def complementary_categories(cls, category_name):
+        """Ids of the categories cross-sold with category_name (matched on name fragments)."""
+        category_name = (category_name or '').lower()
+        for key, values in cls.COMPLEMENTARY_CATEGORIES.items():
+            if key in category_name:
+                return list(Category.objects.filter(name__iregex=r'(' + '|'.join(values) + ')').values_list('pk', flat=True))
+        return []
+
+    @classmethod
+    def compute(cls, product, complementary_ids=None):
+        """
+        {section: [(recommended_id, score), ...]} for product, each section
+        one ORDER BY score LIMIT query. Trending fills up to LIMIT in total.
+        """
+        candidates = Product.objects.exclude(pk=product.pk).annotate(score=cls.priority_score())
+        ordered = lambda queryset, limit: list(
+            queryset.order_by('-score', '-published_date', 'pk').values_list('pk', 'score')[:limit]
+        )
+        sections = {cls.SAME_CATEGORY: [], cls.COMPLEMENTARY: [], cls.TRENDING: []}
+        if product.category_id:
+            sections[cls.SAME_CATEGORY] = ordered(candidates.filter(category_id=product.category_id), cls.LIMIT)
+        if complementary_ids is None:
+            complementary_ids = cls.complementary_categories(product.category.name if product.category_id else '')
+        if complementary_ids:
+            sections[cls.COMPLEMENTARY] = ordered(candidates.filter(category_id__in=complementary_ids), cls.LIMIT)
+        needed = cls.LIMIT - len(sections[cls.SAME_CATEGORY]) - len(sections[cls.COMPLEMENTARY])
+        if needed > 0:
+            from .ranking import ranked_products
+            trending = ranked_products('trending', candidates).order_by('-trending', '-rank_score', '-published_date')
+            sections[cls.TRENDING] = list(trending.values_list('pk', 'score')[:needed])
+        return sections
+
+    @classmethod
+    def rows_for(cls, product, sections):
+        return [
+            cls(product=product, recommended_id=pk, section=section, rank=rank, score=score)
+            for section, recommended in sections.items()
+            for rank, (pk, score) in enumerate(recommended)
+        ]
+
+    @classmethod
+    def refresh(cls, products=None, batch_size=200, sections=None):
+        """
+        Recompute the lists of products (default: all) in batches, each batch
+        replaced in its own transaction. Only the given sections are touched
+        (default: the ones computed here). Returns the number of products.
+        """
+        sections = sections or cls.HEURISTIC_SECTIONS
+        products = (products if products is not None else Product.objects.all()).select_related('category').order_by('pk')
+        complementary = {}
+        total = 0
+        batch = []
+
+        def flush():
+            rows = []
+            for product in batch:
+                category_name = product.category.name if product.category_id else ''
+                if category_name not in complementary:
+                    complementary[category_name] = cls.complementary_categories(category_name)
+                computed = cls.compute(product, complementary[category_name])
+                rows.extend(cls.rows_for(product, {s: computed[s] for s in sections}))
+            with transaction.atomic():
+                cls.objects.filter(product__in=batch, section__in=sections).delete()
+                cls.objects.bulk_create(rows)
+
+        for product in products.iterator(chunk_size=batch_size):
+            batch.append(product)
+            if len(batch) >= batch_size:
+                flush()
+                total += len(batch)
+                batch = []
+        if batch:
+            flush()
+            total += len(batch)
+        return total
+
+
+class ProductPairCount(models.Model):
+    """
+    Number of orders containing both products, the state the co-purchase job
+    adds new orders to. Only pairs with product_a_id <= product_b_id are
+    stored; the diagonal (a == b) holds each product's own order count.
+    """
+    product_a = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    product_b = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product_a', 'product_b')
+
+    def __str__(self):
+        return f"{self.product_a_id} + {self.product_b_id}: {self.count}"
+
+
+class JobWatermark(models.Model):
+    """How far an incremental offline job has got, by name."""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.position}"
+
+
+class ProductRanking(models.Model):
+    """
+    Time-decayed sales scores behind the trending and best seller lists,
+    maintained incrementally by the refresh_rankings job (see shop.ranking).
+    Scores are stored forward-decayed, relative to a landmark time, so new
+    activity only adds to the rows it touches and the ordering stays right
+    without rewriting every row as time passes.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='ranking')
+    trending_score = models.FloatField(default=0, db_index=True)
+    best_seller_score = models.FloatField(default=0, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.product_id}: trending {self.trending_score:g}, best seller {self.best_seller_score:g}"
+
+
 class Comment(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
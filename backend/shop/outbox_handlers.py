@@ -0,0 +1,32 @@
+import logging
+from outbox.dispatch import pause
+from outbox.handlers import Defer, Reject, handler, register
+from . import facebook, inventory
+from .documents import DocumentHandler
+
+logger = logging.getLogger(__name__)
+
+
+# One post at a time across all workers, the page feed is rate limited per page
+@handler(facebook.KIND, batch_size=10, concurrency=1)
+def post_product_to_facebook(payload):
+    try:
+        post_id, slow_down = facebook.publish(payload['message'], payload['link'])
+    except facebook.RateLimited as e:
+        raise Defer(str(e), delay=e.retry_after)
+    except facebook.TransientError:
+        raise
+    except facebook.GraphError as e:
+        raise Reject(str(e))
+    if slow_down:
+        pause(facebook.KIND, slow_down)
+    logger.info("Posted %s to Facebook as %s", payload.get('product_id'), post_id)
+
+
+@handler(inventory.EXPIRE_KIND, batch_size=100)
+def expire_reservations(payload):
+    # Released only if still held by then: a paid or dispatched order has committed them
+    inventory.release_expired([payload['order_id']])
+
+
+register(DocumentHandler())
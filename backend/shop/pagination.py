@@ -0,0 +1,309 @@
+import base64
+import datetime
+import json
+from functools import partial
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import Paginator, Page, InvalidPage, PageNotAnInteger, EmptyPage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.utils.functional import cached_property
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination, BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .caching import catalog_version, filter_key, shared_cache
+
+
+COUNT_STRATEGIES = ('exact', 'cached', 'estimate', 'none')
+
+
+def estimate_count(queryset):
+    """Row estimate from the PostgreSQL planner, None on other databases."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class UncountedPage(Page):
+    """Page of the 'none' strategy: one extra row is fetched to know whether there is a next page."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def next_page_number(self):
+        return self.number + 1
+
+
+class CatalogPaginator(Paginator):
+    """
+    Paginator with a pluggable count:
+      exact    - COUNT(*) every time
+      cached   - COUNT(*) cached under cache_key, which embeds the catalog version
+                 (shared caches only, CustomPagination counts exactly otherwise)
+      estimate - planner estimate on PostgreSQL once it is above estimate_threshold
+      none     - no count at all, only whether a next page exists
+    count_exact tells the response whether the count can be trusted.
+    """
+
+    def __init__(self, object_list, per_page, strategy='exact', cache_key=None, estimate_threshold=10000, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.strategy = strategy
+        self.cache_key = cache_key
+        self.estimate_threshold = estimate_threshold
+        self.count_exact = strategy != 'none'
+
+    @cached_property
+    def count(self):
+        if self.strategy == 'none':
+            return None
+        if self.strategy == 'estimate':
+            estimate = estimate_count(self.object_list)
+            if estimate is not None and estimate >= self.estimate_threshold:
+                self.count_exact = False
+                return estimate
+        if self.strategy == 'cached' and self.cache_key:
+            count = cache.get(self.cache_key)
+            if count is None:
+                count = super().count
+                cache.set(self.cache_key, count, settings.CATALOG_COUNT_CACHE_TIMEOUT)
+            return count
+        return super().count
+
+    @cached_property
+    def num_pages(self):
+        # unknown without a count; 0 keeps DRF's page controls check working
+        if self.strategy == 'none':
+            return 0
+        return super().num_pages
+
+    def validate_number(self, number):
+        if self.strategy != 'none':
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        if self.strategy != 'none':
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('That page contains no results')
+        return UncountedPage(rows[:self.per_page], number, self, has_next=len(rows) > self.per_page)
+
+
+class CustomPagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'count'
+
+    def get_count_strategy(self, request):
+        strategy = request.query_params.get(self.count_query_param, settings.CATALOG_COUNT_STRATEGY)
+        strategy = strategy if strategy in COUNT_STRATEGIES else settings.CATALOG_COUNT_STRATEGY
+        # A per-process cache misses the catalog version bumps of the other workers
+        return 'exact' if strategy == 'cached' and not shared_cache() else strategy
+
+    def paginate_queryset(self, queryset, request, view=None):
+        strategy = self.get_count_strategy(request)
+        cache_key = f"catalog-count:{catalog_version()}:{filter_key(request)}" if strategy == 'cached' else None
+        self.django_paginator_class = partial(
+            CatalogPaginator, strategy=strategy, cache_key=cache_key,
+            estimate_threshold=settings.CATALOG_COUNT_ESTIMATE_THRESHOLD,
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        paginator = self.page.paginator
+        count = paginator.count
+        return Response({
+            'links': {
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link()
+            },
+            'count': count,
+            'count_exact': paginator.count_exact,
+            'total_pages': paginator.num_pages if count is not None else None,
+            'current_page': self.page.number,
+            'results': data
+        })
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder rounds datetimes to milliseconds, cursors need the exact value."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def cursor_requested(request):
+    """Cursor mode is chosen with ?pagination=cursor, and stays on while following cursor links."""
+    return request.query_params.get('pagination') == 'cursor' or 'cursor' in request.query_params
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination. The cursor holds the ordering values of the
+    last (or first) row of the page, so each page is a WHERE on the ordering
+    columns plus a LIMIT: no COUNT and no OFFSET, whatever the depth.
+
+    The ordering already applied to the queryset is kept for the columns in
+    ordering_columns (public name -> column) and the primary key is always
+    appended to break ties. Columns used here must not be nullable. Any
+    other ordering (e.g. search relevance, a computed float that can't be
+    matched exactly in a cursor) is rejected with a 400: those listings
+    page by number.
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    default_ordering = ('-pk',)
+    ordering_columns = {}
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, queryset):
+        ordering = []
+        for field in queryset.query.order_by:
+            name = field.lstrip('-') if isinstance(field, str) else str(field)
+            descending = name != field
+            column = 'pk' if name == 'pk' else self.ordering_columns.get(name)
+            if column is None:
+                raise ValidationError({'ordering': f"Cursor pagination can't order by {name}, use page numbers instead."})
+            if column not in [f.lstrip('-') for f in ordering]:
+                ordering.append(f"-{column}" if descending else column)
+        if not ordering:
+            ordering = list(self.default_ordering)
+        if not any(f.lstrip('-') == 'pk' for f in ordering):
+            ordering.append('-pk' if ordering[0].startswith('-') else 'pk')
+        return ordering
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            values, reverse = cursor['v'], bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, AttributeError):
+            raise NotFound('Invalid cursor')
+        if not isinstance(values, list):
+            raise NotFound('Invalid cursor')
+        return values, reverse
+
+    def encode_cursor(self, values, reverse):
+        data = json.dumps({'v': values, 'r': int(reverse)}, cls=CursorEncoder)
+        encoded = base64.urlsafe_b64encode(data.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def keyset_filter(self, ordering, values, reverse):
+        """Rows strictly after (or before, when reverse) the given position."""
+        condition = Q(pk__in=[])
+        for i, field in enumerate(ordering):
+            column = field.lstrip('-')
+            after = field.startswith('-') == reverse
+            step = Q(**{f"{column}__{'gt' if after else 'lt'}": values[i]})
+            for previous, value in zip(ordering[:i], values):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = remove_query_param(request.build_absolute_uri(), self.cursor_query_param)
+        page_size = self.get_page_size(request)
+        ordering = self.get_ordering(queryset)
+        cursor = self.decode_cursor(request)
+        values, reverse = cursor if cursor else (None, False)
+        if values is not None and len(values) != len(ordering):
+            raise NotFound('Invalid cursor')
+
+        keys = {f"cursor_{i}": F(field.lstrip('-')) for i, field in enumerate(ordering)}
+        queryset = queryset.annotate(**keys)
+        if values is not None:
+            try:
+                queryset = queryset.filter(self.keyset_filter(ordering, values, reverse))
+            except (TypeError, ValueError, DjangoValidationError):
+                # A value the column can't hold
+                raise NotFound('Invalid cursor')
+        if reverse:
+            ordering_sql = [f[1:] if f.startswith('-') else f"-{f}" for f in ordering]
+        else:
+            ordering_sql = ordering
+        rows = list(queryset.order_by(*ordering_sql)[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        position = lambda row: [row[k] if isinstance(row, dict) else getattr(row, k) for k in keys]
+        self.next_link = self.previous_link = None
+        if rows:
+            if has_more or reverse:
+                self.next_link = self.encode_cursor(position(rows[-1]), False)
+            if values is not None and (has_more or not reverse):
+                self.previous_link = self.encode_cursor(position(rows[0]), True)
+        return rows
+
+    def get_next_link(self):
+        return self.next_link
+
+    def get_previous_link(self):
+        return self.previous_link
+
+    def get_paginated_response(self, data):
+        return Response({
+            'links': {
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link()
+            },
+            'results': data
+        })
+
+
+class CatalogCursorPagination(KeysetPagination):
+    default_ordering = ('-product_id',)
+    ordering_columns = {
+        'product_id': 'product_id',
+        'price': 'price',
+        'name': 'name',
+        'published_date': 'published_date',
+        # the card copy of the rating average is a plain, non-null Product column
+        'rating': 'card_rating',
+        # computed rankings (shop.ranking): manual flag first, then the coalesced score
+        'trending': 'trending',
+        'best_seller': 'best_seller',
+        'rank_score': 'rank_score',
+    }
+
+
+def get_catalog_paginator(request):
+    return CatalogCursorPagination() if cursor_requested(request) else CustomPagination()
@@ -0,0 +1,168 @@
+"""
+Computed trending and best seller rankings.
+
+Each ranking is a time-decayed sum of sales activity with its own half-life:
+every unit ordered (and, for trending, every cart addition) adds its weight,
+halved for each half-life elapsed since. The half-life sets the window a
+ranking looks at; activity whose decayed score falls below EXPIRE_SCORE
+drops out of the lists altogether.
+
+Scores use forward decay: an event at time t adds weight * 2^((t - L) / h)
+for a fixed landmark L, instead of every score being multiplied down as time
+passes. All scores of a ranking share the same hidden 2^((now - L) / h)
+factor, so ordering by the stored column is ordering by the decayed score,
+and a run only writes the products that had new activity. The landmark is
+moved forward (one UPDATE per ranking) before the exponent gets large.
+
+An order counts from when it is placed until it is cancelled (see
+Order.counted_at): a run adds the orders placed since the last one and
+takes back out the weight of the counted orders cancelled since.
+
+The trending and best_seller flags stay as manual overrides: flagged
+products come first in their list, then the rest by score.
+"""
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from cart.models import Cart, Order, OrderItem
+from .models import JobWatermark, Product, ProductRanking
+
+Ranking = namedtuple('Ranking', 'flag field half_life order_weight cart_weight')
+
+RANKINGS = {
+    'trending': Ranking('trending', 'trending_score', timedelta(days=3), 1.0, 0.3),
+    'best_seller': Ranking('best_seller', 'best_seller_score', timedelta(days=30), 1.0, 0.0),
+}
+
+JOB_NAME = 'rankings'
+LANDMARK_NAME = 'rankings:landmark'
+# Orders and cart rows newer than this may still be committing, they are left for the next run
+SETTLE_TIME = timedelta(minutes=5)
+# Decayed score under which a product leaves a list
+EXPIRE_SCORE = 0.05
+# Half-lives between the landmark and now before scores are rescaled, far below float overflow
+RESCALE_AFTER = 256
+
+
+def growth(ranking, moment, landmark):
+    """2^((moment - landmark) / half_life): the weight of an event at moment, in stored units."""
+    return 2 ** ((moment - landmark) / ranking.half_life)
+
+
+def ranked_products(name, queryset=None):
+    """
+    Products of the ranking name, best first: flagged ones, then the others
+    with a live score. rank_score is the stored score, only comparable
+    within the list.
+    """
+    ranking = RANKINGS[name]
+    score = f"ranking__{ranking.field}"
+    queryset = Product.objects.all() if queryset is None else queryset
+    return (
+        queryset.annotate(rank_score=Coalesce(F(score), Value(0.0)))
+        .filter(Q(**{ranking.flag: True}) | Q(**{f"{score}__gt": 0}))
+        .order_by(f"-{ranking.flag}", '-rank_score', '-pk')
+    )
+
+
+def activity(since, until):
+    """
+    (product_id, time, quantity, kind) of the orders and cart additions in
+    (since, until], and with a negative quantity of the orders counted by
+    since and cancelled in (since, until].
+    """
+    orders = OrderItem.objects.filter(Order.counted_at(until, prefix='order__'))
+    cancelled = OrderItem.objects.none()
+    carts = Cart.objects.filter(created_at__lte=until)
+    if since is not None:
+        orders = orders.filter(order__created_at__gt=since)
+        cancelled = OrderItem.objects.filter(Order.counted_at(since, prefix='order__'), order__cancelled_at__lte=until)
+        carts = carts.filter(created_at__gt=since)
+    for product_id, moment, quantity in orders.values_list('product_id', 'order__created_at', 'quantity').iterator(chunk_size=10000):
+        yield product_id, moment, quantity, 'order'
+    # Taken out at the weight they were added with, their time being the order's
+    for product_id, moment, quantity in cancelled.values_list('product_id', 'order__created_at', 'quantity').iterator(chunk_size=10000):
+        yield product_id, moment, -quantity, 'order'
+    for product_id, moment, quantity in carts.values_list('product_id', 'created_at', 'quantity').iterator(chunk_size=10000):
+        yield product_id, moment, quantity, 'cart'
+
+
+def rescale(landmark, until):
+    """Move the landmark to until, dividing every stored score by the growth in between."""
+    for ranking in RANKINGS.values():
+        factor = 1 / growth(ranking, until, landmark)
+        ProductRanking.objects.filter(**{f"{ranking.field}__gt": 0}).update(**{ranking.field: F(ranking.field) * factor})
+    return until
+
+
+def add_scores(increments, batch_size):
+    """Add {product_id: {field: amount}} to the stored scores."""
+    fields = [ranking.field for ranking in RANKINGS.values()]
+    pks = list(increments)
+    for start in range(0, len(pks), batch_size):
+        chunk = pks[start:start + batch_size]
+        existing = ProductRanking.objects.in_bulk(chunk)
+        # Activity of a product deleted since is dropped
+        live = set(Product.objects.filter(pk__in=chunk).values_list('pk', flat=True))
+        rows = []
+        for pk in chunk:
+            if pk not in live:
+                continue
+            row = existing.get(pk) or ProductRanking(product_id=pk)
+            for field, amount in increments[pk].items():
+                # A cancelled order can take out more than an expired score still holds
+                setattr(row, field, max(getattr(row, field) + amount, 0.0))
+            rows.append(row)
+        ProductRanking.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['product'], update_fields=fields + ['updated_at'],
+        )
+
+
+def expire(landmark, until):
+    """Zero the scores that decayed below EXPIRE_SCORE, a range scan of each score index."""
+    expired = 0
+    for ranking in RANKINGS.values():
+        threshold = EXPIRE_SCORE * growth(ranking, until, landmark)
+        expired += ProductRanking.objects.filter(
+            **{f"{ranking.field}__gt": 0, f"{ranking.field}__lt": threshold}
+        ).update(**{ranking.field: 0})
+    return expired
+
+
+def run(rebuild=False, batch_size=1000):
+    """
+    Add the activity since the last run (all of it with rebuild) to the
+    ranking scores. Returns (events, products updated).
+    """
+    until = timezone.now() - SETTLE_TIME
+    with transaction.atomic():
+        watermark, created = JobWatermark.objects.select_for_update().get_or_create(name=JOB_NAME)
+        landmark_row, created = JobWatermark.objects.select_for_update().get_or_create(name=LANDMARK_NAME)
+        if rebuild:
+            ProductRanking.objects.all().delete()
+            watermark.position = None
+            landmark_row.position = None
+        landmark = landmark_row.position or until
+        shortest = min(ranking.half_life for ranking in RANKINGS.values())
+        if (until - landmark) / shortest > RESCALE_AFTER:
+            landmark = rescale(landmark, until)
+
+        increments = defaultdict(lambda: defaultdict(float))
+        events = 0
+        for product_id, moment, quantity, kind in activity(watermark.position, until):
+            events += 1
+            for ranking in RANKINGS.values():
+                weight = ranking.order_weight if kind == 'order' else ranking.cart_weight
+                if weight:
+                    increments[product_id][ranking.field] += weight * quantity * growth(ranking, moment, landmark)
+        add_scores(increments, batch_size)
+        expire(landmark, until)
+
+        watermark.position = until
+        watermark.save()
+        landmark_row.position = landmark
+        landmark_row.save()
+    return events, len(increments)
@@ -1,5 +1,6 @@
 from import_export import resources, fields
 from import_export.widgets import ForeignKeyWidget
+from .facebook import suppress_posts
 from .models import Product, ProductImage, ProductAttribute, Category, Brand, Series,SubCategory, Color, Variant
 
 class ProductResource(resources.ModelResource):
@@ -25,6 +26,11 @@ class ProductResource(resources.ModelResource):
         import_id_fields = ['product_id']  # <-- important!
         fields = ('product_id', 'name', 'category', 'brand', 'series', 'price', 'description', 'published_date')
 
+    def import_data(self, *args, **kwargs):
+        # A bulk import is not announced product by product on Facebook
+        with suppress_posts():
+            return super().import_data(*args, **kwargs)
+
 class ProductImageResource(resources.ModelResource):
     # Using ForeignKeyWidget for mapping the related Product model
     product = fields.Field(
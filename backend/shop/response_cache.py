@@ -0,0 +1,96 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from .caching import CATALOG, namespace_versions, representation_key, shared_cache
+
+STATS_KEY = 'response-cache:stats:{view}:{outcome}'
+
+# Views using CachedResponseMixin, for the stats endpoint
+cached_views = []
+
+
+def cacheable(request):
+    """Only anonymous GETs are shared; every API auth scheme here sends an Authorization header."""
+    return request.method == 'GET' and 'HTTP_AUTHORIZATION' not in request.META
+
+
+def response_key(view, request):
+    raw = representation_key(request)
+    return f"response:{type(view).__name__}:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def record(view, outcome):
+    key = STATS_KEY.format(view=type(view).__name__, outcome=outcome)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def response_cache_stats():
+    keys = {
+        STATS_KEY.format(view=view.__name__, outcome=outcome): (view.__name__, outcome)
+        for view in cached_views
+        for outcome in ('hit', 'miss')
+    }
+    stats = {view.__name__: {'hit': 0, 'miss': 0} for view in cached_views}
+    for key, value in cache.get_many(keys).items():
+        view, outcome = keys[key]
+        stats[view][outcome] = value
+    for counts in stats.values():
+        lookups = counts['hit'] + counts['miss']
+        counts['hit_ratio'] = round(counts['hit'] / lookups, 3) if lookups else None
+    return stats
+
+
+class CachedResponseMixin:
+    """
+    Caches rendered 200 responses of anonymous GETs. Each entry keeps the
+    versions of the namespaces it was built from (cache_namespaces, plus any
+    the view adds with cache_depends_on while rendering) and is served only
+    while all of them are unchanged, so a write invalidates exactly the
+    entries depending on what it touched. Versions are bumped by the
+    signals in shop.signals. Off unless the cache is shared by all the
+    workers (REDIS_CACHE_URL).
+    """
+    cache_namespaces = (CATALOG,)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cached_views.append(cls)
+
+    def get_cache_namespaces(self, request, *args, **kwargs):
+        return list(self.cache_namespaces)
+
+    def cache_depends_on(self, *namespaces):
+        # Read now rather than once rendered, so a write landing mid-render still invalidates the entry
+        if hasattr(self, '_cache_versions'):
+            missing = [namespace for namespace in namespaces if namespace not in self._cache_versions]
+            self._cache_versions.update(namespace_versions(missing))
+
+    def dispatch(self, request, *args, **kwargs):
+        # Without a shared cache the other workers' writes would never invalidate the entries
+        if not cacheable(request) or not shared_cache():
+            return super().dispatch(request, *args, **kwargs)
+        key = response_key(self, request)
+        entry = cache.get(key)
+        if entry is not None and namespace_versions(entry['versions']) == entry['versions']:
+            record(self, 'hit')
+            response = HttpResponse(entry['content'], content_type=entry['content_type'])
+            response['X-Cache'] = 'HIT'
+            return response
+
+        record(self, 'miss')
+        self._cache_versions = namespace_versions(self.get_cache_namespaces(request, *args, **kwargs))
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            response.render()
+            cache.set(key, {
+                'versions': self._cache_versions,
+                'content': response.content,
+                'content_type': response['Content-Type'],
+            }, settings.RESPONSE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,180 @@
+import re
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from django.utils.html import strip_tags
+from rest_framework import filters
+from rest_framework.settings import api_settings
+from .models import Product
+
+SEARCH_TABLE = 'shop_product_search'
+SEARCH_CONFIG = 'english'
+
+# Relative weight of each indexed column: name (with the product id) > brand/category > description
+WEIGHTS = {'name': 'A', 'brand': 'B', 'category': 'B', 'description': 'D'}
+BM25_WEIGHTS = '10.0, 4.0, 4.0, 1.0'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_index_available = None
+
+
+def search_backend():
+    """'postgresql' or 'sqlite' when the database has a full-text engine we index into, else None."""
+    if connection.vendor in ('postgresql', 'sqlite'):
+        return connection.vendor
+    return None
+
+
+def index_available():
+    """True once the search table exists. Checked once per process; a missing table falls back to icontains."""
+    global _index_available
+    if _index_available is None:
+        _index_available = bool(search_backend()) and SEARCH_TABLE in connection.introspection.table_names()
+    return _index_available
+
+
+def create_search_index(**kwargs):
+    """Create the search table. Raw DDL because neither engine's index fits a model field on both backends."""
+    global _index_available
+    backend = search_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        if backend == 'postgresql':
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+                f"product_id varchar(50) PRIMARY KEY REFERENCES {Product._meta.db_table} (product_id) "
+                f"ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+                f"document tsvector NOT NULL)"
+            )
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document ON {SEARCH_TABLE} USING gin (document)")
+        else:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+                f"product_id UNINDEXED, name, brand, category, description, tokenize='porter unicode61')"
+            )
+    _index_available = True
+
+
+def documents(queryset):
+    """(product_id, name, brand, category, description) rows ready to index, with the rich text stripped."""
+    rows = queryset.values_list('product_id', 'name', 'brand__name', 'category__name', 'sub_category__name', 'description')
+    for product_id, name, brand, category, sub_category, description in rows.iterator(chunk_size=500):
+        yield (
+            product_id,
+            f"{product_id.replace('-', ' ')} {name or ''}",
+            brand or '',
+            f"{category or ''} {sub_category or ''}".strip(),
+            strip_tags(description or ''),
+        )
+
+
+def remove_products(product_ids):
+    if not index_available() or not product_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE product_id IN ({placeholders})", list(product_ids))
+
+
+def index_products(queryset=None, batch_size=500):
+    """(Re)index the products of queryset, or the whole catalog. Returns the number of indexed products."""
+    if not index_available():
+        return 0
+    full = queryset is None
+    if full:
+        queryset = Product.objects.all()
+    backend = search_backend()
+    if backend == 'postgresql':
+        vector = ' || '.join(
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', %s), '{weight}')" for weight in WEIGHTS.values()
+        )
+        sql = (
+            f"INSERT INTO {SEARCH_TABLE} (product_id, document) VALUES (%s, {vector}) "
+            f"ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document"
+        )
+    else:
+        sql = f"INSERT INTO {SEARCH_TABLE} (product_id, name, brand, category, description) VALUES (%s, %s, %s, %s, %s)"
+
+    total = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        if full:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        batch = []
+        for row in documents(queryset):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                total += write_batch(cursor, sql, batch, replace=not full and backend == 'sqlite')
+                batch = []
+        if batch:
+            total += write_batch(cursor, sql, batch, replace=not full and backend == 'sqlite')
+    return total
+
+
+def write_batch(cursor, sql, rows, replace):
+    if replace:
+        # FTS5 has no unique constraint to upsert against
+        placeholders = ', '.join(['%s'] * len(rows))
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE product_id IN ({placeholders})", [row[0] for row in rows])
+    cursor.executemany(sql, rows)
+    return len(rows)
+
+
+def parse_query(query):
+    """Prefix-match every word of the query, all of them required, in the engine's query syntax."""
+    tokens = TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return None
+    if search_backend() == 'postgresql':
+        return ' & '.join(f"{token}:*" for token in tokens)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_products(queryset, query):
+    """
+    Restrict queryset to the products matching query and annotate search_rank
+    (higher is better). Returns None when the index can't serve the query so
+    the caller can fall back to its icontains search.
+    """
+    if not index_available():
+        return None
+    match = parse_query(query)
+    if match is None:
+        return queryset
+    product_table = Product._meta.db_table
+    if search_backend() == 'postgresql':
+        matching = f"SELECT product_id FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('{SEARCH_CONFIG}', %s)"
+        rank = (
+            f"SELECT ts_rank_cd(document, to_tsquery('{SEARCH_CONFIG}', %s)) FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE}.product_id = {product_table}.product_id"
+        )
+    else:
+        matching = f"SELECT product_id FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+        # bm25() is lower-is-better, negate it so both engines sort by -search_rank
+        rank = (
+            f"SELECT -bm25({SEARCH_TABLE}, 0.0, {BM25_WEIGHTS}) FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND {SEARCH_TABLE}.product_id = {product_table}.product_id"
+        )
+    return queryset.filter(product_id__in=RawSQL(matching, [match])).annotate(
+        search_rank=RawSQL(rank, [match])
+    )
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter answered from the full-text index, ranked by relevance unless
+    the request asks for an ordering. The view's search_fields are still used
+    when the database has no index.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        results = search_products(queryset, ' '.join(terms))
+        if results is None:
+            return super().filter_queryset(request, queryset, view)
+        if not request.query_params.get(api_settings.ORDERING_PARAM):
+            results = results.order_by('-search_rank', '-product_id')
+        return results
+
@@ -1,7 +1,116 @@
 from rest_framework import serializers
-from .models import Product, Comment, Repliess, ProductImage, Rating, ProductAttribute, Variant, Color, Size, SizeColorStock
+from .models import Product, Comment, Repliess, ProductImage, Rating, ProductAttribute, Variant, Color, Size, SizeColorStock, ProductRatingSummary
 from django.contrib.auth.models import User
-from django.db.models import Sum
+from django.db.models import Prefetch, prefetch_related_objects
+from django.core.files.storage import default_storage
+
+
+class EagerLoadingMixin:
+    """
+    Lets a serializer declare the relations its fields walk, so views can load
+    them up front instead of one lazy query per object and hop.
+
+    get_select_related() / get_prefetch_related() map a field name to the
+    lookups that field needs; setup_eager_loading() applies the plan of the
+    given fields (all of them by default) to a queryset.
+    """
+
+    @classmethod
+    def get_select_related(cls):
+        return {}
+
+    @classmethod
+    def get_prefetch_related(cls):
+        return {}
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None):
+        select_related, prefetch_related = [], []
+        for name, lookups in cls.get_select_related().items():
+            if fields is None or name in fields:
+                select_related.extend(lookups)
+        for name, lookups in cls.get_prefetch_related().items():
+            if fields is None or name in fields:
+                prefetch_related.extend(lookups)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+    @classmethod
+    def eager_load_objects(cls, instances, fields=None):
+        """Same plan for instances that are already loaded, e.g. a list picked in Python."""
+        lookups = []
+        for plan in (cls.get_select_related(), cls.get_prefetch_related()):
+            for name, items in plan.items():
+                if fields is None or name in fields:
+                    lookups.extend(items)
+        prefetch_related_objects(list(instances), *lookups)
+        return instances
+
+
+def list_param(request, name):
+    """Values of a list query parameter, accepting both ?x=a&x=b and ?x=a,b."""
+    if request is None:
+        return []
+    values = []
+    for value in request.query_params.getlist(name):
+        values.extend(v.strip() for v in value.split(',') if v.strip())
+    return values
+
+
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets for GET requests: ?fields=a,b keeps only those fields and
+    ?expand=c adds more on top of them (or turns on an optional part listed in
+    expandable_fields, e.g. reviews). setup_query() trims the queryset to
+    match, skipping the prefetches and deferring the columns nobody asked for.
+
+    column_dependencies lists the model columns a method field reads.
+    """
+    expandable_fields = []
+    column_dependencies = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.requested_fields(self.context.get('request'))
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+    @classmethod
+    def requested_fields(cls, request):
+        if request is None or request.method != 'GET':
+            return None
+        fields = list_param(request, 'fields')
+        if not fields:
+            return None
+        return set(fields) | set(list_param(request, 'expand'))
+
+    @classmethod
+    def get_columns(cls, fields):
+        model = cls.Meta.model
+        concrete = {f.name: f.name for f in model._meta.concrete_fields}
+        columns = {model._meta.pk.name}
+        declared = cls().fields
+        for name in fields:
+            if name in cls.column_dependencies:
+                columns.update(cls.column_dependencies[name])
+            elif name in declared:
+                source = declared[name].source.split('.')[0]
+                if source in concrete:
+                    columns.add(source)
+        return columns
+
+    @classmethod
+    def setup_query(cls, queryset, request):
+        fields = cls.requested_fields(request)
+        queryset = cls.setup_eager_loading(queryset, fields)
+        if fields is not None:
+            queryset = queryset.only(*cls.get_columns(fields))
+        return queryset
+
 
 class ReplySerializer(serializers.ModelSerializer):
     user = serializers.SerializerMethodField() #yo garexi i can define serializers for user by myself i.e. user ko kun attribute pathaune vanera
@@ -40,13 +149,17 @@ class CommentSerializer(serializers.ModelSerializer):
         if obj.user.dp:
             return request.build_absolute_uri(f"/media/{obj.user.dp}")
     
-class ProductImageSerializer(serializers.ModelSerializer):
+class ProductImageSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     color_name = serializers.SerializerMethodField()
     hex = serializers.SerializerMethodField()
     class Meta:
         model = ProductImage
         fields = ['id', 'image', 'color', 'product', 'color_name', 'hex']
 
+    @classmethod
+    def get_select_related(cls):
+        return {'color_name': ['color'], 'hex': ['color']}
+
     def get_color_name(self, obj):
         return obj.color.name if obj.color else None
 
@@ -86,27 +199,36 @@ class VariantSerializer(serializers.ModelSerializer):
         model = Variant
         fields = ['id', 'name', 'additional_price']
 
-class SizeSerializer(serializers.ModelSerializer):
+class SizeSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     color_stocks = serializers.SerializerMethodField()
     
     class Meta:
         model = Size
         fields = ['id', 'name', 'price_adjustment', 'product', 'color_stocks']
-    
+
+    @classmethod
+    def get_prefetch_related(cls):
+        stocks = SizeColorStockSerializer.setup_eager_loading(SizeColorStock.objects.all())
+        return {'color_stocks': [Prefetch('color_stocks', queryset=stocks)]}
+
     def get_color_stocks(self, obj):
         color_stocks = obj.color_stocks.all()
         return SizeColorStockSerializer(color_stocks, many=True).data
 
-class SizeColorStockSerializer(serializers.ModelSerializer):
+class SizeColorStockSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     color_id = serializers.SerializerMethodField()
     color_name = serializers.SerializerMethodField()
     
     class Meta:
         model = SizeColorStock
         fields = ['id', 'color_id', 'color_name', 'stock', 'product', 'size', 'color']
-    
+
+    @classmethod
+    def get_select_related(cls):
+        return {'color_name': ['color']}
+
     def get_color_id(self, obj):
-        return obj.color.id if obj.color else None
+        return obj.color_id
     
     def get_color_name(self, obj):
         return obj.color.name if obj.color else 'No Color'
@@ -116,7 +238,78 @@ class ColorSerializer(serializers.ModelSerializer):
         model = Color
         fields = ['id', 'name', 'hex', 'product']
     
-class GetProductSerializer(serializers.ModelSerializer):
+
+def wants_reviews(serializer):
+    """Review bodies are sent for a single product, or for lists with ?expand=reviews."""
+    if not isinstance(serializer.parent, serializers.ListSerializer):
+        return True
+    return 'reviews' in list_param(serializer.context.get('request'), 'expand')
+
+
+def load_rating_stats(products, include_reviews=False):
+    """
+    Attach rating stats (and optionally the reviews) to every product in one go.
+    Stats come from ProductRatingSummary in a single query for the whole page,
+    plus one query for the reviews when they are wanted.
+    """
+    products = [p for p in products if not hasattr(p, '_rating_stats')]
+    if not products:
+        return
+    ids = [p.pk for p in products]
+    # Querysets set up with select_related('rating_summary') already carry the row
+    if all(Product.rating_summary.is_cached(p) for p in products):
+        summaries = {p.pk: getattr(p, 'rating_summary', None) for p in products}
+    else:
+        summaries = ProductRatingSummary.objects.in_bulk(ids)
+
+    reviews = {}
+    if include_reviews:
+        for rating in Rating.objects.filter(product_id__in=ids).select_related('user'):
+            reviews.setdefault(rating.product_id, []).append(rating)
+
+    for product in products:
+        summary = summaries.get(product.pk)
+        if summary is None:
+            summary = ProductRatingSummary(product_id=product.pk)
+        product._rating_stats = {'total_ratings': summary.count, 'rating_dict': summary.rating_dict, 'avg_rating': round(summary.average, 1)}
+        if include_reviews:
+            product._reviews = reviews.get(product.pk, [])
+
+
+def product_ratings(serializer, obj):
+    include_reviews = wants_reviews(serializer)
+    if not hasattr(obj, '_rating_stats') or (include_reviews and not hasattr(obj, '_reviews')):
+        load_rating_stats([obj], include_reviews=include_reviews)
+    data = []
+    if include_reviews:
+        data = RatingSerializer(obj._reviews, many=True, context=serializer.context).data
+    return {"stats": obj._rating_stats, "data": data}
+
+
+class ProductListSerializer(serializers.ListSerializer):
+    """Loads the ratings of the whole page up front so each product does not query on its own."""
+
+    def to_representation(self, data):
+        products = list(data.all() if hasattr(data, 'all') else data)
+        if 'ratings' in self.child.fields:
+            load_rating_stats(products, include_reviews=wants_reviews(self.child))
+        return super().to_representation(products)
+
+
+def product_prefetches():
+    """Prefetch plans shared by the product serializers, built from the nested serializers' own plans."""
+    images = ProductImageSerializer.setup_eager_loading(ProductImage.objects.all())
+    sizes = SizeSerializer.setup_eager_loading(Size.objects.all())
+    return {
+        'images': [Prefetch('images', queryset=images)],
+        'sizes': [Prefetch('sizes', queryset=sizes)],
+        'colors': ['colors'],
+        'variants': ['variants'],
+        'attributes': ['attributes'],
+    }
+
+
+class GetProductSerializer(DynamicFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
     images = ProductImageSerializer(many = True, read_only = True)
     ratings = serializers.SerializerMethodField()
     category = serializers.StringRelatedField()
@@ -126,30 +319,27 @@ class GetProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['product_id','name','category','price','old_price', 'before_deal_price','images','ratings','variants','sizes','colors']
+        list_serializer_class = ProductListSerializer
 
-    def get_ratings(self,obj):
-        request = self.context.get('request')
-        stats = {}
-        ratings = Rating.objects.filter(product=obj)
-        if ratings.exists():
-            total_ratings = ratings.count()
-            #show how many stars ratings were rated acc to each star
-            rating_dict = {1:0, 2:0, 3:0, 4:0, 5:0}
-            for rating in ratings:
-                rating_dict[rating.rating] += 1
-            avg_rating = sum(rating.rating for rating in ratings) / len(ratings)
-            avg_rating = round(avg_rating, 1)
-            stats = {'total_ratings': total_ratings, 'rating_dict': rating_dict, 'avg_rating': avg_rating}
-        else:
-            stats = {'total_ratings': 0, 'rating_dict': {1:0, 2:0, 3:0, 4:0, 5:0}, 'avg_rating':0}
-        serializer = RatingSerializer(ratings, many=True, context={'request': request})
-        return {"stats":stats, "data":serializer.data}
+    expandable_fields = ['reviews']
+
+    @classmethod
+    def get_select_related(cls):
+        return {'category': ['category'], 'ratings': ['rating_summary']}
+
+    @classmethod
+    def get_prefetch_related(cls):
+        prefetches = product_prefetches()
+        return {name: prefetches[name] for name in ['images', 'variants', 'sizes', 'colors']}
+
+    def get_ratings(self, obj):
+        return product_ratings(self, obj)
     
     def get_brandName(self, obj):
         return obj.brand.name
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
     images = ProductImageSerializer(many = True, read_only = True)
     brandName = serializers.SerializerMethodField()
     ratings = serializers.SerializerMethodField()
@@ -164,24 +354,32 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
+        list_serializer_class = ProductListSerializer
 
-    def get_ratings(self,obj):
-        request = self.context.get('request')
-        stats = {}
-        ratings = Rating.objects.filter(product=obj)
-        if ratings.exists():
-            total_ratings = ratings.count()
-            #show how many stars ratings were rated acc to each star
-            rating_dict = {1:0, 2:0, 3:0, 4:0, 5:0}
-            for rating in ratings:
-                rating_dict[rating.rating] += 1
-            avg_rating = sum(rating.rating for rating in ratings) / len(ratings)
-            avg_rating = round(avg_rating, 1)
-            stats = {'total_ratings': total_ratings, 'rating_dict': rating_dict, 'avg_rating': avg_rating}
-        else:
-            stats = {'total_ratings': 0, 'rating_dict': {1:0, 2:0, 3:0, 4:0, 5:0}, 'avg_rating':0}
-        serializer = RatingSerializer(ratings, many=True, context={'request': request})
-        return {"stats":stats, "data":serializer.data}
+    expandable_fields = ['reviews']
+    column_dependencies = {
+        'brandName': ['brand'],
+        'category_name': ['category'],
+        'sub_category_name': ['sub_category'],
+        'stock': ['total_stock'],
+        'ratings': ['rating_summary'],
+    }
+
+    @classmethod
+    def get_select_related(cls):
+        return {
+            'brandName': ['brand'],
+            'category_name': ['category'],
+            'sub_category_name': ['sub_category'],
+            'ratings': ['rating_summary'],
+        }
+
+    @classmethod
+    def get_prefetch_related(cls):
+        return product_prefetches()
+
+    def get_ratings(self, obj):
+        return product_ratings(self, obj)
     
     def get_brandName(self, obj):
         return obj.brand.name
@@ -193,5 +391,41 @@ class ProductSerializer(serializers.ModelSerializer):
         return obj.sub_category.name if obj.sub_category else None
     
     def get_stock(self, obj):
-        total_stock = SizeColorStock.objects.filter(product_id=obj.product_id).aggregate(total=Sum('stock'))['total']
-        return total_stock if total_stock is not None else 0
\ No newline at end of file
+        return obj.total_stock
+
+
+# Columns read for the card payload, all of them stored on Product itself
+CARD_COLUMNS = ['product_id', 'name', 'price', 'old_price', 'card_image', 'card_brand', 'card_category', 'card_rating', 'in_stock']
+
+
+def wants_cards(request):
+    """?view=card asks a listing for product cards instead of full products."""
+    return request is not None and request.query_params.get('view') == 'card'
+
+
+def product_cards(rows, request=None):
+    """
+    Lightweight product cards from .values(*CARD_COLUMNS) rows (or Product
+    instances). No joins, no nested serializers.
+    """
+    cards = []
+    for row in rows:
+        if not isinstance(row, dict):
+            row = {column: getattr(row, column) for column in CARD_COLUMNS}
+        image = None
+        if row['card_image']:
+            image = default_storage.url(row['card_image'])
+            if request is not None:
+                image = request.build_absolute_uri(image)
+        cards.append({
+            'product_id': row['product_id'],
+            'name': row['name'],
+            'price': row['price'],
+            'old_price': row['old_price'],
+            'image': image,
+            'brand_name': row['card_brand'],
+            'category_name': row['card_category'],
+            'avg_rating': round(row['card_rating'], 1),
+            'in_stock': row['in_stock'],
+        })
+    return cards
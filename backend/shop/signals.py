@@ -1,35 +1,167 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import Product
-import requests
-from django.http import JsonResponse
-from django.conf import settings
-import sys
+from .models import (
+    Product, Rating, ProductRatingSummary, SizeColorStock, ProductImage, Brand, Category, SubCategory,
+    Color, Size, Variant, ProductAttribute,
+)
+from .caching import CATALOG, bump_namespaces
+from .search import index_products, remove_products
+from .documents import refresh_documents
+from .facebook import enqueue_product_post
+from .inventory import FULFILLED, commit, release
+from cart.models import Order
+from django.db import transaction
+from django.utils import timezone
 
 @receiver(post_save, sender=Product)
-def post_to_fb(sender, instance, created, **kwargs):
-    # --- FIX: skip this signal during loaddata / migrate ---
-    if 'loaddata' in sys.argv or 'migrate' in sys.argv:
+def post_to_fb(sender, instance, created, raw=False, **kwargs):
+    # Only recorded in the outbox here, the outbox worker talks to the Graph API
+    if created and not raw:
+        enqueue_product_post(instance)
+
+
+@receiver(post_save, sender=Product)
+def create_rating_summary(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ProductRatingSummary.objects.get_or_create(product=instance)
+
+
+@receiver(post_save, sender=Rating)
+def rating_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ProductRatingSummary.refresh(instance.product_id)
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    ProductRatingSummary.refresh(instance.product_id, create=False)
+
+
+@receiver(post_save, sender=SizeColorStock)
+@receiver(post_delete, sender=SizeColorStock)
+def stock_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    with transaction.atomic():
+        Product.refresh_stock([instance.product_id])
+
+
+
+# Reserved stock goes back when an order is cancelled or deleted, and stays taken once it is dispatched
+@receiver(post_save, sender=Order)
+def order_status_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.status == 'Cancelled':
+        release([instance.pk])
+    elif instance.status in FULFILLED:
+        commit([instance.pk])
+
+
+@receiver(pre_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    release([instance.pk])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_image_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Product.refresh_cards(pk=instance.product_id)
+
+
+@receiver(post_save, sender=Brand)
+def brand_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Product.objects.filter(brand=instance).update(card_brand=instance.name, updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Product.objects.filter(category=instance).update(card_category=instance.name, updated_at=timezone.now())
+
+
+@receiver(post_save, sender=SubCategory)
+def sub_category_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Product.objects.filter(sub_category=instance).update(updated_at=timezone.now())
+
+
+# Product.updated_at (the product's ETag/Last-Modified) moves with every row shown with the product
+def touch_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+for model in (ProductImage, Color, Size, SizeColorStock, Variant, ProductAttribute, Rating):
+    post_save.connect(touch_product, sender=model, dispatch_uid=f'touch-product-save-{model.__name__}')
+    post_delete.connect(touch_product, sender=model, dispatch_uid=f'touch-product-delete-{model.__name__}')
+
+
+# Keep the full-text index in step with what it indexes: the product row and its brand/category names
+@receiver(post_save, sender=Product)
+def product_search_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: index_products(Product.objects.filter(pk=instance.pk)))
+
+
+@receiver(post_delete, sender=Product)
+def product_search_deleted(sender, instance, **kwargs):
+    remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=SubCategory)
+def search_names_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    field = {Brand: 'brand', Category: 'category', SubCategory: 'sub_category'}[sender]
+    transaction.on_commit(lambda: index_products(Product.objects.filter(**{field: instance})))
+
+
+# Cache namespaces a write to each model invalidates, besides the catalog-wide version that cached
+# listing counts, facets, the autocomplete index and cached listing responses follow
+CACHE_NAMESPACES = {
+    Product: lambda instance: [f'product:{instance.pk}'],
+    Brand: lambda instance: [f'brand:{instance.pk}'],
+    Category: lambda instance: [f'category:{instance.pk}'],
+    SubCategory: lambda instance: [f'sub_category:{instance.pk}'],
+}
+for model in (ProductImage, Color, Size, SizeColorStock, Variant, ProductAttribute, Rating):
+    CACHE_NAMESPACES[model] = lambda instance: [f'product:{instance.product_id}']
+
+
+def invalidate_caches(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    namespaces = [CATALOG] + CACHE_NAMESPACES[sender](instance)
+    transaction.on_commit(lambda: bump_namespaces(namespaces))
+
+
+for model in CACHE_NAMESPACES:
+    post_save.connect(invalidate_caches, sender=model, dispatch_uid=f'invalidate-caches-save-{model.__name__}')
+    post_delete.connect(invalidate_caches, sender=model, dispatch_uid=f'invalidate-caches-delete-{model.__name__}')
+
+
+# Rendered product documents are queued for rendering (outbox) with every write to anything they show
+DOCUMENT_FILTERS = {
+    Product: lambda instance: {'pk': instance.pk},
+    Brand: lambda instance: {'brand_id': instance.pk},
+    Category: lambda instance: {'category_id': instance.pk},
+    SubCategory: lambda instance: {'sub_category_id': instance.pk},
+}
+for model in (ProductImage, Color, Size, SizeColorStock, Variant, ProductAttribute, Rating):
+    DOCUMENT_FILTERS[model] = lambda instance: {'pk': instance.product_id}
+
+
+def product_documents_changed(sender, instance, raw=False, **kwargs):
+    if raw:
         return
+    refresh_documents(**DOCUMENT_FILTERS[sender](instance))
 
-    if created:
-        print("HERE")
-        message = f"The wait is now over for {instance.name}. The product is now available on our website. Click below to check it out now!"
-        page_access_token = settings.FACEBOOK_PAGE_ACCESS_TOKEN
-        print(page_access_token)
-        page_id = settings.FACEBOOK_PAGE_ID
-        print(page_id)
-
-        url = f"https://graph.facebook.com/{page_id}/feed"
-        payload = {
-            'message': message,
-            'link': f'https://www.dgtech.com.np/product/{instance.product_id}/',
-            'access_token': page_access_token
-        }
-
-        try:
-            res = requests.post(url, data=payload)
-            print(res.json())
-        except Exception as e:
-            print("Facebook API error:", e)
 
+for model in DOCUMENT_FILTERS:
+    post_save.connect(product_documents_changed, sender=model, dispatch_uid=f'product-documents-save-{model.__name__}')
+    post_delete.connect(product_documents_changed, sender=model, dispatch_uid=f'product-documents-delete-{model.__name__}')
@@ -0,0 +1,189 @@
+"""
+Offline content-based "similar products" job.
+
+Each product becomes a sparse feature vector: one-hot brand, category,
+sub-category and attribute key/value pairs, plus its log-price bucket
+(and, at half weight, the neighbouring bucket nearest to the price, so
+prices either side of a bucket edge still match). Features are weighted by
+kind and by inverse document frequency, so a rare attribute says more than
+one every product has, and rows are L2-normalised: the dot product of two
+rows is then their cosine similarity.
+
+Neighbours are only searched within a product's category. Each category
+is scored in blocks of rows, one matrix product per block sized to stay
+under BLOCK_BYTES, and the top K of every row are picked with
+argpartition.
+"""
+import math
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+from .models import Product, ProductAttribute, ProductRecommendation
+
+FEATURE_WEIGHTS = {
+    'brand': 1.0,
+    'category': 0.5,
+    'sub_category': 1.5,
+    'attribute': 1.0,
+    'price': 0.75,
+}
+# Consecutive price buckets are 25% apart
+PRICE_RATIO = 1.25
+# Memory for one block of scores (float32)
+BLOCK_BYTES = 32 * 2**20
+# Categories whose feature matrix fits in this are multiplied dense (BLAS), larger ones sparse
+DENSE_BYTES = 128 * 2**20
+NO_CATEGORY = -1
+
+
+def load_rows():
+    """(products, attributes) of the catalog, in the shapes feature_matrix takes."""
+    products = list(
+        Product.objects.order_by('pk')
+        .values_list('pk', 'brand_id', 'category_id', 'sub_category_id', 'price')
+        .iterator(chunk_size=10000)
+    )
+    attributes = ProductAttribute.objects.values_list('product_id', 'attribute', 'value').iterator(chunk_size=10000)
+    return products, attributes
+
+
+def price_features(price):
+    if not price or price <= 0:
+        return []
+    position = math.log(price) / math.log(PRICE_RATIO)
+    bucket = math.floor(position)
+    neighbour = bucket + 1 if position - bucket >= 0.5 else bucket - 1
+    return [(('price', bucket), 1.0), (('price', neighbour), 0.5)]
+
+
+def feature_matrix(products, attributes):
+    """
+    (keys, groups, matrix) for products, rows of (pk, brand_id, category_id,
+    sub_category_id, price), and attributes, rows of (product_id, key, value).
+    matrix is the L2-normalised float32 CSR product x feature matrix, groups
+    the category of each row (NO_CATEGORY for none).
+    """
+    keys = []
+    positions = {}
+    groups = []
+    vocabulary = {}
+    rows, cols, weights = [], [], []
+
+    def add(row, feature, weight):
+        rows.append(row)
+        cols.append(vocabulary.setdefault(feature, len(vocabulary)))
+        weights.append(FEATURE_WEIGHTS[feature[0]] * weight)
+
+    for row, (pk, brand, category, sub_category, price) in enumerate(products):
+        keys.append(pk)
+        positions[pk] = row
+        groups.append(NO_CATEGORY if category is None else category)
+        if brand is not None:
+            add(row, ('brand', brand), 1.0)
+        if category is not None:
+            add(row, ('category', category), 1.0)
+        if sub_category is not None:
+            add(row, ('sub_category', sub_category), 1.0)
+        for feature, weight in price_features(price):
+            add(row, feature, weight)
+
+    seen = set()
+    for pk, key, value in attributes:
+        row = positions.get(pk)
+        key, value = (key or '').strip().lower(), (value or '').strip().lower()
+        if row is None or not key or not value or (row, key, value) in seen:
+            continue
+        seen.add((row, key, value))
+        add(row, ('attribute', key, value), 1.0)
+
+    matrix = sparse.csr_matrix(
+        (np.array(weights, dtype=np.float32), (rows, cols)),
+        shape=(len(keys), len(vocabulary)),
+    )
+    # Smoothed inverse document frequency
+    document_frequency = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    idf = np.log((1 + len(keys)) / (1 + document_frequency)) + 1
+    matrix.data *= idf[matrix.indices].astype(np.float32)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    matrix.data /= np.repeat(norms, np.diff(matrix.indptr)).astype(np.float32)
+    return keys, np.array(groups, dtype=np.int64), matrix
+
+
+def group_neighbours(matrix, members, k, min_score, block_bytes):
+    """Yields (row, [(row, cosine), ...] best first) for the rows members of matrix, compared with each other."""
+    size = len(members)
+    k = min(k, size - 1)
+    if k <= 0:
+        for row in members:
+            yield int(row), []
+        return
+    block = matrix[members]
+    block = block[:, np.unique(block.indices)]
+    dense = block.toarray() if block.shape[0] * block.shape[1] * 4 <= DENSE_BYTES else None
+    transposed = dense.T if dense is not None else block.T.tocsr()
+    step = max(1, block_bytes // (4 * size))
+    for start in range(0, size, step):
+        stop = min(start + step, size)
+        if dense is not None:
+            scores = dense[start:stop] @ transposed
+        else:
+            scores = (block[start:stop] @ transposed).toarray()
+        # A product is not its own neighbour
+        scores[np.arange(stop - start), np.arange(start, stop)] = -1
+        best = np.argpartition(scores, size - k, axis=1)[:, size - k:]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        for offset in range(stop - start):
+            keep = best_scores[offset] >= min_score
+            yield int(members[start + offset]), list(zip(
+                members[best[offset][keep]].tolist(), best_scores[offset][keep].tolist(),
+            ))
+
+
+def top_similar(matrix, groups, k, min_score=0.1, block_bytes=BLOCK_BYTES):
+    """Yields (row, [(row, cosine), ...] best first) for every row of matrix, one category after the other."""
+    order = np.argsort(groups, kind='stable')
+    boundaries = np.flatnonzero(np.diff(groups[order])) + 1
+    for members in np.split(order, boundaries):
+        if len(members):
+            yield from group_neighbours(matrix, members, k, min_score, block_bytes)
+
+
+def write_recommendations(keys, neighbours, batch_size):
+    """Replaces the similar lists of the products in neighbours, batch_size products per transaction."""
+    section = ProductRecommendation.SIMILAR
+    total = 0
+    batch = []
+
+    def flush():
+        products = [keys[row] for row, ranked in batch]
+        rows = [
+            ProductRecommendation(
+                product_id=keys[row], recommended_id=keys[other], section=section, rank=rank, score=score,
+            )
+            for row, ranked in batch
+            for rank, (other, score) in enumerate(ranked)
+        ]
+        with transaction.atomic():
+            ProductRecommendation.objects.filter(product_id__in=products, section=section).delete()
+            ProductRecommendation.objects.bulk_create(rows)
+
+    for item in neighbours:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            flush()
+            total += len(batch)
+            batch = []
+    if batch:
+        flush()
+        total += len(batch)
+    return total
+
+
+def run(k=ProductRecommendation.LIMIT, min_score=0.1, batch_size=1000):
+    """Recompute the similar list of every product. Returns the number of products."""
+    keys, groups, matrix = feature_matrix(*load_rows())
+    return write_recommendations(keys, top_similar(matrix, groups, k, min_score), batch_size)
@@ -1,3 +1,244 @@
-from django.test import TestCase
+import base64
+import json
+import threading
+import time
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from cart.checkout import place_order
+from userauth.models import User
+from .autocomplete import AutocompleteIndex, catalog_state
+from .facebook import suppress_posts
+from .inventory import OutOfStock
+from .models import (
+    Brand, Category, Color, Product, ProductAttribute, ProductImage, Rating, Size, SizeColorStock, StockReservation,
+    SubCategory, Variant,
+)
+
+
+class CatalogQueryCountTests(TestCase):
+    """
+    The catalog endpoints cost a fixed number of queries whatever the page
+    size: a relation loaded per product instead of per page shows up here as
+    a count growing with page_size.
+    """
+    PRODUCTS = 60
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [User.objects.create_user(email=f'user{i}@example.com', name=f'user{i}', password='x') for i in range(3)]
+        brands = [Brand.objects.create(name=f'Brand {i}') for i in range(3)]
+        categories = [Category.objects.create(name=f'Category{i}') for i in range(3)]
+        sub_category = SubCategory.objects.create(name='Tops', category=categories[0])
+        for i in range(cls.PRODUCTS):
+            product = Product.objects.create(
+                name=f'Cotton Shirt {i}', brand=brands[i % 3], category=categories[i % 3],
+                sub_category=sub_category if i % 2 else None, price=100 + i, description='<p>Cotton</p>',
+            )
+            color = Color.objects.create(product=product, name='Red', hex='#ff0000')
+            size = Size.objects.create(product=product, name='M')
+            SizeColorStock.objects.create(product=product, size=size, color=color, stock=i % 3)
+            ProductImage.objects.create(product=product, color=color, image=f'shop/images/{i}.jpg')
+            ProductAttribute.objects.create(product=product, attribute='material', value='cotton')
+            Variant.objects.create(product=product, name='Regular')
+            for user in users[:i % 4]:
+                Rating.objects.create(product=product, user=user, rating=i % 5 + 1, comment='Fine')
+        cls.product = Product.objects.order_by('pk').first()
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def count_queries(self, url):
+        # Cold caches: response, document and count caches would otherwise hide the queries
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url, expected):
+        for page_size in (10, 50):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(self.count_queries(f'{url}page_size={page_size}'), expected)
+
+    def test_list(self):
+        self.assertConstantQueries('/shop/api/?', 10)
+
+    def test_list_cards(self):
+        self.assertConstantQueries('/shop/api/?view=card&', 2)
+
+    def test_list_sparse_fields(self):
+        self.assertConstantQueries('/shop/api/?fields=product_id,name,price,images&', 3)
+
+    def test_count_is_not_cached_per_process(self):
+        self.count_queries('/shop/api/?view=card&page_size=10')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/shop/api/?view=card&page_size=20')
+        self.assertTrue(any('COUNT(' in query['sql'] for query in queries))
+
+    def test_detail(self):
+        self.assertEqual(self.count_queries(f'/shop/api/{self.product.pk}/'), 9)
+
+    def test_detail_sparse_fields(self):
+        self.assertEqual(self.count_queries(f'/shop/api/{self.product.pk}/?fields=product_id,name,price'), 2)
+
+    def test_facets(self):
+        self.assertEqual(self.count_queries('/shop/api/facets/'), 3)
+        self.assertEqual(self.count_queries('/shop/api/facets/?category=Category1&in_stock=1'), 3)
+
+
+class ProductSaveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.brands = [Brand.objects.create(name=f'Brand {i}') for i in range(2)]
+        cls.category = Category.objects.create(name='Tops')
+        cls.product = Product.objects.create(name='Shirt', brand=cls.brands[0], category=cls.category, description='')
+
+    def test_save_copies_the_card_names(self):
+        self.assertEqual((self.product.card_brand, self.product.card_category), ('Brand 0', 'Tops'))
+
+    def test_unchanged_relations_are_not_looked_up(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.price = 10
+        with CaptureQueriesContext(connection) as queries:
+            product.save()
+        self.assertFalse(any('shop_brand' in query['sql'] or 'shop_category' in query['sql'] for query in queries))
+
+    def test_changed_brand_is_copied(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.brand = self.brands[1]
+        product.save()
+        self.assertEqual(Product.objects.get(pk=product.pk).card_brand, 'Brand 1')
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand, category = Brand.objects.create(name='Brand'), Category.objects.create(name='Tops')
+        for i in range(5):
+            Product.objects.create(name=f'Shirt {i}', brand=brand, category=category, price=10 * (i % 2), description='')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_pages_follow_the_ordering(self):
+        url, names = '/shop/api/?pagination=cursor&page_size=2&ordering=price&ordering=-name', []
+        while url:
+            page = self.client.get(url).json()
+            names += [product['name'] for product in page['results']]
+            url = page['links']['next']
+        self.assertEqual(names, ['Shirt 4', 'Shirt 2', 'Shirt 0', 'Shirt 3', 'Shirt 1'])
+
+    def test_ordering_outside_the_keyset_is_rejected(self):
+        response = self.client.get('/shop/api/?pagination=cursor&ordering=old_price')
+        self.assertEqual(response.status_code, 400)
+
+    def test_malformed_cursor_is_not_found(self):
+        for cursor in ({'v': 5}, {'v': None}, ['v'], {'v': ['cheap', 1]}):
+            encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f'/shop/api/?pagination=cursor&ordering=price&cursor={encoded}')
+                self.assertEqual(response.status_code, 404)
+
+
+class AutocompleteIndexTests(SimpleTestCase):
+    def suggest(self, names, query):
+        index = AutocompleteIndex([(f'p{i}', name, '', 0) for i, name in enumerate(names)], image_url=lambda name: None)
+        return [row['name'] for row in index.suggest(query)]
+
+    def test_prefix_matches_rank_first_however_many_other_matches(self):
+        names = [f'Organic cotton {i}' for i in range(100)] + [f'Polycotton {i}' for i in range(100)]
+        names.append('Cotton baby blanket with a rather long name')
+        self.assertEqual(self.suggest(names, 'cotton')[:2], ['Cotton baby blanket with a rather long name', 'Organic cotton 0'])
+
+    def test_word_starts_rank_before_other_substrings(self):
+        names = [f'Polycotton {i}' for i in range(100)] + ['Soft cotton romper']
+        self.assertEqual(self.suggest(names, 'cotton')[0], 'Soft cotton romper')
+
+
+class AutocompleteRefreshTests(TestCase):
+    def test_per_process_cache_follows_the_products_table(self):
+        # The test cache is a LocMemCache, whose version bumps the other workers would not see
+        product = Product.objects.create(
+            name='Shirt', description='', brand=Brand.objects.create(name='Brand'),
+            category=Category.objects.create(name='Tops'),
+        )
+        before = catalog_state()
+        Product.objects.filter(pk=product.pk).update(name='Blouse', updated_at=timezone.now())
+        self.assertNotEqual(catalog_state(), before)
+        before = catalog_state()
+        Product.objects.filter(pk=product.pk).delete()
+        self.assertNotEqual(catalog_state(), before)
+
+
+class StockReservationConcurrencyTests(TransactionTestCase):
+    """
+    Many checkouts at once on one hot SKU: none may oversell, fail or lose
+    stock, or wait long for the stock row. Runs against SQLite (one writer
+    at a time, queueing for the database lock) and PostgreSQL (row locks),
+    e.g. PRODUCTION=True with the POSTGRES_* variables of docker-compose.
+    """
+    STOCK = 50
+    CHECKOUTS = 200
+    THREADS = 16
+    # (p95, max) seconds a checkout may take, waiting for the stock included. SQLite waiters poll for
+    # the database lock, sleeping up to 100ms between tries, so a few lose several turns to the others
+    LATENCY = {'sqlite': (2, 5)}
+    DEFAULT_LATENCY = (1, 3)
+    DELIVERY = {
+        'phone_number': '9800000000', 'first_name': 'Stress', 'last_name': 'Test', 'email': '',
+        'shipping_address': 'Somewhere', 'payment_method': 'COD', 'shipping_cost': 0, 'subtotal': 0,
+        'discount': 0, 'payment_amount': 0, 'payment_status': 'Pending',
+    }
+
+    def setUp(self):
+        with suppress_posts():
+            product = Product.objects.create(
+                name='Hot product', description='',
+                brand=Brand.objects.create(name='Brand'), category=Category.objects.create(name='Tops'),
+            )
+        self.row = SizeColorStock.objects.create(product=product, size=Size.objects.create(product=product, name='M'), stock=self.STOCK)
+        self.item = {'product_id': product.pk, 'size': 'M', 'quantity': 1, 'price': 0}
+
+    def checkout(self, outcomes, latencies, lock, remaining):
+        try:
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        return
+                started = time.perf_counter()
+                try:
+                    place_order(None, [self.item], self.DELIVERY)
+                    outcome = 'placed'
+                except OutOfStock:
+                    outcome = 'out of stock'
+                except Exception as e:
+                    outcome = f"error: {type(e).__name__}: {e}"
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+                    outcomes.append(outcome)
+        finally:
+            connections.close_all()
+
+    def test_no_oversell(self):
+        outcomes, latencies, lock, remaining = [], [], threading.Lock(), iter(range(self.CHECKOUTS))
+        threads = [threading.Thread(target=self.checkout, args=(outcomes, latencies, lock, remaining)) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([outcome for outcome in outcomes if outcome.startswith('error:')], [])
+        self.assertEqual(outcomes.count('placed'), self.STOCK)
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.stock, 0)
+        self.assertEqual(sum(StockReservation.objects.filter(stock=self.row).values_list('quantity', flat=True)), self.STOCK)
+        latencies.sort()
+        p95_bound, max_bound = self.LATENCY.get(connection.vendor, self.DEFAULT_LATENCY)
+        self.assertLess(latencies[int(len(latencies) * 0.95)], p95_bound)
+        self.assertLess(latencies[-1], max_bound)
 
-# Create your tests here.
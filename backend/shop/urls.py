@@ -19,10 +19,12 @@ urlpatterns = [
     path('', include(router.urls)),
     path('api/', views.GetProduct.as_view(), name='api'),
     path('api/admin/search/', views.AdminProductSearch.as_view(), name='admin_product_search'),
+    path('api/admin/cache-stats/', views.ResponseCacheStatsView.as_view(), name='response_cache_stats'),
     path('api/tagged/', views.TaggedProductsView.as_view(), name='tagged_products'),
     path('api/deals/', views.GetDealProduct.as_view(), name='api'),
     path('api/navsearch/', views.NavSearchView.as_view(), name='search'),
     path('api/navcat/', views.NavCatView.as_view(), name='navcat'),
+    path('api/facets/', views.FacetsView.as_view(), name='facets'),
     path('api/search/', views.ApiSearch.as_view(), name='search'),
     path('api/recommendations/', views.RecommendationsView.as_view(), name='recommendations'),
     path('api/<slug:id>/', views.ProductSearch.as_view(), name='about_product'),
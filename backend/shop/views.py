@@ -1,7 +1,8 @@
 from django.shortcuts import render
-from .models import Product, Comment, Color, Size, SizeColorStock, ProductImage, Category, Brand
+from .models import Product, Comment, Color, Size, SizeColorStock, ProductImage, Category, Brand, ProductRecommendation
 from math import ceil
 from .serializers import ProductSerializer, CommentSerializer, ReplySerializer, RatingSerializer, GetProductSerializer, ColorSerializer, SizeSerializer, SizeColorStockSerializer, ProductImageSerializer
+from .serializers import CARD_COLUMNS, wants_cards, product_cards
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import filters, viewsets
@@ -9,10 +10,21 @@ from rest_framework import generics
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
-from rest_framework.pagination import PageNumberPagination
-from django.db.models import Avg, Count, Q
+from .pagination import CustomPagination, get_catalog_paginator
+from .search import ProductSearchFilter, search_products
+from . import autocomplete, ranking
+from .caching import catalog_version, filter_key, shared_cache
+from .facets import product_facets
+from .response_cache import CachedResponseMixin, response_cache_stats
+from .conditional import ConditionalGetMixin, RowConditionalGetMixin
+from .documents import ITEM, documents_enabled, get_document, get_documents
+from django.core.cache import cache
+from django.db.models import Q, F, Value, FloatField
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.conf import settings
+from django.core.files.storage import default_storage
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
 
 
 # @api_view(['GET'])
@@ -22,25 +34,87 @@ from rest_framework.permissions import IsAuthenticated
 #     return Response(serializer.data)                  
 #function based view ma image ko right path janna only relative path like / media/shop/images bata janxa so class based use grya
 
-class CustomPagination(PageNumberPagination):
-    page_size = 100
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-    
-    def get_paginated_response(self, data):
-        return Response({
-            'links': {
-                'next': self.get_next_link(),
-                'previous': self.get_previous_link()
-            },
-            'count': self.page.paginator.count,
-            'total_pages': self.page.paginator.num_pages,
-            'current_page': self.page.number,
-            'results': data
-        })
+def with_ratings(queryset):
+    """
+    Annotate rating/ratings_count from ProductRatingSummary. The rating is
+    the exact total / count of the summary row, so filtering and ordering on
+    it needs no GROUP BY and is no coarser than an Avg over the ratings.
+    """
+    return queryset.annotate(
+        rating=Cast('rating_summary__total', FloatField()) / NullIf('rating_summary__count', 0),
+        ratings_count=Coalesce(F('rating_summary__count'), Value(0)),
+    )
+
+
+def in_stock_requested(request):
+    """?in_stock=1 hides sold out products using the Product.in_stock rollup."""
+    return request.query_params.get('in_stock', '').lower() in ('1', 'true', 'yes')
+
+
+def filter_catalog(queryset, request):
+    """Apply the listing filters (search, category, sub_category, brand, price, rating, in_stock) of request."""
+    params = request.query_params
+    search = params.get('search', '').strip()
+    if search:
+        results = search_products(queryset, search)
+        queryset = results if results is not None else queryset.filter(name__icontains=search)
+    if params.get('category'):
+        queryset = queryset.filter(category__name__icontains=params['category'])
+    if params.get('sub_category'):
+        queryset = queryset.filter(sub_category__name__iexact=params['sub_category'])
+    if params.get('brand'):
+        queryset = queryset.filter(card_brand__icontains=params['brand'])
+    for param, lookup in (('min_price', 'price__gte'), ('max_price', 'price__lte'), ('min_rating', 'card_rating__gte')):
+        try:
+            queryset = queryset.filter(**{lookup: float(params[param])})
+        except (KeyError, ValueError, TypeError):
+            pass
+    if in_stock_requested(request):
+        queryset = queryset.filter(in_stock=True)
+    return queryset
+
+
+def paginated_documents(paginator, queryset, request, view):
+    """A page of full products assembled from their cached documents; the queryset only yields the keys."""
+    page = paginator.paginate_queryset(queryset.only('pk', 'updated_at'), request, view=view)
+    versions = {product.pk: product.updated_at for product in page}
+    return paginator.get_paginated_response(get_documents([product.pk for product in page], ITEM, request, versions))
+
 
+class ProductListMixin:
+    """
+    Shared behaviour of the generic product listings: ?view=card returns
+    product cards straight from .values(), otherwise the serializer's field
+    selection and select/prefetch plan are applied to the list queryset.
+    """
 
-class GetProduct(APIView):
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if wants_cards(self.request):
+            return queryset.values(*CARD_COLUMNS)
+        return self.get_serializer_class().setup_query(queryset, self.request)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            self._paginator = get_catalog_paginator(self.request)
+        return self._paginator
+
+    def list(self, request, *args, **kwargs):
+        if self.get_serializer_class() is ProductSerializer and documents_enabled(request):
+            # Only the page's keys are queried, the products come from the document cache
+            queryset = super().filter_queryset(self.get_queryset())
+            return paginated_documents(self.paginator, queryset, request, self)
+        if not wants_cards(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(product_cards(page, request))
+        return Response(product_cards(queryset, request))
+
+
+class GetProduct(ConditionalGetMixin, CachedResponseMixin, APIView):
     def get(self, request, format=None):
         # Retrieve query parameters for filtering
         min_rating = request.query_params.get('min_rating')
@@ -50,11 +124,8 @@ class GetProduct(APIView):
         ordering_fields = request.query_params.getlist('ordering')
         brand = request.query_params.get('brand')
         category = request.query_params.get('category')
-        # Base queryset annotated with average rating and rating count
-        queryset = Product.objects.all().annotate(
-            rating=Avg('ratings__rating'),
-            ratings_count=Count('ratings')
-        ).order_by('-product_id')
+        # Base queryset annotated with the maintained rating average and count
+        queryset = with_ratings(Product.objects.all()).order_by('-product_id')
         
         # Apply filtering based on min_rating, min_price, and max_price if provided
         if min_rating:
@@ -84,6 +155,8 @@ class GetProduct(APIView):
                 print(queryset)
             except (ValueError, TypeError,):
                 pass
+        if in_stock_requested(request):
+            queryset = queryset.filter(in_stock=True)
         # Apply ordering based on multiple parameters
         if ordering_fields:
             # If there's only one ordering field and it contains spaces, split it into parts.
@@ -92,7 +165,15 @@ class GetProduct(APIView):
             queryset = queryset.order_by(*ordering_fields)
         
         # Paginate the queryset using the custom pagination class
-        paginator = CustomPagination()
+        paginator = get_catalog_paginator(request)
+        if wants_cards(request):
+            page = paginator.paginate_queryset(queryset.values(*CARD_COLUMNS), request, view=self)
+            return paginator.get_paginated_response(product_cards(page, request))
+
+        if documents_enabled(request):
+            return paginated_documents(paginator, queryset, request, self)
+
+        queryset = ProductSerializer.setup_query(queryset, request)
         paginated_queryset = paginator.paginate_queryset(queryset, request, view=self)
         serializer = ProductSerializer(paginated_queryset, many=True, context={'request': request})
         
@@ -131,22 +212,28 @@ class AdminProductSearch(APIView):
         
         # Filter by search query if provided
         if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) |
-                Q(description__icontains=search_query) |
-                Q(category__name__icontains=search_query) |
-                Q(brand__name__icontains=search_query)
-            )
+            results = search_products(queryset, search_query)
+            if results is not None:
+                queryset = results.order_by('-search_rank', '-product_id')
+            else:
+                queryset = queryset.filter(
+                    Q(name__icontains=search_query) |
+                    Q(description__icontains=search_query) |
+                    Q(category__name__icontains=search_query) |
+                    Q(brand__name__icontains=search_query)
+                )
         
+        queryset = ProductSerializer.setup_query(queryset, request)
+
         # Paginate the queryset
-        paginator = CustomPagination()
+        paginator = get_catalog_paginator(request)
         paginated_queryset = paginator.paginate_queryset(queryset, request, view=self)
         serializer = ProductSerializer(paginated_queryset, many=True, context={'request': request})
         
         return paginator.get_paginated_response(serializer.data)
 
 
-class GetDealProduct(APIView):
+class GetDealProduct(ConditionalGetMixin, CachedResponseMixin, APIView):
 
     def get(self, request, format=None):
         # Retrieve query parameters for filtering
@@ -156,11 +243,8 @@ class GetDealProduct(APIView):
         # Instead of a single 'ordering' value, expect multiple ordering parameters
         ordering_fields = request.query_params.getlist('ordering')
         brand = request.query_params.get('brand')
-        # Base queryset annotated with average rating and rating count
-        queryset = Product.objects.filter(deal=True).annotate(
-            rating=Avg('ratings__rating'),
-            ratings_count=Count('ratings'),
-        )
+        # Base queryset annotated with the maintained rating average and count
+        queryset = with_ratings(Product.objects.filter(deal=True))
         
         # Apply filtering based on min_rating, min_price, and max_price if provided
         if min_rating:
@@ -183,6 +267,8 @@ class GetDealProduct(APIView):
                 queryset = queryset.filter(brand__name__icontains=brand)
             except (ValueError, TypeError,):
                 pass
+        if in_stock_requested(request):
+            queryset = queryset.filter(in_stock=True)
         # Apply ordering based on multiple parameters
         if ordering_fields:
             # If there's only one ordering field and it contains spaces, split it into parts.
@@ -191,7 +277,15 @@ class GetDealProduct(APIView):
             queryset = queryset.order_by(*ordering_fields)
         
         # Paginate the queryset using the custom pagination class
-        paginator = CustomPagination()
+        paginator = get_catalog_paginator(request)
+        if wants_cards(request):
+            page = paginator.paginate_queryset(queryset.values(*CARD_COLUMNS), request, view=self)
+            return paginator.get_paginated_response(product_cards(page, request))
+
+        if documents_enabled(request):
+            return paginated_documents(paginator, queryset, request, self)
+
+        queryset = ProductSerializer.setup_query(queryset, request)
         paginated_queryset = paginator.paginate_queryset(queryset, request, view=self)
         serializer = ProductSerializer(paginated_queryset, many=True, context={'request': request})
         
@@ -200,19 +294,16 @@ class GetDealProduct(APIView):
 
 
 
-class ApiSearch(generics.ListAPIView):
+class ApiSearch(ConditionalGetMixin, ProductListMixin, generics.ListAPIView):
     serializer_class = GetProductSerializer 
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [ProductSearchFilter, filters.OrderingFilter]
     search_fields = ['product_id','name', 'description','brand__name','category__name','sub_category__name']
     ordering_fields = ['price']  # Add more ordering fields if needed
     pagination_class = CustomPagination
 
     def get_queryset(self):
-        # Base queryset annotated with average rating and ratings count
-        queryset = Product.objects.all().annotate(
-            rating=Avg('ratings__rating'),
-            ratings_count=Count('ratings')
-        )   
+        # Base queryset annotated with the maintained rating average and count
+        queryset = with_ratings(Product.objects.all())   
         
         request = self.request
         # Retrieve query parameters for filtering
@@ -248,6 +339,9 @@ class ApiSearch(generics.ListAPIView):
             except (ValueError, TypeError):
                 pass
 
+        if in_stock_requested(request):
+            queryset = queryset.filter(in_stock=True)
+
         # Apply ordering if provided. If a single ordering parameter contains spaces,
         # split it into multiple fields.
         if ordering_fields:
@@ -258,21 +352,39 @@ class ApiSearch(generics.ListAPIView):
         return queryset
 
 
-class BrandSearch(generics.ListAPIView):
+class BrandSearch(ConditionalGetMixin, ProductListMixin, generics.ListAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['brandName']
     ordering_fields = ['price']
 
-class ProductSearch(APIView):
-    
+class ProductSearch(RowConditionalGetMixin, CachedResponseMixin, APIView):
+    conditional_queryset = Product.objects.all()
+
+    def get_cache_namespaces(self, request, id=None, **kwargs):
+        return [f'product:{id}']
+
     def get(self,request,id):
+        if documents_enabled(request):
+            document = get_document(id, request, self.row_updated_at)
+            if document is None:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            self.cache_depends_on(
+                f"brand:{document['brand']}", f"category:{document['category']}", f"sub_category:{document['sub_category']}"
+            )
+            return Response(document)
         try:
-            product = Product.objects.get(pk=id)
+            product = ProductSerializer.setup_query(Product.objects.all(), request).get(pk=id)
         except Product.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
         serializer = ProductSerializer(product,context={"request": request})
+        # The detail shows the brand, category and sub-category names, unless ?fields leaves them out
+        self.cache_depends_on(*(
+            f'{namespace}:{getattr(product, f"{namespace}_id")}'
+            for name, namespace in (('brandName', 'brand'), ('category_name', 'category'), ('sub_category_name', 'sub_category'))
+            if name in serializer.fields
+        ))
         return Response(serializer.data)
 
     def patch(self, request, id):
@@ -334,7 +446,7 @@ class ProductSearch(APIView):
 
         
 
-class CatSearch(generics.ListAPIView):
+class CatSearch(ConditionalGetMixin, CachedResponseMixin, ProductListMixin, generics.ListAPIView):
     serializer_class = ProductSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     ordering_fields = ['price', 'min_rating','rating','min_price','max_price']
@@ -348,10 +460,7 @@ class CatSearch(generics.ListAPIView):
         max_price = self.request.query_params.get('max_price')
         
         queryset = Product.objects.filter(category__name__iexact=cat)
-        queryset = queryset.annotate(
-            rating=Avg('ratings__rating'),
-            ratings_count=Count('ratings')
-        )
+        queryset = with_ratings(queryset)
 
         if min_rating:
             try:
@@ -372,11 +481,13 @@ class CatSearch(generics.ListAPIView):
                 queryset = queryset.filter(price__lte=max_price)
             except (ValueError, TypeError):
                 pass
+        if in_stock_requested(self.request):
+            queryset = queryset.filter(in_stock=True)
 
         return queryset
 
     
-class SubcatSearch(generics.ListAPIView):
+class SubcatSearch(ConditionalGetMixin, CachedResponseMixin, ProductListMixin, generics.ListAPIView):
     serializer_class = ProductSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     ordering_fields = ['price', 'min_rating','rating','min_price','max_price']
@@ -390,10 +501,7 @@ class SubcatSearch(generics.ListAPIView):
         
         queryset = Product.objects.filter(sub_category__iexact=sub_cat)
 
-        queryset = queryset.annotate(
-            rating=Avg('ratings__rating'),
-            ratings_count=Count('ratings')
-        )
+        queryset = with_ratings(queryset)
         
         # Filter by minimum rating if provided
         if min_rating:
@@ -415,10 +523,12 @@ class SubcatSearch(generics.ListAPIView):
                 queryset = queryset.filter(price__lte=max_price)
             except (ValueError, TypeError):
                 pass
+        if in_stock_requested(self.request):
+            queryset = queryset.filter(in_stock=True)
 
         return queryset
     
-class CatBrandSearch(generics.ListAPIView):
+class CatBrandSearch(ConditionalGetMixin, CachedResponseMixin, ProductListMixin, generics.ListAPIView):
     serializer_class = ProductSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     ordering_fields = ['price', 'min_rating','rating','min_price','max_price']
@@ -438,10 +548,7 @@ class CatBrandSearch(generics.ListAPIView):
 
         else:
             queryset = Product.objects.filter(category__iexact=cat)
-        queryset = queryset.annotate(
-            rating=Avg('ratings__rating'),
-            ratings_count=Count('ratings')
-        )
+        queryset = with_ratings(queryset)
 
         if min_rating:
             try:
@@ -462,6 +569,8 @@ class CatBrandSearch(generics.ListAPIView):
                 queryset = queryset.filter(price__lte=max_price)
             except (ValueError, TypeError):
                 pass
+        if in_stock_requested(self.request):
+            queryset = queryset.filter(in_stock=True)
 
         return queryset
     
@@ -505,41 +614,58 @@ class RatingView(APIView):
 
 class NavSearchView(APIView):   
     def get(self,request):
-        search = request.query_params.get('search')
-        #now get 10 products that match the search
-        products = Product.objects.filter(name__icontains=search)[:10]
-        list = []
-        for p in products:
-            list.append({"name":p.name,"id":p.product_id,"image":p.images.first().image.url, "price":p.price})
-        return Response(list)
+        search = request.query_params.get('search', '')
+        # 10 suggestions from the in-process autocomplete index, no database access
+        return Response(autocomplete.suggest(search))
 
 class NavCatView(APIView):
     def get(self,request):
         search = request.query_params.get('search')
         #now get brands that match the search
         #filter the products that match the search and then get brands that match the search
-        products = Product.objects.filter(category__name__iexact=search)
-        list = []
-        brands = []
-        for p in products:
-            brand = p.brand.name
-            if brand not in brands:
-                brands.append(brand)
-                list.append({"brand":brand})
-        return Response(list)
-
-
-class TaggedProductsView(APIView):
-    def get(self,request):
-        tag = request.query_params.get('tag')
-        if tag == 'trending':
-            products = Product.objects.filter(trending=True)
-        elif tag == 'best_seller':
-            products = Product.objects.filter(best_seller=True)
-        elif tag == 'latest':
-            products = Product.objects.all().order_by('-published_date')[:12]
-        serializer = ProductSerializer(products,many=True,context={'request': request})
-        return Response(serializer.data)
+        brands = (
+            Product.objects.filter(category__name__iexact=search)
+            .exclude(card_brand='')
+            .values_list('card_brand', flat=True)
+            .distinct()
+            .order_by('card_brand')
+        )
+        return Response([{"brand": brand} for brand in brands])
+
+
+class FacetsView(APIView):
+    """
+    Brand, sub-category, price, rating and stock counts for the products
+    matching the listing filters of the request, cached per catalog version
+    and normalized filter set when the cache is shared.
+    """
+
+    def get(self, request):
+        if not shared_cache():
+            return Response(product_facets(filter_catalog(Product.objects.all(), request)))
+        key = f"catalog-facets:{catalog_version()}:{filter_key(request)}"
+        facets = cache.get(key)
+        if facets is None:
+            facets = product_facets(filter_catalog(Product.objects.all(), request))
+            cache.set(key, facets, settings.CATALOG_FACETS_CACHE_TIMEOUT)
+        return Response(facets)
+
+
+class TaggedProductsView(ConditionalGetMixin, CachedResponseMixin, ProductListMixin, generics.ListAPIView):
+    """
+    ?tag=trending and ?tag=best_seller page through the computed rankings
+    (flagged products first), ?tag=latest through the newest products.
+    """
+    serializer_class = ProductSerializer
+    pagination_class = CustomPagination
+
+    def get_queryset(self):
+        tag = self.request.query_params.get('tag')
+        if tag in ranking.RANKINGS:
+            return ranking.ranked_products(tag)
+        if tag == 'latest':
+            return Product.objects.order_by('-published_date', '-pk')
+        raise ValidationError({'tag': "Expected one of 'trending', 'best_seller' or 'latest'."})
 
 
 # ViewSets for Color, Size, Category, Brand, and ProductImage
@@ -605,124 +731,56 @@ class BrandViewSet(viewsets.ModelViewSet):
         return BrandSerializer
 
 
-class RecommendationsView(APIView):
+class RecommendationsView(ConditionalGetMixin, CachedResponseMixin, APIView):
     """
     Provides product recommendations based on the current product.
     Returns upsells, complementary products, and trending products.
     """
     
-    # Complementary category mappings for cross-sells
-    COMPLEMENTARY_CATEGORIES = {
-        'moms': ['babies', 'kids', 'nursing'],
-        'babies': ['moms', 'clothing', 'toys'],
-    }
-    
     def get(self, request):
         product_id = request.query_params.get('product_id')
         
         if not product_id:
             return Response({'error': 'product_id is required'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        try:
-            current_product = Product.objects.get(product_id=product_id)
-        except Product.DoesNotExist:
-            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
-        
-        recommendations = {
-            'same_category': [],
-            'complementary': [],
-            'trending': []
-        }
-        
-        # Get category name for complementary products
-        category_name = current_product.category.name.lower() if current_product.category else ''
-        
-        # 1. SAME CATEGORY: All products in same category, prioritize by score
-        if current_product.category:
-            same_cat_candidates = Product.objects.filter(
-                category=current_product.category
-            ).exclude(
-                product_id=product_id
-            )
-            
-            # Calculate priority score: trending=4, featured=3, best_seller=2, deal=1
-            same_cat_products = []
-            for product in same_cat_candidates:
-                score = 0
-                if product.trending:
-                    score += 4
-                if product.featured:
-                    score += 3
-                if product.best_seller:
-                    score += 2
-                if product.deal:
-                    score += 1
-                same_cat_products.append((product, score))
-            
-            # Sort by priority score (descending) and take top 12
-            same_cat_products.sort(key=lambda x: x[1], reverse=True)
-            recommendations['same_category'] = ProductSerializer(
-                [p[0] for p in same_cat_products[:12]], 
-                many=True, 
-                context={'request': request}
-            ).data
-        
-        # 2. COMPLEMENTARY PRODUCTS: Cross-category recommendations
-        complementary_cats = []
-        for key, values in self.COMPLEMENTARY_CATEGORIES.items():
-            if key in category_name:
-                complementary_cats = values
-                break
-        
-        if complementary_cats:
-            # Get categories that match complementary names
-            matching_categories = Category.objects.filter(
-                name__iregex=r'(' + '|'.join(complementary_cats) + ')'
-            )
-            
-            if matching_categories.exists():
-                complementary_products = Product.objects.filter(
-                    category__in=matching_categories
-                ).exclude(
-                    product_id=product_id
-                )
-                
-                # Calculate priority scores
-                comps = []
-                for product in complementary_products:
-                    score = 0
-                    if product.trending:
-                        score += 4
-                    if product.featured:
-                        score += 3
-                    if product.best_seller:
-                        score += 2
-                    if product.deal:
-                        score += 1
-                    comps.append((product, score))
-                
-                # Sort by priority and take top 12
-                comps.sort(key=lambda x: x[1], reverse=True)
-                recommendations['complementary'] = ProductSerializer(
-                    [p[0] for p in comps[:12]], 
-                    many=True, 
-                    context={'request': request}
-                ).data
-        
-        # 3. FALLBACK: Trending products if not enough recommendations
-        total_recs = len(recommendations['same_category']) + len(recommendations['complementary'])
-        if total_recs < 12:
-            needed = 12 - total_recs
-            trending_products = Product.objects.filter(
-                trending=True
-            ).exclude(
-                product_id=product_id
-            ).order_by('-published_date')[:needed]
-            
-            recommendations['trending'] = ProductSerializer(
-                trending_products, 
-                many=True, 
-                context={'request': request}
-            ).data
-        
-        return Response(recommendations)
+
+        recommendations = {section: [] for section, label in ProductRecommendation.SECTIONS}
+        # One indexed read of the precomputed lists
+        rows = ProductRecommendation.objects.filter(product_id=product_id).values_list('section', 'recommended_id')
+        for section, recommended_id in rows:
+            recommendations[section].append(recommended_id)
+
+        if not any(recommendations[section] for section in ProductRecommendation.HEURISTIC_SECTIONS):
+            # Not refreshed yet: score it in SQL now
+            try:
+                current_product = Product.objects.select_related('category').get(product_id=product_id)
+            except Product.DoesNotExist:
+                return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+            computed = ProductRecommendation.compute(current_product)
+            recommendations.update({section: [pk for pk, score in ranked] for section, ranked in computed.items()})
+
+        return Response({
+            section: self.serialize_products(pks, request) for section, pks in recommendations.items()
+        })
+
+    def serialize_products(self, pks, request):
+        """Cards with ?view=card, cached documents for plain JSON, otherwise the serializer, in pks order."""
+        if not pks:
+            return []
+        if documents_enabled(request):
+            return get_documents(pks, ITEM, request)
+        if wants_cards(request):
+            rows = {row['product_id']: row for row in Product.objects.filter(pk__in=pks).values(*CARD_COLUMNS)}
+            return product_cards([rows[pk] for pk in pks if pk in rows], request)
+        products = ProductSerializer.setup_query(Product.objects.filter(pk__in=pks), request).in_bulk()
+        products = [products[pk] for pk in pks if pk in products]
+        return ProductSerializer(products, many=True, context={'request': request}).data
+
+
+class ResponseCacheStatsView(APIView):
+    """Hit/miss counters of the cached public endpoints, per view."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if not (request.user.is_staff or request.user.is_superuser):
+            return Response({'detail': 'Only staff or admin users can access this.'}, status=status.HTTP_403_FORBIDDEN)
+        return Response(response_cache_stats())
@@ -0,0 +1,20 @@
+import requests
+from django.core.files.base import ContentFile
+from outbox.handlers import Reject, handler
+from .models import User
+
+# (connect, read) seconds
+DOWNLOAD_TIMEOUT = (3.05, 15)
+
+
+@handler('userauth.profile_picture', concurrency=2)
+def download_profile_picture(payload):
+    """Store the Google profile picture of a newly signed up user as their dp."""
+    user = User.objects.filter(pk=payload['user_id']).first()
+    if user is None or user.dp:
+        return
+    response = requests.get(payload['url'], timeout=DOWNLOAD_TIMEOUT)
+    if 400 <= response.status_code < 500:
+        raise Reject(f"HTTP {response.status_code} for {payload['url']}")
+    response.raise_for_status()
+    user.dp.save(payload['file_name'], ContentFile(response.content), save=True)
@@ -1,13 +1,7 @@
-from django.core.mail import EmailMessage
-import os
+from outbox.mail import queue_email
 
 class Util:
   @staticmethod
   def send_email(data):
-    email = EmailMessage(
-      subject=data['subject'],
-      body=data['body'],
-      from_email=os.environ.get('EMAIL_FROM'),
-      to=[data['to_email']]
-    )
-    email.send()
\ No newline at end of file
+    # Queued in the current transaction, the outbox worker does the SMTP round trip
+    queue_email(data['subject'], data['body'], [data['to_email']], html=data.get('html'))
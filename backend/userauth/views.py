@@ -8,6 +8,8 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.authtoken.models import Token
 from django.core.files.base import ContentFile
 import random
+from django.db import transaction
+from outbox.dispatch import publish
 from .utils import Util
 from .models import User
 from .models import Otp
@@ -30,15 +32,15 @@ class SignupView(APIView):
     request.data['email'] = request.data['email'].lower()
     otp = str(generate_otp())
     email = request.data['email'].lower()
-    Otp.objects.create(otp=otp, email=email)
-    print(otp)
     # request.session['otp'] = otp
     data = {
         'subject':'OTP for registration',
         'body': "Your otp is "+otp,
         'to_email':email
       } 
-    Util.send_email(data)
+    with transaction.atomic():
+      Otp.objects.create(otp=otp, email=email)
+      Util.send_email(data)
     return Response({'msg':'sent otp'}, status=status.HTTP_200_OK)
   
 class UserRegistrationView(APIView):
@@ -46,7 +48,6 @@ class UserRegistrationView(APIView):
     request.data['email'] = request.data['email'].lower()
     otpobtained=request.data['otp']
     stored_otp = Otp.objects.get(email=request.data['email']).otp
-    print(stored_otp)
     if stored_otp:
       if otpobtained ==stored_otp:
         serializer = UserRegistrationSerializer(data=request.data)
@@ -216,19 +217,13 @@ class GoogleCallbackView(APIView):
 
             except User.DoesNotExist:
                 # 3. If no user is found, create a new one
-                user = User.objects.create(google_id=google_id, email=email, name=name)
-                if picture_url:
-                  try:
-                      response = requests.get(picture_url, stream=True)
-                      response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
-
-                      file_name = f"{google_id}.jpg"  # Or .png, depending on the image type
-
-                      user.dp.save(file_name, ContentFile(response.content), save=True)
-                  except requests.exceptions.RequestException as e:
-                      print(f"Error downloading profile picture: {e}")
-                  except Exception as e:
-                      print(f"Error saving profile picture: {e}")
+                with transaction.atomic():
+                  user = User.objects.create(google_id=google_id, email=email, name=name)
+                  if picture_url:
+                    # Downloaded by the outbox worker, the redirect doesn't wait for it
+                    publish('userauth.profile_picture', {
+                        'user_id': user.pk, 'url': picture_url, 'file_name': f"{google_id}.jpg",
+                    })
 
             # JWT Token Generation (Uncommented and Corrected):
             refresh = RefreshToken.for_user(user)